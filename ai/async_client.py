@@ -0,0 +1,177 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from .providers import ProviderConfig
+from .cache import TranslationCache, cache_key
+from .health import DEFAULT_HEALTH_TTL, ensure_healthy, record_health
+from .transport import CancelScope
+from .translator import build_prompt, call_ai_api, clean_sql_response, format_schema_section, validation_retry_question
+
+DEFAULT_CONCURRENCY = 8
+
+class TokenBucket:
+    """Token bucket limiting the request rate to one provider."""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RateLimiter:
+    """Per-provider token buckets. Providers without a configured rate are not limited."""
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        self.rates = {name: rate for name, rate in (rates or {}).items() if rate and rate > 0}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, provider_name: str) -> None:
+        rate = self.rates.get(provider_name)
+        if rate is None:
+            return
+        if provider_name not in self._buckets:
+            self._buckets[provider_name] = TokenBucket(rate)
+        await self._buckets[provider_name].acquire()
+
+async def call_ai_api_async(prompt: str, provider_config: ProviderConfig, temperature: float = 0.2,
+                            executor: Optional[ThreadPoolExecutor] = None) -> str:
+    """Async counterpart of call_ai_api, running the pooled HTTP call on an executor.
+
+    Cancelling it (e.g. a wait_for timeout) closes the request's socket, so the call
+    stops and frees its executor thread instead of running on unseen.
+    """
+    loop = asyncio.get_running_loop()
+    scope = CancelScope()
+
+    def call():
+        with scope:
+            return call_ai_api(prompt, provider_config, temperature)
+
+    try:
+        return await loop.run_in_executor(executor, call)
+    except asyncio.CancelledError:
+        scope.cancel()
+        raise
+
+async def generate_sql_async(nl_query: str, schema: Dict, provider_config: ProviderConfig, temperature: float = 0.2,
+                             history: Optional[list] = None, cache: Optional[TranslationCache] = None,
+                             limiter: Optional[RateLimiter] = None, executor: Optional[ThreadPoolExecutor] = None,
+                             compact: bool = False, token_budget: Optional[int] = None,
+                             validator: Optional[Callable[[str], Optional[str]]] = None, retry_invalid: bool = True,
+                             errors: Optional[Dict] = None, examples: Optional[list] = None) -> str:
+    """Async counterpart of generate_sql. Provider health is checked by the caller.
+
+    A validation error left after the optional retry is stored in errors["validation_error"].
+    """
+    loop = asyncio.get_running_loop()
+    key = None
+    if cache is not None:
+        key = cache_key(nl_query, format_schema_section(schema, compact), provider_config, temperature)
+        cached_sql = await loop.run_in_executor(executor, cache.get, key)
+        if cached_sql is not None:
+            return cached_sql
+
+    async def complete(question):
+        prompt = build_prompt(question, schema, history, compact=compact, token_budget=token_budget, examples=examples)
+        if limiter is not None:
+            await limiter.acquire(provider_config.name)
+        try:
+            return await call_ai_api_async(prompt, provider_config, temperature, executor)
+        except Exception as e:
+            record_health(provider_config, False, error=str(e))
+            raise
+
+    sql = await complete(nl_query)
+    error = None
+    if validator is not None:
+        # Validation prepares the query in SQLite, so it stays off the event loop
+        error = await loop.run_in_executor(executor, validator, clean_sql_response(sql))
+        if error and retry_invalid:
+            sql = await complete(validation_retry_question(nl_query, clean_sql_response(sql), error))
+            error = await loop.run_in_executor(executor, validator, clean_sql_response(sql))
+        if errors is not None:
+            errors["validation_error"] = error
+
+    if cache is not None and not error:
+        await loop.run_in_executor(executor, cache.put, key, sql)
+    return sql
+
+async def translate_many(questions: List[str], schema: Dict, provider_config: ProviderConfig, temperature: float = 0.2,
+                         history: Optional[list] = None, cache: Optional[TranslationCache] = None,
+                         concurrency: int = DEFAULT_CONCURRENCY, rate_limits: Optional[Dict[str, float]] = None,
+                         timeout: Optional[float] = None, health_ttl: int = DEFAULT_HEALTH_TTL,
+                         on_result: Optional[Callable[[Dict], None]] = None,
+                         select_schema: Optional[Callable[[str, Dict], Dict]] = None,
+                         compact: bool = False, token_budget: Optional[int] = None,
+                         validator: Optional[Callable[[str], Optional[str]]] = None,
+                         retry_invalid: bool = True,
+                         select_examples: Optional[Callable[[str], list]] = None) -> List[Dict]:
+    """Translate many questions concurrently.
+
+    At most `concurrency` requests are in flight and each provider is held to its
+    rate limit (requests per second). Results come back in input order as dicts
+    with question, sql, error, validation_error and ms; on_result is also called as
+    each one finishes. select_schema(question, schema) can narrow the schema per question
+    and select_examples(question) supplies few-shot examples.
+    Cancelling the returned coroutine cancels all pending translations.
+    """
+    if not provider_config.is_configured:
+        raise ValueError(f"Invalid {provider_config.name} configuration. Please check your API key.")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_limits)
+    loop = asyncio.get_running_loop()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def translate_one(question: str) -> Dict:
+        async with semaphore:
+            start = time.perf_counter()
+            result = {"question": question, "sql": None, "error": None, "validation_error": None}
+            try:
+                question_schema = select_schema(question, schema) if select_schema else schema
+                examples = select_examples(question) if select_examples else None
+                result["sql"] = await asyncio.wait_for(
+                    generate_sql_async(question, question_schema, provider_config, temperature, history, cache,
+                                       limiter, executor, compact, token_budget, validator, retry_invalid, result,
+                                       examples),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                result["error"] = f"Timed out after {timeout} s"
+            except Exception as e:
+                result["error"] = str(e)
+            result["ms"] = round((time.perf_counter() - start) * 1000, 2)
+            if on_result:
+                on_result(result)
+            return result
+
+    tasks = []
+    try:
+        # One health check for the whole batch
+        await loop.run_in_executor(executor, ensure_healthy, provider_config, health_ttl)
+        tasks = [asyncio.ensure_future(translate_one(q)) for q in questions]
+        return await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        # Don't wait for abandoned requests when cancelled
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def translate_many_sync(questions: List[str], schema: Dict, provider_config: ProviderConfig, **kwargs) -> List[Dict]:
+    """Run translate_many from synchronous code such as the CLI."""
+    return asyncio.run(translate_many(questions, schema, provider_config, **kwargs))
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from utils import metrics
+from .providers import ProviderConfig
+
+CACHE_FILE = Path.home() / ".nlsql" / "translation_cache.json"
+DEFAULT_CACHE_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+
+def normalize_question(question: str) -> str:
+    """Normalize case, whitespace and trailing punctuation so trivially different questions share a key.
+
+    Operators, signs and digits are kept as they are: "amount > 100" and "amount < 100"
+    ask for different SQL.
+    """
+    question = " ".join(question.lower().split())
+    return re.sub(r"[\s?.!,;:]+$", "", question)
+
+def schema_hash(schema_section: str) -> str:
+    """Hash the rendered schema section of the prompt."""
+    return hashlib.sha256(schema_section.encode("utf-8")).hexdigest()
+
+def cache_key(question: str, schema_section: str, provider_config: ProviderConfig, temperature: float) -> str:
+    """Build the cache key from the question, schema and provider settings."""
+    parts = [
+        normalize_question(question),
+        schema_hash(schema_section),
+        provider_config.name,
+        provider_config.model,
+        f"{temperature:.3f}"
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class TranslationCache:
+    """On-disk cache of generated SQL with LRU and TTL eviction."""
+    def __init__(self, path: Path = CACHE_FILE, ttl: int = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Misses not yet written; added to the file with the next write
+        self._pending_misses = 0
+
+    def _load(self) -> Dict:
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                data.setdefault("entries", {})
+                data.setdefault("stats", {"hits": 0, "misses": 0})
+                return data
+            except (json.JSONDecodeError, IOError):
+                pass  # A corrupted cache is simply rebuilt
+        return {"entries": {}, "stats": {"hits": 0, "misses": 0}}
+
+    def _save(self, data: Dict) -> None:
+        data["stats"]["misses"] += self._pending_misses
+        self._pending_misses = 0
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except IOError:
+            pass  # Caching is best-effort
+
+    def _evict(self, data: Dict, now: float) -> None:
+        entries = data["entries"]
+        for key in [k for k, e in entries.items() if now - e.get("created_at", 0) >= self.ttl]:
+            del entries[key]
+        if len(entries) > self.max_entries:
+            by_last_used = sorted(entries, key=lambda k: entries[k].get("last_used", 0))
+            for key in by_last_used[:len(entries) - self.max_entries]:
+                del entries[key]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached SQL for a key, or None on a miss."""
+        with self._lock:
+            data = self._load()
+            now = time.time()
+            entry = data["entries"].get(key)
+            if entry and now - entry.get("created_at", 0) < self.ttl:
+                entry["last_used"] = now
+                data["stats"]["hits"] += 1
+                self._save(data)
+                metrics.inc("nlsql_cache_requests", cache="translation", result="hit")
+                return entry["sql"]
+            # Nothing else changed, so the miss is only counted until the next write
+            self._pending_misses += 1
+            metrics.inc("nlsql_cache_requests", cache="translation", result="miss")
+            return None
+
+    def put(self, key: str, sql: str) -> None:
+        """Store generated SQL under a key."""
+        with self._lock:
+            data = self._load()
+            now = time.time()
+            data["entries"][key] = {"sql": sql, "created_at": now, "last_used": now}
+            self._evict(data, now)
+            self._save(data)
+
+    def stats(self) -> Dict:
+        """Return hit/miss counts and the current number of entries."""
+        with self._lock:
+            data = self._load()
+            misses = data["stats"]["misses"] + self._pending_misses
+        hits = data["stats"]["hits"]
+        total = hits + misses
+        return {
+            "entries": len(data["entries"]),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0
+        }
+
+    def clear(self) -> None:
+        """Remove all entries and reset the stats."""
+        with self._lock:
+            self._pending_misses = 0
+            self._save({"entries": {}, "stats": {"hits": 0, "misses": 0}})
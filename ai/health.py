@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from utils import metrics
+from .providers import ProviderConfig
+
+# Persisted per-provider/model health records
+HEALTH_FILE = Path.home() / ".nlsql" / "provider_health.json"
+DEFAULT_HEALTH_TTL = 3600  # seconds a healthy record stays fresh
+HEALTH_REFRESH_INTERVAL = 60  # seconds before a successful call rewrites a healthy record
+
+# Serializes load-modify-save of the health file between threads
+_health_lock = threading.Lock()
+
+PROBE_PROMPT = "Return ONLY the word 'success'"
+
+class ThreadLocalDict(MutableMapping):
+    """Dict with separate contents on each thread.
+
+    Holds the stats of the most recent call on the calling thread, so server worker
+    threads translating at the same time don't clear or overwrite each other's.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def current(self) -> Dict:
+        """The plain dict behind this thread's view."""
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = self._local.values = {}
+        return values
+
+    def use(self, values: Dict) -> None:
+        """Make this thread read and write values, e.g. another thread's current()."""
+        self._local.values = values
+
+    def __getitem__(self, key):
+        return self.current()[key]
+
+    def __setitem__(self, key, value):
+        self.current()[key] = value
+
+    def __delitem__(self, key):
+        del self.current()[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.current())
+
+    def __len__(self) -> int:
+        return len(self.current())
+
+    def clear(self) -> None:
+        self.current().clear()
+
+    def __repr__(self) -> str:
+        return repr(self.current())
+
+# Timings (ms) and token usage of the most recent generate_sql call on each thread
+LAST_TIMINGS = ThreadLocalDict()
+
+# Token usage of the provider call in progress on each thread, for metrics
+_call_usage = threading.local()
+
+def record_usage(prompt_tokens: Optional[int], cached_tokens: Optional[int] = 0, cache_write_tokens: Optional[int] = 0) -> None:
+    """Record the prompt tokens a provider reported, and how many were served from its prompt cache."""
+    LAST_TIMINGS["prompt_tokens"] = prompt_tokens or 0
+    LAST_TIMINGS["cached_tokens"] = cached_tokens or 0
+    LAST_TIMINGS["cache_write_tokens"] = cache_write_tokens or 0
+    _call_usage.tokens = (prompt_tokens or 0, cached_tokens or 0, cache_write_tokens or 0)
+
+def start_call_metrics() -> float:
+    """Mark the start of a provider call on this thread; pass the result to record_call_metrics."""
+    _call_usage.tokens = None
+    return time.perf_counter()
+
+def record_call_metrics(provider_config: ProviderConfig, start: float, failed: bool = False) -> None:
+    """Record latency, errors and token usage of a provider call in the metrics registry."""
+    labels = {"provider": provider_config.name, "model": provider_config.model}
+    metrics.observe("nlsql_llm_request_seconds", time.perf_counter() - start, **labels)
+    if failed:
+        metrics.inc("nlsql_llm_errors", **labels)
+    tokens = getattr(_call_usage, "tokens", None)
+    if tokens:
+        for kind, count in zip(("prompt", "cached", "cache_write"), tokens):
+            if count:
+                metrics.inc("nlsql_llm_tokens", count, type=kind, **labels)
+
+def health_key(provider_config: ProviderConfig) -> str:
+    """Key a health record by provider and model."""
+    return f"{provider_config.name}:{provider_config.model}"
+
+def load_health() -> Dict[str, Dict]:
+    """Load all health records from disk."""
+    if not HEALTH_FILE.exists():
+        return {}
+    try:
+        with open(HEALTH_FILE, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+def save_health(records: Dict[str, Dict]) -> None:
+    """Persist health records to disk."""
+    try:
+        HEALTH_FILE.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed so readers never see a partial file
+        tmp_path = HEALTH_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f, indent=2)
+        os.replace(tmp_path, HEALTH_FILE)
+    except IOError:
+        pass  # Health tracking is best-effort
+
+def get_health(provider_config: ProviderConfig) -> Optional[Dict]:
+    """Get the health record for a provider/model, if any."""
+    return load_health().get(health_key(provider_config))
+
+def is_fresh(record: Optional[Dict], ttl: int = DEFAULT_HEALTH_TTL) -> bool:
+    """A record is fresh if it is healthy and was checked within the TTL."""
+    if not record or not record.get("healthy"):
+        return False
+    return time.time() - record.get("checked_at", 0) < ttl
+
+def record_health(provider_config: ProviderConfig, healthy: bool, error: Optional[str] = None, **timings) -> Dict:
+    """Update the health record for a provider/model.
+    
+    A successful call (not a probe) leaves a healthy record checked within
+    HEALTH_REFRESH_INTERVAL as it is, so steady traffic doesn't rewrite the file on every call.
+    """
+    with _health_lock:
+        records = load_health()
+        record = records.get(health_key(provider_config), {})
+        recently_healthy = record.get("healthy") and time.time() - record.get("checked_at", 0) < HEALTH_REFRESH_INTERVAL
+        if healthy and recently_healthy and set(timings) <= {"last_call_ms"}:
+            return record
+        record.update({
+            "healthy": healthy,
+            "checked_at": time.time(),
+            "error": error
+        })
+        record.update({k: round(v, 2) for k, v in timings.items() if v is not None})
+        records[health_key(provider_config)] = record
+        save_health(records)
+    return record
+
+def probe_provider(provider_config: ProviderConfig) -> float:
+    """Send a minimal request to the provider and return its latency in ms."""
+    from .translator import call_ai_api
+
+    start = time.perf_counter()
+    try:
+        response = call_ai_api(PROBE_PROMPT, provider_config)
+        if 'success' not in response.lower():
+            raise ValueError("unexpected response format")
+    except Exception as e:
+        record_health(provider_config, False, error=str(e))
+        raise ValueError(f"API validation failed: {str(e)}")
+    probe_ms = (time.perf_counter() - start) * 1000
+    record_health(provider_config, True, last_probe_ms=probe_ms)
+    return probe_ms
+
+def ensure_healthy(provider_config: ProviderConfig, ttl: int = DEFAULT_HEALTH_TTL) -> Optional[float]:
+    """Probe the provider only on first use, after a failure or once the record is stale.
+
+    Returns the probe latency in ms, or None if the fresh record allowed skipping it.
+    """
+    if is_fresh(get_health(provider_config), ttl):
+        metrics.inc("nlsql_cache_requests", cache="health", result="hit")
+        return None
+    metrics.inc("nlsql_cache_requests", cache="health", result="miss")
+    return probe_provider(provider_config)
@@ -0,0 +1,271 @@
+import json
+import math
+import os
+import threading
+from typing import Dict, Optional
+
+from db.schema import SCHEMA_CACHE_DIR, schema_fingerprint, table_columns, table_foreign_keys
+from .health import ThreadLocalDict
+
+SAMPLE_ROWS = 3
+HISTORY_ENTRIES = 5
+
+# Sections are cut in this order (sample rows, history entries) until the prompt fits the budget
+TRIM_LEVELS = [(SAMPLE_ROWS, HISTORY_ENTRIES), (1, HISTORY_ENTRIES), (0, HISTORY_ENTRIES), (0, 2), (0, 0)]
+
+# Token counts of the most recent build_prompt call on each thread
+LAST_PROMPT_STATS = ThreadLocalDict()
+
+# Rendered schema sections keyed by (schema fingerprint, mode)
+_rendered_sections: Dict = {}
+_rendered_sections_lock = threading.Lock()
+MAX_RENDERED_SECTIONS = 256
+
+PROMPT_HEADER = "You are a helpful assistant designed to generate accurate SQL queries based on natural language questions about the given database schema. You'll analyze both the database structure and content to produce well-formed, efficient SQL queries."
+
+INSTRUCTIONS = """INSTRUCTIONS:\n1. **Analyze the query**: Understand the user's natural language question about the database and its data.\n2. **Generate the SQL query**: Based on the analysis, generate an accurate SQL query that satisfies the user's request. Follow best practices for SQL query formation, ensuring clarity, performance, and security.\n   - **Match the user's query**: Generate a SQL query that answers the user's question based on the schema and data.\n   - **Adhere to best practices**:\n     - **Use proper indexing**: Ensure queries use indexed columns when applicable to improve performance.\n     - **Avoid SQL injection**: Always prefer parameterized queries where needed (for external use).\n     - **Ensure data integrity**: Respect the database constraints and avoid any operations that could violate them.\n   - **Optimize the query**: Ensure the query is efficient, especially for large datasets. Consider JOIN optimization, using LIMIT, and avoiding subqueries where possible.\n3. If the query is unclear or ambiguous, provide the most likely interpretation based on the schema.\n\nYour response should directly provide the most efficient, accurate SQL query based on the user's natural language query while maintaining clarity and security."""
+
+COMPACT_HEADER = "Write one SQL query answering the question, using only the schema below."
+
+COMPACT_INSTRUCTIONS = "RULES: Prefer indexed columns and JOINs over subqueries, LIMIT large results, respect constraints. If the question is ambiguous, use the most likely interpretation."
+
+class PromptText(str):
+    """A prompt string that remembers where its stable, cacheable prefix ends.
+
+    Everything before prefix_length (instructions, schema and samples) is byte-identical
+    for every question against the same schema, so providers can cache it.
+    """
+    prefix_length = 0
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix_length = len(prefix)
+        return prompt
+
+def split_prompt(prompt: str):
+    """(stable prefix, per-question suffix). Plain strings have no prefix."""
+    prefix_length = getattr(prompt, "prefix_length", 0)
+    return str(prompt)[:prefix_length], str(prompt)[prefix_length:]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and SQL)."""
+    return math.ceil(len(text) / 4)
+
+def format_sample_data(schema, max_rows=SAMPLE_ROWS, compact=False):
+    """Render the sample rows part of the prompt."""
+    if max_rows <= 0 or not isinstance(schema, dict) or not schema.get("sample_data"):
+        return ""
+    sample_tables = []
+    for table_name, table_data in schema["sample_data"].items():
+        if "rows" in table_data and table_data["rows"]:
+            if compact:
+                sample_rows = json.dumps(table_data["rows"][:max_rows], separators=(",", ":"), default=str)
+                sample_tables.append(f"{table_name}: {sample_rows}")
+            else:
+                sample_rows = json.dumps(table_data["rows"][:max_rows], indent=2)
+                sample_tables.append(f"Table: {table_name}\nSample Data:\n{sample_rows}")
+
+    if not sample_tables:
+        return ""
+    if compact:
+        return "\n- Samples:\n" + "\n".join(sample_tables)
+    return "\n\n- Sample Data (for context):\n" + "\n\n".join(sample_tables)
+
+def _group_columns_by_type(columns):
+    """'a,b INT, c TEXT' with consecutive columns of the same type sharing it."""
+    groups = []
+    for name, col_type in columns:
+        if groups and groups[-1][1] == col_type:
+            groups[-1][0].append(name)
+        else:
+            groups.append(([name], col_type))
+    return ", ".join(f"{','.join(names)} {col_type}" for names, col_type in groups)
+
+def format_tables(schema, compact=False):
+    """Render the table, column and relationship part of the prompt."""
+    if not isinstance(schema, dict) or "tables" not in schema:
+        # Fallback for unknown schema format
+        if isinstance(schema, dict):
+            schema = {k: v for k, v in schema.items() if k not in ("fingerprint", "pruned")}
+        schema_str = json.dumps(schema, separators=(",", ":")) if compact else json.dumps(schema, indent=2)
+        return f"\n  - Schema: {schema_str}"
+
+    if not isinstance(schema["tables"], dict):
+        # Simple schema format (just table names)
+        return "\n  - Tables: " + ", ".join(schema["tables"])
+
+    tables = schema["tables"]
+    if compact:
+        lines = [f"{table}({_group_columns_by_type(table_columns(info))})" for table, info in tables.items()]
+        relationships = [f"{table}.{col}->{ref_table}.{ref_col}"
+                         for table, info in tables.items()
+                         for col, ref_table, ref_col in table_foreign_keys(info)]
+        rendered = "\n" + "\n".join(lines)
+        if relationships:
+            rendered += "\n- FKs: " + ", ".join(relationships)
+        return rendered
+
+    tables_info = "\n  - Tables: " + ", ".join(tables.keys())
+    columns_info = ""
+    relationships_info = ""
+
+    all_columns = [f"{table}.{name} ({col_type})"
+                   for table, info in tables.items()
+                   for name, col_type in table_columns(info)]
+    if all_columns:
+        columns_info = "\n  - Columns: \n    - " + "\n    - ".join(all_columns)
+
+    all_relationships = [f"{table}.{col} -> {ref_table}.{ref_col}"
+                         for table, info in tables.items()
+                         for col, ref_table, ref_col in table_foreign_keys(info)]
+    if all_relationships:
+        relationships_info = "\n  - Relationships: \n    - " + "\n    - ".join(all_relationships)
+
+    return f"{tables_info}{columns_info}{relationships_info}"
+
+def _render_sections(schema, compact):
+    sample_rows = sorted({rows for rows, _ in TRIM_LEVELS if rows > 0})
+    return {
+        "tables": format_tables(schema, compact),
+        "samples": {str(rows): format_sample_data(schema, rows, compact) for rows in sample_rows}
+    }
+
+def get_rendered_sections(schema, compact=False):
+    """Table and sample sections for a schema, rendered once per fingerprint.
+
+    Sections are memoized in memory and, for full (unpruned) schemas, persisted
+    next to the schema cache so later processes skip rendering too.
+    """
+    if not isinstance(schema, dict) or not isinstance(schema.get("tables"), dict):
+        return _render_sections(schema, compact)
+
+    fingerprint = schema_fingerprint(schema)
+    mode = "compact" if compact else "verbose"
+    with _rendered_sections_lock:
+        sections = _rendered_sections.get((fingerprint, mode))
+    if sections is not None:
+        return sections
+
+    persist = not schema.get("pruned")
+    sections_file = SCHEMA_CACHE_DIR / f"{fingerprint[:16]}.sections.json"
+    stored = {}
+    if persist and sections_file.exists():
+        try:
+            with open(sections_file, 'r') as f:
+                stored = json.load(f)
+            if stored.get("fingerprint") != fingerprint:
+                stored = {}
+        except (json.JSONDecodeError, IOError):
+            stored = {}
+
+    sections = stored.get(mode)
+    if sections is None:
+        sections = _render_sections(schema, compact)
+        if persist:
+            stored.update({"fingerprint": fingerprint, mode: sections})
+            try:
+                SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                # Swapped in whole, so another process never reads a partial file
+                tmp_path = sections_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(stored, f)
+                os.replace(tmp_path, sections_file)
+            except IOError:
+                pass  # Section caching is best-effort
+
+    with _rendered_sections_lock:
+        if len(_rendered_sections) >= MAX_RENDERED_SECTIONS:
+            # Drop the oldest entry (pruned subsets can be numerous in long-lived processes)
+            _rendered_sections.pop(next(iter(_rendered_sections)), None)
+        _rendered_sections[(fingerprint, mode)] = sections
+    return sections
+
+def _schema_section(sections, compact, sample_rows):
+    sample_data = sections["samples"].get(str(sample_rows), "") if sample_rows > 0 else ""
+    if compact:
+        return f"- Schema:{sections['tables']}{sample_data}"
+    return f"- Schema Information:{sections['tables']}\n{sample_data}"
+
+def format_schema_section(schema, compact=False, sample_rows=SAMPLE_ROWS):
+    """Render the schema, relationship and sample data part of the prompt."""
+    sections = get_rendered_sections(schema, compact)
+    if sample_rows > 0 and str(sample_rows) not in sections["samples"]:
+        sections = dict(sections, samples={str(sample_rows): format_sample_data(schema, sample_rows, compact)})
+    return _schema_section(sections, compact, sample_rows)
+
+def format_history(history=None, max_entries=HISTORY_ENTRIES):
+    """Render the conversation history part of the prompt."""
+    formatted_history = ""
+    if max_entries > 0 and history and isinstance(history, list) and len(history) > 0:
+        history_entries = []
+        for entry in history[-max_entries:]:
+            if isinstance(entry, dict):
+                timestamp = entry.get("timestamp", "").split("T")[0] if "timestamp" in entry else ""
+                question = entry.get("question", "")
+                sql = entry.get("sql", "")
+                if question and sql:
+                    history_entry = f"[{timestamp}] Question: {question}\nSQL: {sql}"
+                    history_entries.append(history_entry)
+
+        if history_entries:
+            formatted_history = "\n\nCONVERSATION HISTORY:\n" + "\n\n".join(history_entries)
+
+    return formatted_history
+
+def format_examples(examples=None):
+    """Render known-good question/SQL pairs as few-shot examples."""
+    if not examples:
+        return ""
+    pairs = [f"Question: {example['question']}\nSQL: {example['sql'].strip()}"
+             for example in examples if example.get("question") and example.get("sql")]
+    if not pairs:
+        return ""
+    return "\n\nEXAMPLES (verified queries on this database):\n" + "\n\n".join(pairs)
+
+def _assemble(nl_query, schema_section, formatted_history, compact, formatted_examples=""):
+    # Static parts first so the prefix is identical for every question on this schema
+    context = f"{formatted_examples}{formatted_history}".lstrip()
+    if compact:
+        prefix = f"{COMPACT_HEADER}\n\n{COMPACT_INSTRUCTIONS}\n\nDATABASE:\n{schema_section.rstrip()}\n\n"
+        suffix = f"{context}\n\nQUESTION:\n{nl_query}\n\nSQL:\n"
+    else:
+        prefix = f"{PROMPT_HEADER}\n\n{INSTRUCTIONS}\n\nDATABASE INFORMATION:\n{schema_section.rstrip()}\n\n"
+        suffix = f"{context}\n\nCURRENT QUERY:\n{nl_query}\n\nSQL:\n"
+    return PromptText(prefix, suffix.lstrip())
+
+def build_prompt(nl_query, schema, history=None, compact=False, token_budget: Optional[int] = None, examples=None,
+                 measure_uncompacted: bool = False):
+    """Construct the prompt including schema context, sample data, and conversation history.
+
+    The instructions and schema form a stable prefix followed by the history and
+    question, so provider prompt caches can reuse the prefix across questions.
+    examples are few-shot question/SQL pairs placed before the history.
+    With a token budget, sample rows and then history entries are trimmed until the
+    prompt fits. Token estimates are recorded in LAST_PROMPT_STATS; the size the prompt
+    would have had without compaction or trimming only with measure_uncompacted, since
+    that means rendering the verbose schema.
+    """
+    sections = get_rendered_sections(schema, compact)
+    formatted_examples = format_examples(examples)
+
+    prompt = None
+    for sample_rows, history_entries in TRIM_LEVELS:
+        schema_section = _schema_section(sections, compact, sample_rows)
+        prompt = _assemble(nl_query, schema_section, format_history(history, history_entries), compact, formatted_examples)
+        if token_budget is None or estimate_tokens(prompt) <= token_budget:
+            break
+
+    tokens = estimate_tokens(prompt)
+    stats = {
+        "tokens": tokens,
+        "prefix_tokens": estimate_tokens(prompt[:prompt.prefix_length]),
+        "budget": token_budget,
+        "over_budget": token_budget is not None and tokens > token_budget,
+        "sample_rows": sample_rows,
+        "history_entries": history_entries
+    }
+    if measure_uncompacted and (compact or token_budget is not None):
+        full_prompt = _assemble(nl_query, format_schema_section(schema), format_history(history), False, formatted_examples)
+        stats["tokens_uncompacted"] = estimate_tokens(full_prompt)
+    LAST_PROMPT_STATS.use(stats)
+    return prompt
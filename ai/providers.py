@@ -8,10 +8,19 @@ class AIProvider(Enum):
     GROK = "grok"
 
 class ProviderConfig:
-    def __init__(self, name: str, api_key: str = "", model: str = ""):
+    def __init__(self, name: str, api_key: str = "", model: str = "", base_url: str = "", priority: int = 0):
         self.name = name
         self.api_key = api_key
         self.model = model
+        self.base_url = base_url
+        self.priority = priority  # lower is preferred when several providers are configured
+
+    @property
+    def api_base_url(self) -> str:
+        """Base URL for API calls, falling back to the provider's public endpoint."""
+        if self.base_url:
+            return self.base_url.rstrip("/")
+        return DEFAULT_BASE_URLS.get(AIProvider(self.name), "")
 
     @property
     def is_configured(self) -> bool:
@@ -21,7 +30,9 @@ class ProviderConfig:
         return {
             "name": self.name,
             "api_key": self.api_key,
-            "model": self.model
+            "model": self.model,
+            "base_url": self.base_url,
+            "priority": self.priority
         }
 
     @classmethod
@@ -29,7 +40,9 @@ class ProviderConfig:
         return cls(
             name=data.get("name", ""),
             api_key=data.get("api_key", ""),
-            model=data.get("model", "")
+            model=data.get("model", ""),
+            base_url=data.get("base_url", ""),
+            priority=int(data.get("priority", 0) or 0)
         )
 
 DEFAULT_MODELS = {
@@ -39,5 +52,22 @@ DEFAULT_MODELS = {
     AIProvider.GROK: "grok-1"
 }
 
+DEFAULT_BASE_URLS = {
+    AIProvider.GEMINI: "https://generativelanguage.googleapis.com",
+    AIProvider.OPENAI: "https://api.openai.com",
+    AIProvider.ANTHROPIC: "https://api.anthropic.com"
+}
+
+# Prompt token budgets, kept well below each provider's context window
+DEFAULT_TOKEN_BUDGETS = {
+    AIProvider.GEMINI: 100000,
+    AIProvider.OPENAI: 6000,
+    AIProvider.ANTHROPIC: 100000,
+    AIProvider.GROK: 6000
+}
+
 def get_default_model(provider: AIProvider) -> str:
-    return DEFAULT_MODELS.get(provider, "")
\ No newline at end of file
+    return DEFAULT_MODELS.get(provider, "")
+
+def get_default_token_budget(provider: AIProvider) -> int:
+    return DEFAULT_TOKEN_BUDGETS.get(provider, 6000)
\ No newline at end of file
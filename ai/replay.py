@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+REPLAY_DIR = Path.home() / ".nlsql" / "replay"
+REPLAY_MODES = ("off", "record", "replay")
+
+def redact_url(url: str) -> str:
+    """Drop API keys passed as query parameters (Gemini) so they never reach disk."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "key"]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+def request_key(url: str, payload: Dict) -> str:
+    """Stable key for a provider request (redacted URL and JSON body)."""
+    canonical = json.dumps([redact_url(url), payload], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def build_response(url: str, status_code: int, body: bytes) -> requests.Response:
+    """A fully read requests.Response that supports json(), text and iter_lines()."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.encoding = "utf-8"
+    response._content = body
+    response._content_consumed = True
+    return response
+
+class Recorder:
+    """Record provider responses to disk, or play them back without network access.
+
+    Each request is stored as one JSON file named after its request key. In replay
+    mode a request that was never recorded is an error, so runs are deterministic.
+    With simulate_latency, replayed responses wait as long as the recorded call took.
+    """
+    def __init__(self, mode: str, directory: Path = REPLAY_DIR, simulate_latency: bool = False):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay mode '{mode}'. Use one of: {', '.join(REPLAY_MODES)}")
+        self.mode = mode
+        self.directory = Path(directory)
+        self.simulate_latency = simulate_latency
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def record(self, url: str, payload: Dict, response: requests.Response, start: float) -> requests.Response:
+        """Save a live response and return an equivalent, fully read one.
+
+        start is the time.perf_counter() value when the request was sent.
+        """
+        body = response.content
+        response.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        entry = {
+            "url": redact_url(url),
+            "request": payload,
+            "status_code": response.status_code,
+            "body": body.decode("utf-8", errors="replace"),
+            "elapsed_ms": round(elapsed_ms, 2)
+        }
+        path = self._path(request_key(url, payload))
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f, indent=2)
+            os.replace(tmp_path, path)
+        return build_response(url, entry["status_code"], body)
+
+    def replay(self, url: str, payload: Dict) -> requests.Response:
+        """Return the recorded response for this request."""
+        path = self._path(request_key(url, payload))
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            raise Exception(f"No recorded response for {redact_url(url)} in {self.directory}. "
+                            "Record one first with replay_mode=record.")
+        if self.simulate_latency:
+            time.sleep(entry.get("elapsed_ms", 0) / 1000)
+        return build_response(url, entry["status_code"], entry["body"].encode("utf-8"))
+
+_recorder: Optional[Recorder] = None
+
+def configure_replay(mode: str = "off", directory: Optional[Path] = None, simulate_latency: bool = False) -> None:
+    """Enable recording or replay of provider calls ("off" disables both)."""
+    global _recorder
+    _recorder = None if mode == "off" else Recorder(mode, directory or REPLAY_DIR, simulate_latency)
+
+def get_recorder() -> Optional[Recorder]:
+    return _recorder
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from db.schema import SCHEMA_CACHE_DIR, schema_fingerprint, table_columns, table_foreign_keys
+
+DEFAULT_PRUNE_TOP_K = 10
+DEFAULT_PRUNE_MIN_TABLES = 50  # smaller schemas are sent whole
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+TABLE_NAME_WEIGHT = 3  # table name terms count more than column terms
+
+# In-memory copies of indexes already built or loaded in this process
+_indexes: Dict[str, Dict] = {}
+
+def tokenize(text: str) -> List[str]:
+    """Split identifiers and questions into lowercase, lightly stemmed terms."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    terms = []
+    for term in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(term) > 4 and term.endswith("ies"):
+            term = term[:-3] + "y"
+        elif len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+def build_index(schema: Dict) -> Dict:
+    """Build a BM25 index with one document per table (name, columns and FK neighbours)."""
+    tables = schema.get("tables", {})
+    neighbours = {table: set() for table in tables}
+    for table, table_info in tables.items():
+        for _, ref, _ in table_foreign_keys(table_info):
+            if ref in neighbours and ref != table:
+                neighbours[table].add(ref)
+                neighbours[ref].add(table)
+
+    docs = {}
+    for table, table_info in tables.items():
+        terms = tokenize(table) * TABLE_NAME_WEIGHT
+        for name, _ in table_columns(table_info):
+            terms.extend(tokenize(name))
+        for neighbour in neighbours[table]:
+            terms.extend(tokenize(neighbour))
+        docs[table] = terms
+
+    postings = {}
+    for table, terms in docs.items():
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, {})[table] = tf
+
+    return {
+        "avgdl": sum(len(t) for t in docs.values()) / len(docs) if docs else 0.0,
+        "doc_len": {table: len(terms) for table, terms in docs.items()},
+        "postings": postings,
+        "neighbours": {table: sorted(n) for table, n in neighbours.items()}
+    }
+
+def get_index(schema: Dict) -> Dict:
+    """Load the index for this schema fingerprint, building and persisting it on first use."""
+    fingerprint = schema_fingerprint(schema)
+    if fingerprint in _indexes:
+        return _indexes[fingerprint]
+
+    index_file = SCHEMA_CACHE_DIR / f"{fingerprint[:16]}.bm25.json"
+    index = None
+    if index_file.exists():
+        try:
+            with open(index_file, 'r') as f:
+                index = json.load(f)
+            if index.get("fingerprint") != fingerprint:
+                index = None
+        except (json.JSONDecodeError, IOError):
+            index = None
+
+    if index is None:
+        index = build_index(schema)
+        index["fingerprint"] = fingerprint
+        try:
+            SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file and rename it, so other processes never read a partial index
+            tmp_file = index_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_file, index_file)
+        except IOError:
+            pass  # Index caching is best-effort
+
+    _indexes[fingerprint] = index
+    return index
+
+def rank_tables(question: str, index: Dict) -> List[Tuple[str, float]]:
+    """Score the tables matching any question term with BM25, best first."""
+    n_docs = len(index["doc_len"])
+    avgdl = index["avgdl"] or 1.0
+    scores = {}
+    for term in set(tokenize(question)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for table, tf in postings.items():
+            doc_len = index["doc_len"][table]
+            score = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len / avgdl))
+            scores[table] = scores.get(table, 0.0) + score
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def prune_schema(question: str, schema: Dict, top_k: int = DEFAULT_PRUNE_TOP_K,
+                 min_tables: int = DEFAULT_PRUNE_MIN_TABLES) -> Tuple[Dict, Dict]:
+    """Keep the top-k tables relevant to the question plus their FK-connected tables.
+
+    Returns the (possibly unchanged) schema and stats about the retrieval.
+    """
+    tables = schema.get("tables") if isinstance(schema, dict) else None
+    stats = {"tables_before": len(tables or []), "tables_after": len(tables or []), "retrieval_ms": 0.0, "pruned": False}
+    if not isinstance(tables, dict) or len(tables) <= min_tables:
+        return schema, stats
+
+    start = time.perf_counter()
+    index = get_index(schema)
+    ranked = rank_tables(question, index)
+    if not ranked:
+        # Nothing matched lexically, let the model see everything
+        stats["retrieval_ms"] = (time.perf_counter() - start) * 1000
+        return schema, stats
+
+    selected = [table for table, _ in ranked[:top_k]]
+    keep = set(selected)
+    for table in selected:
+        keep.update(index["neighbours"].get(table, []))
+
+    pruned = dict(schema)
+    pruned["tables"] = {table: info for table, info in tables.items() if table in keep}
+    # Derive the subset's fingerprint instead of hashing its contents again
+    subset = "\x1f".join(sorted(keep))
+    pruned["fingerprint"] = hashlib.sha256(f"{index['fingerprint']}\x1f{subset}".encode("utf-8")).hexdigest()
+    pruned["pruned"] = True
+    if isinstance(schema.get("sample_data"), dict):
+        pruned["sample_data"] = {table: data for table, data in schema["sample_data"].items() if table in keep}
+
+    stats.update({
+        "tables_after": len(pruned["tables"]),
+        "retrieval_ms": (time.perf_counter() - start) * 1000,
+        "pruned": True
+    })
+    return pruned, stats
@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+from .providers import ProviderConfig
+from .health import LAST_TIMINGS, get_health, health_key, record_health
+from .transport import CallCancelled, CancelScope
+
+LATENCY_FILE = Path.home() / ".nlsql" / "provider_latency.json"
+LATENCY_SAMPLES = 100  # most recent latencies kept per provider/model
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_DELAY_MS = 10000  # used until a provider has latency history
+MIN_HEDGE_DELAY_MS = 200
+FAILURE_COOLDOWN = 60  # seconds a failed provider is tried last
+
+class LatencyTracker:
+    """Persisted recent latencies per provider/model."""
+    def __init__(self, path: Path = LATENCY_FILE, max_samples: int = LATENCY_SAMPLES):
+        self.path = Path(path)
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = self._load()
+
+    def _load(self) -> Dict[str, List[float]]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+
+    def record(self, provider_config: ProviderConfig, latency_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(health_key(provider_config), [])
+            samples.append(round(latency_ms, 2))
+            del samples[:-self.max_samples]
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Written aside and swapped in, so other processes never read a partial file
+                tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._samples, f)
+                os.replace(tmp_path, self.path)
+            except IOError:
+                pass  # Latency tracking is best-effort
+
+    def percentile(self, provider_config: ProviderConfig, p: float) -> Optional[float]:
+        """The p-th percentile latency in ms, or None without history."""
+        with self._lock:
+            samples = sorted(self._samples.get(health_key(provider_config), []))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+class ProviderRouter:
+    """Route requests across several providers with failover and hedging.
+
+    Providers are tried in priority order, faster ones first within a priority, and
+    recently failed ones last. If the first provider has not answered after its
+    p-th percentile latency, a hedged request goes to the next provider and the first
+    answer wins, and the requests still in flight are cancelled. Errors fail over to
+    the next provider straight away.
+    """
+    def __init__(self, provider_configs: List[ProviderConfig], hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 default_hedge_delay_ms: float = DEFAULT_HEDGE_DELAY_MS, hedging: bool = True,
+                 tracker: Optional[LatencyTracker] = None):
+        if not provider_configs:
+            raise ValueError("At least one AI provider must be configured")
+        self.provider_configs = provider_configs
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay_ms = default_hedge_delay_ms
+        self.hedging = hedging
+        self.tracker = tracker or LatencyTracker()
+        self.last_route: Dict = {}
+
+    @property
+    def primary(self) -> ProviderConfig:
+        return self.ordered_providers()[0]
+
+    def ordered_providers(self) -> List[ProviderConfig]:
+        def sort_key(provider_config):
+            record = get_health(provider_config)
+            failing = bool(record) and not record.get("healthy") and time.time() - record.get("checked_at", 0) < FAILURE_COOLDOWN
+            median = self.tracker.percentile(provider_config, 50) or 0.0
+            return (failing, provider_config.priority, median)
+        return sorted(self.provider_configs, key=sort_key)
+
+    def hedge_delay(self, provider_config: ProviderConfig) -> float:
+        """Seconds to wait for a provider before sending a hedged request."""
+        latency = self.tracker.percentile(provider_config, self.hedge_percentile)
+        if latency is None:
+            latency = self.default_hedge_delay_ms
+        return max(latency, MIN_HEDGE_DELAY_MS) / 1000
+
+    def _timed_call(self, provider_config: ProviderConfig, prompt: str, temperature: float,
+                    scope: CancelScope, timings: Dict) -> str:
+        from .translator import call_ai_api
+
+        # Token usage goes to the calling thread's LAST_TIMINGS
+        LAST_TIMINGS.use(timings)
+        start = time.perf_counter()
+        with scope:
+            try:
+                result = call_ai_api(prompt, provider_config, temperature)
+            except Exception as e:
+                if scope.cancelled:
+                    # Lost to another provider; says nothing about this one's health
+                    raise CallCancelled("Call cancelled") from e
+                record_health(provider_config, False, error=str(e))
+                raise
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.tracker.record(provider_config, latency_ms)
+        record_health(provider_config, True, last_call_ms=latency_ms)
+        return result
+
+    def call(self, prompt: str, temperature: float = 0.2) -> str:
+        """Send the prompt and return the first successful answer."""
+        queue = self.ordered_providers()
+        executor = ThreadPoolExecutor(max_workers=len(queue))
+        in_flight = {}
+        errors = []
+        # Kept per call as well, since threads may share the router
+        route = self.last_route = {"attempts": [], "winner": None, "hedged": False}
+        timings = LAST_TIMINGS.current()
+        timings["route"] = route
+
+        def launch():
+            provider_config = queue.pop(0)
+            scope = CancelScope()
+            future = executor.submit(self._timed_call, provider_config, prompt, temperature, scope, timings)
+            in_flight[future] = (provider_config, scope)
+            route["attempts"].append(health_key(provider_config))
+            return provider_config
+
+        try:
+            deadline_provider = launch()
+            while in_flight:
+                timeout = self.hedge_delay(deadline_provider) if self.hedging and queue else None
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Slow answer: hedge with the next provider
+                    deadline_provider = launch()
+                    route["hedged"] = True
+                    continue
+                for future in done:
+                    provider_config, _ = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(f"{provider_config.name}: {str(e)}")
+                        continue
+                    route["winner"] = health_key(provider_config)
+                    return result
+                if queue:
+                    # A request failed: fail over now rather than after the hedge delay
+                    deadline_provider = launch()
+        finally:
+            # Cancel the losers so their threads, and this process, don't wait for them
+            for future, (_, scope) in in_flight.items():
+                future.cancel()
+                scope.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        raise Exception("All AI providers failed: " + "; ".join(errors))
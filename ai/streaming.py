@@ -0,0 +1,261 @@
+import json
+import re
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from .providers import AIProvider, ProviderConfig
+from .transport import post_json
+from .health import LAST_TIMINGS, record_call_metrics, record_usage, start_call_metrics
+from .prompt import split_prompt
+
+FENCE = "```"
+SQL_KEYWORDS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "EXPLAIN", "SHOW", "DESCRIBE", "CREATE", "ALTER", "DROP")
+_SQL_START = re.compile(r"\s*(?:" + "|".join(SQL_KEYWORDS) + ")", re.IGNORECASE)
+ANTHROPIC_VERSION = "2023-06-01"
+DEFAULT_MAX_TOKENS = 1024
+
+class SQLBlockDetector:
+    """Accumulate streamed text and detect when the SQL statement is complete.
+
+    A fenced answer is complete once its code block closes. An unfenced answer
+    is complete at the first semicolon outside a string literal.
+    """
+    def __init__(self):
+        self.text = ""
+        self.end = None
+        # Each chunk is scanned once: where the fence searches and the semicolon scan
+        # stopped, and the string literal open at that point
+        self._opened = None
+        self._fence_from = 0
+        self._close_from = 0
+        self._scanned = 0
+        self._quote = None
+        self._first = None
+        self._started = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk of text and return True once the statement is complete."""
+        if self.end is None:
+            self.text += chunk
+            self.end = self._find_end()
+        return self.end is not None
+
+    @property
+    def result(self) -> str:
+        """The text received so far, cut off after the end of the statement.
+
+        Prose before a completed code block is dropped.
+        """
+        if self.end is None:
+            return self.text
+        return self.text[self._opened if self._opened is not None else 0:self.end]
+
+    @property
+    def sql_started(self) -> bool:
+        """Whether any SQL text (beyond an opening fence) has arrived."""
+        if not self._started:
+            if self._opened is not None:
+                newline = self.text.find("\n", self._opened + len(FENCE))
+                self._started = newline != -1 and self.text[newline + 1:].strip() != ""
+            else:
+                self._started = _SQL_START.match(self.text) is not None
+        return self._started
+
+    def _find_end(self) -> Optional[int]:
+        text = self.text
+        if self._opened is None:
+            # Back up in case a fence was split across chunks
+            opened = text.find(FENCE, max(0, self._fence_from - len(FENCE) + 1))
+            self._fence_from = len(text)
+            if opened != -1:
+                self._opened = opened
+                self._close_from = opened + len(FENCE)
+        if self._opened is not None:
+            closed = text.find(FENCE, max(self._opened + len(FENCE), self._close_from - len(FENCE) + 1))
+            self._close_from = len(text)
+            return closed + len(FENCE) if closed != -1 else None
+        if self._first is None:
+            stripped = text.lstrip()
+            self._first = stripped[0] if stripped else None
+        if self._first == "`":
+            return None  # Possibly a fence split across chunks
+        quote = self._quote
+        for i in range(self._scanned, len(text)):
+            char = text[i]
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+            elif char == ";":
+                return i + 1
+        self._scanned, self._quote = len(text), quote
+        return None
+
+def iter_sse_data(response) -> Iterator[str]:
+    """Yield the data payloads of a server-sent event stream as they arrive."""
+    for line in response.iter_lines(chunk_size=None):
+        if not line:
+            continue
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        if line.startswith("data:"):
+            yield line[5:].strip()
+
+def anthropic_content(prompt: str):
+    """Message content marking the stable prompt prefix as cacheable (cache_control)."""
+    prefix, suffix = split_prompt(prompt)
+    if not prefix:
+        return prompt
+    return [
+        {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": suffix}
+    ]
+
+def record_anthropic_usage(usage: Dict) -> None:
+    # Anthropic's input_tokens excludes the tokens read from or written to the cache
+    cached = usage.get("cache_read_input_tokens") or 0
+    written = usage.get("cache_creation_input_tokens") or 0
+    record_usage((usage.get("input_tokens") or 0) + cached + written, cached, written)
+
+def record_openai_usage(usage: Dict) -> None:
+    details = usage.get("prompt_tokens_details") or {}
+    record_usage(usage.get("prompt_tokens"), details.get("cached_tokens"))
+
+def record_gemini_usage(usage: Dict) -> None:
+    record_usage(usage.get("promptTokenCount"), usage.get("cachedContentTokenCount"))
+
+def _openai_request(prompt: str, provider_config: ProviderConfig, temperature: float) -> Tuple[str, Dict, Dict]:
+    headers = {
+        "Authorization": f"Bearer {provider_config.api_key}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": provider_config.model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "stream": True,
+        # Usage, including cached prompt tokens, comes in a last chunk without choices
+        "stream_options": {"include_usage": True}
+    }
+    return f"{provider_config.api_base_url}/v1/chat/completions", data, headers
+
+def _openai_deltas(response) -> Iterator[str]:
+    for data in iter_sse_data(response):
+        if data == "[DONE]":
+            break
+        event = json.loads(data)
+        if event.get("usage"):
+            record_openai_usage(event["usage"])
+        choices = event.get("choices") or [{}]
+        yield choices[0].get("delta", {}).get("content") or ""
+
+def _anthropic_request(prompt: str, provider_config: ProviderConfig, temperature: float) -> Tuple[str, Dict, Dict]:
+    headers = {
+        "x-api-key": provider_config.api_key,
+        "anthropic-version": ANTHROPIC_VERSION,
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": provider_config.model,
+        "messages": [{"role": "user", "content": anthropic_content(prompt)}],
+        "temperature": temperature,
+        "max_tokens": DEFAULT_MAX_TOKENS,
+        "stream": True
+    }
+    return f"{provider_config.api_base_url}/v1/messages", data, headers
+
+def _anthropic_deltas(response) -> Iterator[str]:
+    for data in iter_sse_data(response):
+        event = json.loads(data)
+        event_type = event.get("type")
+        if event_type == "message_start":
+            record_anthropic_usage(event.get("message", {}).get("usage") or {})
+        elif event_type == "content_block_delta":
+            yield event.get("delta", {}).get("text") or ""
+        elif event_type == "message_stop":
+            break
+        elif event_type == "error":
+            raise Exception(f"Anthropic API error: {event.get('error')}")
+
+def _gemini_request(prompt: str, provider_config: ProviderConfig, temperature: float) -> Tuple[str, Dict, Dict]:
+    headers = {"Content-Type": "application/json"}
+    data = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"temperature": temperature}
+    }
+    url = (f"{provider_config.api_base_url}/v1beta/models/{provider_config.model}"
+           f":streamGenerateContent?alt=sse&key={provider_config.api_key}")
+    return url, data, headers
+
+def _gemini_deltas(response) -> Iterator[str]:
+    for data in iter_sse_data(response):
+        event = json.loads(data)
+        if event.get("usageMetadata"):
+            record_gemini_usage(event["usageMetadata"])
+        candidates = event.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        yield "".join(part.get("text", "") for part in parts)
+
+STREAMING_PROVIDERS = {
+    AIProvider.OPENAI: ("OpenAI", _openai_request, _openai_deltas),
+    AIProvider.ANTHROPIC: ("Anthropic", _anthropic_request, _anthropic_deltas),
+    AIProvider.GEMINI: ("Gemini", _gemini_request, _gemini_deltas)
+}
+
+def stream_ai_api(prompt: str, provider_config: ProviderConfig, temperature: float = 0.2,
+                  on_text: Optional[Callable[[str], None]] = None) -> str:
+    """Stream a completion and return as soon as the SQL statement is complete.
+
+    on_text is called with each new piece of text as it arrives. Time to the first
+    token, time to the first SQL token and the total stream time are recorded in
+    LAST_TIMINGS.
+    """
+    provider = AIProvider(provider_config.name)
+    if provider not in STREAMING_PROVIDERS:
+        raise NotImplementedError(f"Streaming is not supported for {provider.value}")
+    label, build_request, iter_deltas = STREAMING_PROVIDERS[provider]
+
+    start = start_call_metrics()
+    url, data, headers = build_request(prompt, provider_config, temperature)
+    detector = SQLBlockDetector()
+    emitted = 0
+    stream_ms = None
+    failed = True
+    try:
+        response = post_json(url, data, headers=headers, stream=True)
+    except Exception:
+        record_call_metrics(provider_config, start, failed=True)
+        raise
+    try:
+        if response.status_code != 200:
+            raise Exception(f"{label} API error: {response.status_code} {response.text}")
+        for chunk in iter_deltas(response):
+            if detector.end is not None:
+                # Read on only for trailing events without text, such as OpenAI's usage
+                # chunk; any more text means the model went on after the statement
+                if chunk.strip():
+                    break
+                continue
+            if not chunk:
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            LAST_TIMINGS.setdefault("first_token_ms", elapsed)
+            complete = detector.feed(chunk)
+            if detector.sql_started:
+                LAST_TIMINGS.setdefault("first_sql_ms", elapsed)
+            if on_text:
+                visible = detector.text[:detector.end] if complete else detector.text
+                if len(visible) > emitted:
+                    on_text(visible[emitted:])
+                    emitted = len(visible)
+            if complete:
+                stream_ms = (time.perf_counter() - start) * 1000
+        failed = False
+    finally:
+        # Closing early abandons the rest of the generation
+        response.close()
+        record_call_metrics(provider_config, start, failed=failed)
+
+    if stream_ms is None:
+        stream_ms = (time.perf_counter() - start) * 1000
+    LAST_TIMINGS["stream_ms"] = stream_ms
+    return detector.result.strip()
@@ -1,46 +1,68 @@
-import requests
 import json
-from typing import Dict, Optional
+import time
+from typing import Callable, Dict, Optional
 from .providers import AIProvider, ProviderConfig
+from .transport import call_cancelled, post_json
+from .cache import TranslationCache, cache_key
+from .streaming import (ANTHROPIC_VERSION, DEFAULT_MAX_TOKENS, anthropic_content, record_anthropic_usage,
+                        record_gemini_usage, record_openai_usage, stream_ai_api)
+from .router import ProviderRouter
+from .health import (DEFAULT_HEALTH_TTL, LAST_TIMINGS, ensure_healthy, record_call_metrics, record_health,
+                     start_call_metrics)
+from utils.tracing import span
+from .prompt import LAST_PROMPT_STATS, build_prompt, format_schema_section
 
 def call_ai_api(prompt: str, provider_config: ProviderConfig, temperature: float = 0.2) -> str:
     """Call the appropriate AI API based on the provider configuration."""
+    start = start_call_metrics()
+    try:
+        sql = _call_provider_api(prompt, provider_config, temperature)
+    except Exception:
+        # A hedged request the router cancelled didn't fail
+        record_call_metrics(provider_config, start, failed=not call_cancelled())
+        raise
+    record_call_metrics(provider_config, start)
+    return sql
+
+def _call_provider_api(prompt: str, provider_config: ProviderConfig, temperature: float) -> str:
     provider = AIProvider(provider_config.name)
     api_key = provider_config.api_key
     model = provider_config.model
+    base_url = provider_config.api_base_url
 
     if provider == AIProvider.GEMINI:
-        return call_gemini_api(prompt, api_key, model, temperature)
+        return call_gemini_api(prompt, api_key, model, temperature, base_url)
     elif provider == AIProvider.OPENAI:
-        return call_openai_api(prompt, api_key, model, temperature)
+        return call_openai_api(prompt, api_key, model, temperature, base_url)
     elif provider == AIProvider.ANTHROPIC:
-        return call_anthropic_api(prompt, api_key, model, temperature)
+        return call_anthropic_api(prompt, api_key, model, temperature, base_url)
     elif provider == AIProvider.GROK:
         return call_grok_api(prompt, api_key, model, temperature)
     else:
         raise ValueError(f"Unsupported AI provider: {provider}")
 
-def call_gemini_api(prompt: str, api_key: str, model: str, temperature: float) -> str:
+def call_gemini_api(prompt: str, api_key: str, model: str, temperature: float, base_url: str = "https://generativelanguage.googleapis.com") -> str:
     headers = {"Content-Type": "application/json"}
     data = {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {"temperature": temperature}
     }
-    response = requests.post(
-        f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}",
-        headers=headers,
-        data=json.dumps(data)
+    response = post_json(
+        f"{base_url}/v1beta/models/{model}:generateContent?key={api_key}",
+        data,
+        headers=headers
     )
     if response.status_code != 200:
         raise Exception(f"Gemini API error: {response.status_code} {response.text}")
     result = response.json()
+    record_gemini_usage(result.get('usageMetadata') or {})
     try:
         sql = result.get('candidates', [])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
     except (IndexError, KeyError) as e:
         raise Exception(f"API response format error: {str(e)}. Full response: {json.dumps(result, indent=2)}")
     return sql.strip()
 
-def call_openai_api(prompt: str, api_key: str, model: str, temperature: float) -> str:
+def call_openai_api(prompt: str, api_key: str, model: str, temperature: float, base_url: str = "https://api.openai.com") -> str:
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -50,34 +72,39 @@ def call_openai_api(prompt: str, api_key: str, model: str, temperature: float) -
         "messages": [{"role": "user", "content": prompt}],
         "temperature": temperature
     }
-    response = requests.post(
-        "https://api.openai.com/v1/chat/completions",
-        headers=headers,
-        json=data
+    response = post_json(
+        f"{base_url}/v1/chat/completions",
+        data,
+        headers=headers
     )
     if response.status_code != 200:
         raise Exception(f"OpenAI API error: {response.status_code} {response.text}")
     result = response.json()
+    # Prompts over 1024 tokens get automatic prefix caching; usage reports the cached part
+    record_openai_usage(result.get('usage') or {})
     return result.get('choices', [{}])[0].get('message', {}).get('content', '').strip()
 
-def call_anthropic_api(prompt: str, api_key: str, model: str, temperature: float) -> str:
+def call_anthropic_api(prompt: str, api_key: str, model: str, temperature: float, base_url: str = "https://api.anthropic.com") -> str:
     headers = {
         "x-api-key": api_key,
+        "anthropic-version": ANTHROPIC_VERSION,
         "Content-Type": "application/json"
     }
     data = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": temperature
+        "messages": [{"role": "user", "content": anthropic_content(prompt)}],
+        "temperature": temperature,
+        "max_tokens": DEFAULT_MAX_TOKENS
     }
-    response = requests.post(
-        "https://api.anthropic.com/v1/messages",
-        headers=headers,
-        json=data
+    response = post_json(
+        f"{base_url}/v1/messages",
+        data,
+        headers=headers
     )
     if response.status_code != 200:
         raise Exception(f"Anthropic API error: {response.status_code} {response.text}")
     result = response.json()
+    record_anthropic_usage(result.get('usage') or {})
     return result.get('content', [{}])[0].get('text', '').strip()
 
 def call_grok_api(prompt: str, api_key: str, model: str, temperature: float) -> str:
@@ -85,118 +112,131 @@ def call_grok_api(prompt: str, api_key: str, model: str, temperature: float) ->
     # Update this when Grok API becomes publicly available
     raise NotImplementedError("Grok API support coming soon")
 
-def generate_sql(nl_query: str, schema: Dict, provider_config: ProviderConfig, temperature: float = 0.2, history: Optional[Dict | list] = None) -> str:
-    """Send a prompt to the selected AI provider to translate NL to SQL."""
+def generate_sql(nl_query: str, schema: Dict, provider_config: ProviderConfig, temperature: float = 0.2,
+                 history: Optional[Dict | list] = None, *, health_ttl: int = DEFAULT_HEALTH_TTL,
+                 cache: Optional[TranslationCache] = None, stream: bool = False,
+                 on_text: Optional[Callable[[str], None]] = None, compact: bool = False,
+                 token_budget: Optional[int] = None, router: Optional[ProviderRouter] = None,
+                 validator: Optional[Callable[[str], Optional[str]]] = None, retry_invalid: bool = True,
+                 examples: Optional[list] = None, prompt_stats: bool = False) -> str:
+    """Send a prompt to the selected AI provider to translate NL to SQL.
+
+    With stream=True the response is consumed incrementally, on_text receives the text
+    as it arrives, and the call returns as soon as the SQL statement is complete.
+    compact and token_budget are passed on to build_prompt. A router spreads
+    non-streaming calls over several providers with failover and hedging.
+    validator(sql) returns an error message for SQL that can't run; with retry_invalid
+    the model is asked once more with that error. Invalid SQL is returned but not cached,
+    and the remaining error is left in LAST_TIMINGS["validation_error"]. examples are
+    few-shot question/SQL pairs for the prompt. prompt_stats also records the uncompacted
+    prompt size in LAST_PROMPT_STATS, for display.
+    """
     if not provider_config.is_configured:
         raise ValueError(f"Invalid {provider_config.name} configuration. Please check your API key.")
     
-    # Validate API connectivity
-    try:
-        test_response = call_ai_api("Return ONLY the word 'success'", provider_config)
-        if 'success' not in test_response.lower():
-            raise ValueError("API validation failed - unexpected response format")
-    except Exception as test_error:
-        raise ValueError(f"API validation failed: {str(test_error)}")
+    LAST_TIMINGS.clear()
+    LAST_PROMPT_STATS.clear()
+    start = time.perf_counter()
+
+    # Serve repeated questions against an unchanged schema from the cache
+    key = None
+    if cache is not None:
+        with span("cache.lookup"):
+            key = cache_key(nl_query, format_schema_section(schema, compact), provider_config, temperature)
+            cached_sql = cache.get(key)
+        LAST_TIMINGS["cache_hit"] = cached_sql is not None
+        if cached_sql is not None:
+            LAST_TIMINGS["total_ms"] = (time.perf_counter() - start) * 1000
+            return cached_sql
+
+    use_router = router is not None and not stream
+
+    # Validate API connectivity only if there is no fresh health record
+    # (a router fails over to the next provider instead)
+    with span("llm.health_check"):
+        probe_ms = None if use_router else ensure_healthy(provider_config, ttl=health_ttl)
+    LAST_TIMINGS["probe_ms"] = probe_ms or 0.0
+    LAST_TIMINGS["probed"] = probe_ms is not None
 
     # Build prompt with schema and history context
-    prompt = build_prompt(nl_query, schema, history)
-    return call_ai_api(prompt, provider_config, temperature)
-
-def build_prompt(nl_query, schema, history=None):
-    """Construct the prompt for Gemini API including schema context, sample data, and conversation history."""
-    # Format schema information
-    tables_info = ""
-    columns_info = ""
-    relationships_info = ""
-    constraints_info = ""
-    indexes_info = ""
-    sample_data = ""
-    
-    # Format sample data if available
-    if isinstance(schema, dict) and "sample_data" in schema and schema["sample_data"]:
-        sample_tables = []
-        for table_name, table_data in schema["sample_data"].items():
-            if "rows" in table_data and table_data["rows"]:
-                sample_rows = json.dumps(table_data["rows"][:3], indent=2)  # Limit to 3 rows
-                sample_tables.append(f"Table: {table_name}\nSample Data:\n{sample_rows}")
-        
-        if sample_tables:
-            sample_data = "\n\n- Sample Data (for context):\n" + "\n\n".join(sample_tables)
-    
-    # Extract and format schema details
-    if isinstance(schema, dict) and "tables" in schema:
-        if isinstance(schema["tables"], dict):
-            # Detailed schema format
-            tables_info = "\n  - Tables: " + ", ".join(schema["tables"].keys())
-            
-            # Extract column information
-            all_columns = []
-            for table, table_info in schema["tables"].items():
-                if "columns" in table_info and table_info["columns"]:
-                    table_columns = []
-                    for col in table_info["columns"]:
-                        if isinstance(col, dict) and "Field" in col:
-                            # MySQL format
-                            col_info = f"{table}.{col['Field']} ({col.get('Type', 'unknown')})"
-                            table_columns.append(col_info)
-                        elif isinstance(col, dict) and "column_name" in col:
-                            # PostgreSQL format
-                            col_info = f"{table}.{col['column_name']} ({col.get('data_type', 'unknown')})"
-                            table_columns.append(col_info)
-                        elif isinstance(col, tuple) and len(col) >= 3:
-                            # SQLite format
-                            col_info = f"{table}.{col[1]} ({col[2]})"
-                            table_columns.append(col_info)
-                    all_columns.extend(table_columns)
-            
-            if all_columns:
-                columns_info = "\n  - Columns: \n    - " + "\n    - ".join(all_columns)
-            
-            # Extract relationship information
-            all_relationships = []
-            for table, table_info in schema["tables"].items():
-                if "foreign_keys" in table_info and table_info["foreign_keys"]:
-                    for fk in table_info["foreign_keys"]:
-                        if isinstance(fk, dict) and "COLUMN_NAME" in fk and "REFERENCED_TABLE_NAME" in fk:
-                            # MySQL format
-                            rel_info = f"{table}.{fk['COLUMN_NAME']} -> {fk['REFERENCED_TABLE_NAME']}.{fk['REFERENCED_COLUMN_NAME']}"
-                            all_relationships.append(rel_info)
-                        elif isinstance(fk, dict) and "column_name" in fk and "referenced_table" in fk:
-                            # PostgreSQL format
-                            rel_info = f"{table}.{fk['column_name']} -> {fk['referenced_table']}.{fk['referenced_column']}"
-                            all_relationships.append(rel_info)
-                        elif isinstance(fk, tuple) and len(fk) >= 4:
-                            # SQLite format
-                            rel_info = f"{table}.{fk[3]} -> {fk[2]}.{fk[4]}"
-                            all_relationships.append(rel_info)
-            
-            if all_relationships:
-                relationships_info = "\n  - Relationships: \n    - " + "\n    - ".join(all_relationships)
+    with span("prompt.build"):
+        prompt = build_prompt(nl_query, schema, history, compact=compact, token_budget=token_budget, examples=examples,
+                              measure_uncompacted=prompt_stats)
+
+    def complete(prompt, stream):
+        call_start = time.perf_counter()
+        if use_router:
+            # The router records health, latency and its route per provider
+            with span("llm.call", provider="router", stream=False):
+                sql = router.call(prompt, temperature)
         else:
-            # Simple schema format (just table names)
-            tables_info = "\n  - Tables: " + ", ".join(schema["tables"])
-    else:
-        # Fallback for unknown schema format
-        schema_str = json.dumps(schema, indent=2)
-        tables_info = f"\n  - Schema: {schema_str}"
-    
-    # Format conversation history if provided
-    formatted_history = ""
-    if history and isinstance(history, list) and len(history) > 0:
-        history_entries = []
-        for entry in history[-5:]:  # Use last 5 entries at most
-            if isinstance(entry, dict):
-                timestamp = entry.get("timestamp", "").split("T")[0] if "timestamp" in entry else ""
-                question = entry.get("question", "")
-                sql = entry.get("sql", "")
-                if question and sql:
-                    history_entry = f"[{timestamp}] Question: {question}\nSQL: {sql}"
-                    history_entries.append(history_entry)
-        
-        if history_entries:
-            formatted_history = "\n\nCONVERSATION HISTORY:\n" + "\n\n".join(history_entries)
-    
-    # Build the comprehensive prompt
-    prompt = f"""You are a helpful assistant designed to generate accurate SQL queries based on natural language questions about the given database schema. You'll analyze both the database structure and content to produce well-formed, efficient SQL queries.\n\nCURRENT QUERY:\n{nl_query}\n\nDATABASE INFORMATION:\n- Schema Information:{tables_info}{columns_info}{relationships_info}{constraints_info}{indexes_info}\n{sample_data}{formatted_history}\n\nINSTRUCTIONS:\n1. **Analyze the query**: Understand the user's natural language question about the database and its data.\n2. **Generate the SQL query**: Based on the analysis, generate an accurate SQL query that satisfies the user's request. Follow best practices for SQL query formation, ensuring clarity, performance, and security.\n   - **Match the user's query**: Generate a SQL query that answers the user's question based on the schema and data.\n   - **Adhere to best practices**:\n     - **Use proper indexing**: Ensure queries use indexed columns when applicable to improve performance.\n     - **Avoid SQL injection**: Always prefer parameterized queries where needed (for external use).\n     - **Ensure data integrity**: Respect the database constraints and avoid any operations that could violate them.\n   - **Optimize the query**: Ensure the query is efficient, especially for large datasets. Consider JOIN optimization, using LIMIT, and avoiding subqueries where possible.\n3. If the query is unclear or ambiguous, provide the most likely interpretation based on the schema.\n\nYour response should directly provide the most efficient, accurate SQL query based on the user's natural language query while maintaining clarity and security.\n\nSQL:\n"""
+            try:
+                with span("llm.call", provider=provider_config.name, model=provider_config.model, stream=stream):
+                    if stream:
+                        sql = stream_ai_api(prompt, provider_config, temperature, on_text=on_text)
+                    else:
+                        sql = call_ai_api(prompt, provider_config, temperature)
+            except Exception as e:
+                # Force a probe on the next call
+                record_health(provider_config, False, error=str(e))
+                raise
+        call_ms = (time.perf_counter() - call_start) * 1000
+
+        # A successful translation also proves the provider is healthy
+        if not use_router:
+            record_health(provider_config, True, last_call_ms=call_ms)
+        LAST_TIMINGS["llm_ms"] = LAST_TIMINGS.get("llm_ms", 0.0) + call_ms
+        return sql
+
+    sql = complete(prompt, stream)
+
+    # Check the SQL locally before anyone runs it
+    error = None
+    if validator is not None:
+        def check(sql):
+            validate_start = time.perf_counter()
+            with span("sql.validate"):
+                error = validator(clean_sql_response(sql))
+            LAST_TIMINGS["validate_ms"] = LAST_TIMINGS.get("validate_ms", 0.0) + (time.perf_counter() - validate_start) * 1000
+            return error
+
+        error = check(sql)
+        if error and retry_invalid:
+            LAST_TIMINGS["first_validation_error"] = error
+            retry_question = validation_retry_question(nl_query, clean_sql_response(sql), error)
+            with span("prompt.build", retry=True):
+                retry_prompt = build_prompt(retry_question, schema, history, compact=compact,
+                                            token_budget=token_budget, examples=examples)
+            sql = complete(retry_prompt, False)
+            LAST_TIMINGS["retried"] = True
+            error = check(sql)
+        LAST_TIMINGS["validation_error"] = error
+
+    if cache is not None and not error:
+        with span("cache.store"):
+            cache.put(key, sql)
+    LAST_TIMINGS["total_ms"] = (time.perf_counter() - start) * 1000
+    return sql
+
+def validation_retry_question(nl_query: str, sql: str, error: str) -> str:
+    """The question re-sent after a generated query failed validation."""
+    return (f"{nl_query}\n\nA previous answer to this question failed validation against the schema.\n"
+            f"Previous SQL: {sql}\nError: {error}\nReturn a corrected query.")
+
+def clean_sql_response(sql_query: str) -> str:
+    """Strip markdown code fences from a model response."""
+    if sql_query.startswith('```'):
+        # Extract SQL from markdown code block
+        parts = sql_query.split('```')
+        if len(parts) >= 3:  # Has opening and closing markers
+            sql_content = parts[1]
+            # Remove language identifier if present
+            if sql_content.startswith('sql'):
+                sql_query = sql_content[3:].strip()
+            else:
+                sql_query = sql_content.strip()
+        else:  # Only has opening marker
+            sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
     
-    return prompt
\ No newline at end of file
+    # Ensure no markdown markers remain
+    return sql_query.replace('```', '').strip()
@@ -0,0 +1,200 @@
+import gzip
+import json
+import socket
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .replay import get_recorder
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 120.0
+
+class TransportConfig:
+    """Connection pool and timeout settings shared by all provider calls."""
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, gzip: bool = False):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.gzip = gzip
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+class CallCancelled(Exception):
+    """A provider call was cancelled by another thread (see CancelScope)."""
+
+_scope = threading.local()
+
+class CancelScope:
+    """Makes the provider calls a thread sends inside `with scope:` cancellable from other threads.
+
+    cancel() shuts down the sockets those requests use, so a call blocked waiting for the
+    response fails straight away instead of running until the read timeout. Scopes created
+    while another is current, like the router's per-provider scopes, are cancelled with it.
+    """
+    def __init__(self):
+        self.cancelled = False
+        self._connections = []
+        self._children = []
+        self._lock = threading.Lock()
+        self._outer = None
+        parent = getattr(_scope, "current", None)
+        if parent is not None:
+            parent._adopt(self)
+
+    def __enter__(self):
+        self._outer = getattr(_scope, "current", None)
+        _scope.current = self
+        return self
+
+    def __exit__(self, *exc):
+        # Nested scopes hand the thread back to the enclosing one
+        _scope.current = self._outer
+        self._outer = None
+        with self._lock:
+            self._connections.clear()
+            self._children.clear()
+
+    def _adopt(self, child: "CancelScope") -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._children.append(child)
+                return
+        child.cancel()
+
+    def _track(self, connection) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise CallCancelled("Call cancelled")
+            self._connections.append(connection)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+            children = list(self._children)
+        for child in children:
+            child.cancel()
+        for connection in connections:
+            sock = connection.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass  # Already closed
+
+def call_cancelled() -> bool:
+    """Whether this thread's provider call was cancelled (see CancelScope)."""
+    scope = getattr(_scope, "current", None)
+    return scope is not None and scope.cancelled
+
+class _CancellableRequests:
+    """Registers each request with the sending thread's CancelScope, if any."""
+    def request(self, *args, **kwargs):
+        scope = getattr(_scope, "current", None)
+        if scope is not None:
+            scope._track(self)
+        return super().request(*args, **kwargs)
+
+    def connect(self):
+        super().connect()
+        # Connected after cancel() looked for sockets to shut down
+        scope = getattr(_scope, "current", None)
+        if scope is not None and scope.cancelled:
+            self.close()
+            raise CallCancelled("Call cancelled")
+
+class _HTTPConnection(_CancellableRequests, HTTPConnection):
+    pass
+
+class _HTTPSConnection(_CancellableRequests, HTTPSConnection):
+    pass
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+class _CancellableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPConnectionPool, "https": _HTTPSConnectionPool}
+
+_config = TransportConfig()
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+def configure_transport(config: TransportConfig) -> None:
+    """Replace the transport settings.
+
+    Existing sessions are closed so new pool sizes apply. Applying the same settings
+    again keeps them, along with their open connections.
+    """
+    global _config
+    with _lock:
+        if vars(config) == vars(_config):
+            return
+        _config = config
+        _close_sessions_locked()
+
+def get_transport_config() -> TransportConfig:
+    return _config
+
+def get_session(url: str) -> requests.Session:
+    """Get the keep-alive session for the URL's host, creating it on first use."""
+    parts = urlsplit(url)
+    host_key = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(host_key)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(host_key)
+        if session is None:
+            session = requests.Session()
+            adapter = _CancellableAdapter(pool_connections=1, pool_maxsize=_config.pool_size)
+            session.mount(f"{parts.scheme}://", adapter)
+            _sessions[host_key] = session
+        return session
+
+def post_json(url: str, payload: Dict, headers: Optional[Dict] = None, stream: bool = False) -> requests.Response:
+    """POST a JSON payload over the pooled session for the URL's host.
+
+    With stream=True the body is left unread so it can be consumed incrementally.
+    When recording or replaying (see ai.replay) the body is always read in full.
+    """
+    recorder = get_recorder()
+    if recorder is not None and recorder.mode == "replay":
+        return recorder.replay(url, payload)
+
+    headers = dict(headers or {})
+    headers.setdefault("Content-Type", "application/json")
+    body = json.dumps(payload).encode("utf-8")
+    if _config.gzip:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    start = time.perf_counter()
+    response = get_session(url).post(url, data=body, headers=headers, timeout=_config.timeout, stream=stream)
+    if recorder is not None and recorder.mode == "record":
+        return recorder.record(url, payload, response, start)
+    return response
+
+def _close_sessions_locked() -> None:
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+
+def close_sessions() -> None:
+    """Close all pooled sessions."""
+    with _lock:
+        _close_sessions_locked()
@@ -3,14 +3,17 @@ import os
 import json
 import getpass
 import datetime
+import functools
+import time
 from typing import Optional, List
 from pathlib import Path
 import typer
 
-from utils.config import setup_config, load_config
-from db.connector import MySQLConnector
-from ai.translator import generate_sql
-from utils.formatting import print_sql, print_result
+from utils.config import setup_config, load_config, get_setting, load_profile, save_profile
+from db.connector import MySQLConnector, DEFAULT_MAX_ROWS
+from ai.translator import generate_sql, clean_sql_response
+from utils.formatting import print_sql, print_result, print_stream
+from utils.tracing import span
 import enum
 from InquirerPy import inquirer
 
@@ -29,6 +32,8 @@ profile_app = typer.Typer(help="Create and manage database connection profiles")
 connect_app = typer.Typer(help="Connect to a database using the active profile")
 list_app = typer.Typer(help="List available databases and tables in current connection")
 saved_app = typer.Typer(help="Save and manage frequently used queries")
+cache_app = typer.Typer(help="Inspect and clear the translation cache")
+daemon_app = typer.Typer(help="Run a background process that keeps nlsql warm between commands")
 
 # Register subcommands
 app.add_typer(config_app, name="config")
@@ -36,13 +41,14 @@ app.add_typer(profile_app, name="profile")
 app.add_typer(connect_app, name="connect")
 app.add_typer(list_app, name="list")
 app.add_typer(saved_app, name="saved")
+app.add_typer(cache_app, name="cache")
+app.add_typer(daemon_app, name="daemon")
 
 # Constants
 CONFIG_DIR = Path.home() / ".nlsql"
 CONFIG_FILE = CONFIG_DIR / "config.json"
 PROFILES_DIR = CONFIG_DIR / "profiles"
 SAVED_QUERIES_DIR = CONFIG_DIR / "saved_queries"
-HISTORY_FILE = CONFIG_DIR / "history.json"
 ACTIVE_PROFILE_FILE = CONFIG_DIR / "active_profile.txt"
 
 # Ensure directories exist
@@ -61,26 +67,14 @@ def set_active_profile(profile_name):
     """Set the active profile"""
     ACTIVE_PROFILE_FILE.write_text(profile_name)
 
-def load_profile(profile_name):
-    """Load a profile by name"""
-    profile_path = PROFILES_DIR / f"{profile_name}.json"
-    if not profile_path.exists():
-        typer.echo(f"Profile '{profile_name}' not found")
-        raise typer.Exit(1)
-    with open(profile_path, 'r') as f:
-        return json.load(f)
-
-def save_profile(profile_name, profile_data):
-    """Save a profile"""
-    profile_path = PROFILES_DIR / f"{profile_name}.json"
-    with open(profile_path, 'w') as f:
-        json.dump(profile_data, f, indent=2)
-
-def save_query(name, query):
+def save_query(name, query, question=None):
     """Save a query for later use"""
     query_path = SAVED_QUERIES_DIR / f"{name}.sql"
     with open(query_path, 'w') as f:
         f.write(query)
+    # Saved queries double as few-shot examples
+    from utils.examples import get_example_index
+    get_example_index().add_saved(name, query, question)
 
 def load_query(name):
     """Load a saved query"""
@@ -91,25 +85,112 @@ def load_query(name):
     with open(query_path, 'r') as f:
         return f.read()
 
-def add_to_history(question, sql_query, executed=False):
+def configure_db_pools(config):
+    """Apply the database connection pool settings from the global config"""
+    from db.pool import (configure_pools, PoolConfig, DEFAULT_POOL_SIZE, DEFAULT_MAX_IDLE,
+                         DEFAULT_PING_AFTER, DEFAULT_POOL_TIMEOUT)
+    configure_pools(PoolConfig(
+        size=get_setting(config, "db_pool_size", DEFAULT_POOL_SIZE),
+        max_idle=get_setting(config, "db_pool_max_idle_seconds", DEFAULT_MAX_IDLE),
+        ping_after=get_setting(config, "db_pool_ping_after_seconds", DEFAULT_PING_AFTER),
+        timeout=get_setting(config, "db_pool_timeout", DEFAULT_POOL_TIMEOUT)
+    ))
+
+def configure_ai_transport(config):
+    """Apply the HTTP pool, timeout and record/replay settings from the global config"""
+    from ai.transport import (configure_transport, TransportConfig, DEFAULT_POOL_SIZE,
+                              DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+    from ai.replay import configure_replay, REPLAY_DIR
+    configure_transport(TransportConfig(
+        pool_size=get_setting(config, "http_pool_size", DEFAULT_POOL_SIZE),
+        connect_timeout=get_setting(config, "http_connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=get_setting(config, "http_read_timeout", DEFAULT_READ_TIMEOUT),
+        gzip=get_setting(config, "http_gzip", False)
+    ))
+    replay_mode = os.environ.get("NLSQL_REPLAY_MODE", get_setting(config, "replay_mode", "off"))
+    try:
+        configure_replay(
+            replay_mode,
+            Path(get_setting(config, "replay_dir", str(REPLAY_DIR))).expanduser(),
+            simulate_latency=get_setting(config, "replay_latency", False)
+        )
+    except ValueError as e:
+        typer.echo(f"Error: {str(e)}")
+        raise typer.Exit(1)
+
+def load_translation_cache(config):
+    """Create the translation cache using the global config settings"""
+    from ai.cache import TranslationCache, DEFAULT_CACHE_TTL, DEFAULT_CACHE_MAX_ENTRIES
+    return TranslationCache(
+        ttl=get_setting(config, "cache_ttl_seconds", DEFAULT_CACHE_TTL),
+        max_entries=get_setting(config, "cache_max_entries", DEFAULT_CACHE_MAX_ENTRIES)
+    )
+
+def load_prompt_settings(config, provider_config):
+    """Prompt compaction and token budget settings for the configured provider"""
+    from ai.providers import AIProvider, get_default_token_budget
+    try:
+        default_budget = get_default_token_budget(AIProvider(provider_config.name))
+    except ValueError:
+        default_budget = get_default_token_budget(None)
+    budget = get_setting(config, "prompt_token_budget", default_budget)
+    return {
+        "compact": get_setting(config, "compact_prompt", True),
+        "token_budget": get_setting(config, f"{provider_config.name}_token_budget", budget)
+    }
+
+def load_sql_validator(config, schema, profile):
+    """Pre-flight validation settings: (validator or None, retry on failure)"""
+    if not get_setting(config, "validate_sql", True):
+        return None, False
+    from db.shadow import validate_sql
+    db_type = profile.get("type", "MySQL")
+    return (lambda sql: validate_sql(sql, schema, db_type)), get_setting(config, "validate_retry", True)
+
+def load_provider_router(config):
+    """Router over the providers listed in 'ai_providers', or None with fewer than two"""
+    providers = config.get("ai_providers")
+    if not isinstance(providers, list) or len(providers) < 2:
+        return None
+    from ai.providers import ProviderConfig
+    from ai.router import ProviderRouter, DEFAULT_HEDGE_PERCENTILE, DEFAULT_HEDGE_DELAY_MS
+    provider_configs = [ProviderConfig.from_dict(p) for p in providers]
+    provider_configs = [p for p in provider_configs if p.is_configured]
+    if not provider_configs:
+        return None
+    return ProviderRouter(
+        provider_configs,
+        hedge_percentile=get_setting(config, "hedge_percentile", float(DEFAULT_HEDGE_PERCENTILE)),
+        default_hedge_delay_ms=get_setting(config, "hedge_default_delay_ms", float(DEFAULT_HEDGE_DELAY_MS)),
+        hedging=get_setting(config, "hedging", True)
+    )
+
+def profiled(command):
+    """Let a command be run with --profile (phase breakdown) and --trace FILE (Chrome trace).
+
+    The command must declare both options (as profile_phases and trace); tracing is only
+    set up when one is given.
+    """
+    @functools.wraps(command)
+    def wrapper(*args, **kwargs):
+        if not kwargs.get("profile_phases") and not kwargs.get("trace"):
+            return command(*args, **kwargs)
+        from utils.tracing import start_tracing, stop_tracing, format_breakdown
+        start_tracing()
+        try:
+            return command(*args, **kwargs)
+        finally:
+            tracer = stop_tracing()
+            typer.echo("\n" + format_breakdown(tracer))
+            if kwargs.get("trace"):
+                tracer.write_chrome_trace(kwargs["trace"])
+                typer.echo(f"Trace written to {kwargs['trace']} (open in ui.perfetto.dev or chrome://tracing)")
+    return wrapper
+
+def add_to_history(question, sql_query, executed=False, schema=None):
     """Add a query to history"""
-    history = []
-    if HISTORY_FILE.exists():
-        with open(HISTORY_FILE, 'r') as f:
-            try:
-                history = json.load(f)
-            except json.JSONDecodeError:
-                history = []
-    
-    history.append({
-        "timestamp": datetime.datetime.now().isoformat(),
-        "question": question,
-        "sql": sql_query,
-        "executed": executed
-    })
-    
-    with open(HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=2)
+    from utils.history import HistoryStore
+    HistoryStore().add(question, sql_query, executed=executed, schema=schema)
 
 # Setup command
 @app.command()
@@ -296,6 +377,28 @@ def config_unset_interactive():
     
     typer.echo(f"Config value '{key}' removed successfully")
 
+def prompt_choice(text, choices, default):
+    """Prompt until the answer is one of choices"""
+    while True:
+        value = typer.prompt(f"{text} ({', '.join(choices)})", default=default).lower()
+        if value in choices:
+            return value
+        typer.echo(f"Choose one of: {', '.join(choices)}")
+
+def prompt_sqlite_settings(current):
+    """Ask for a SQLite profile's open mode and PRAGMAs, suggesting the read-heavy tuning"""
+    from db.connector import SQLITE_MODES, SQLITE_PRAGMAS, SQLITE_TUNING
+    
+    defaults = {"sqlite_mode": "readwrite", **SQLITE_TUNING, **current}
+    return {
+        "sqlite_mode": prompt_choice("Open mode, immutable for snapshots nothing writes to", SQLITE_MODES,
+                                     defaults["sqlite_mode"]),
+        "journal_mode": prompt_choice("Journal mode", sorted(SQLITE_PRAGMAS["journal_mode"]), defaults["journal_mode"]),
+        "mmap_size": typer.prompt("Memory-mapped bytes (0 to disable)", default=defaults["mmap_size"], type=int),
+        "cache_size": typer.prompt("Page cache size (pages, or KiB if negative)", default=defaults["cache_size"], type=int),
+        "temp_store": prompt_choice("Temporary storage", sorted(SQLITE_PRAGMAS["temp_store"]), defaults["temp_store"]),
+    }
+
 # Profile commands
 @profile_app.command("create")
 def profile_create(name: str):
@@ -329,6 +432,9 @@ def profile_create(name: str):
     username = typer.prompt("Username")
     password = typer.prompt("Password", hide_input=True)
     connection_options = typer.prompt("Connection options", default="")
+    max_rows = typer.prompt("Maximum rows fetched per query", default=DEFAULT_MAX_ROWS, type=int)
+    statement_timeout = typer.prompt("Statement timeout in seconds (0 for none)", default=0.0, type=float)
+    sqlite_settings = prompt_sqlite_settings({}) if db_type == DatabaseType.SQLITE.value else {}
     
     profile = {
         "type": db_type,
@@ -337,7 +443,10 @@ def profile_create(name: str):
         "database": database,
         "username": username,
         "password": password,
-        "options": connection_options
+        "options": connection_options,
+        "max_rows": max_rows,
+        "statement_timeout": statement_timeout,
+        **sqlite_settings
     }
     
     save_profile(name, profile)
@@ -395,6 +504,12 @@ def profile_edit(name: str):
     if new_password:
         profile["password"] = new_password
     profile["options"] = typer.prompt("Connection options", default=profile.get("options", ""))
+    profile["max_rows"] = typer.prompt("Maximum rows fetched per query",
+                                       default=profile.get("max_rows", DEFAULT_MAX_ROWS), type=int)
+    profile["statement_timeout"] = typer.prompt("Statement timeout in seconds (0 for none)",
+                                                default=profile.get("statement_timeout", 0.0), type=float)
+    if profile["type"] == DatabaseType.SQLITE.value:
+        profile.update(prompt_sqlite_settings(profile))
 
     save_profile(name, profile)
     typer.echo(f"Profile '{name}' updated successfully!")
@@ -512,17 +627,14 @@ def list_tables(db: Optional[str] = None):
         connector = DBConnector.create_connector(profile)
         connector.connect()
         
-        # If a specific database was provided, use it
+        # If a specific database was provided, connect to it instead
+        # (rather than USE, which would follow the connection back into the pool)
         if db and profile['type'] in ["MySQL", "PostgreSQL"]:
-            if profile['type'] == "MySQL":
-                connector.execute_query(f"USE {db}")
-            elif profile['type'] == "PostgreSQL":
-                # Close current connection and reconnect to the specified database
-                connector.close()
-                profile_copy = profile.copy()
-                profile_copy['database'] = db
-                connector = DBConnector.create_connector(profile_copy)
-                connector.connect()
+            connector.close()
+            profile_copy = profile.copy()
+            profile_copy['database'] = db
+            connector = DBConnector.create_connector(profile_copy)
+            connector.connect()
         
         # Get tables based on database type
         if profile['type'] == "MySQL":
@@ -641,6 +753,7 @@ def cache_schema():
 # Query command
 @app.command(name="query", help="Generate SQL from natural language and optionally execute it")
 @app.command(name="q", hidden=True)  # Short alias
+@profiled
 def query(
     text: str = typer.Argument(..., help="Your question in plain English (e.g. 'show recent orders')"),
     edit: bool = typer.Option(False, "--edit", "-e", help="Open the generated SQL in editor for modifications"),
@@ -649,25 +762,34 @@ def query(
     format: str = typer.Option("table", "--format", "-f", help="Output format: table, json, or csv"),
     export: Optional[Path] = typer.Option(None, "--export", help="Save query results to a file"),
     explain: bool = typer.Option(False, "--explain", help="Show the database execution plan for the query"),
-    limit: Optional[int] = typer.Option(None, "--limit", "-l", help="Limit the number of results returned")
+    limit: Optional[int] = typer.Option(None, "--limit", "-l", help="Limit the number of results returned"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Cancel the query after this many seconds (0 for no limit)"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the translation cache and always call the AI provider"),
+    stream: bool = typer.Option(False, "--stream", help="Stream the SQL to the terminal as it is generated"),
+    profile_phases: bool = typer.Option(False, "--profile", help="Time each phase and print a breakdown"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help="Also write a Chrome/Perfetto trace JSON file")
 ):
     """Generate and optionally run query"""
-    active_profile = get_active_profile()
-    if not active_profile:
-        typer.echo("No active profile. Create one with: nlsql profile create <name>")
-        return
-    
-    profile = load_profile(active_profile)
-    
-    # Load config for API key
-    config = {}
-    if CONFIG_FILE.exists():
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
+    with span("config.load"):
+        active_profile = get_active_profile()
+        if not active_profile:
+            typer.echo("No active profile. Create one with: nlsql profile create <name>")
+            return
+        
+        profile = load_profile(active_profile)
+        
+        # Load config for API key
+        config = {}
+        if CONFIG_FILE.exists():
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
     
     # Get AI provider configuration
     provider_config = None
-    if 'ai_provider' in config:
+    router = load_provider_router(config)
+    if router:
+        provider_config = router.primary
+    elif 'ai_provider' in config:
         from ai.providers import ProviderConfig
         provider_config = ProviderConfig.from_dict(config['ai_provider'])
     
@@ -675,6 +797,8 @@ def query(
         typer.echo("AI provider not configured. Run 'nlsql setup' or configure your AI provider.")
         return
     
+    configure_ai_transport(config)
+    
     # Generate SQL
     typer.echo(f"Translating: {text}")
     
@@ -683,44 +807,92 @@ def query(
     try:
         from db.connector import DBConnector
         connector = DBConnector.create_connector(profile)
-        connector.connect()
-        schema = connector.get_schema()
+        with span("db.connect"):
+            connector.connect()
+        with span("schema.load"):
+            schema = connector.get_schema()
         connector.close()
     except Exception as e:
         typer.echo(f"Warning: Could not fetch schema from database: {str(e)}")
         # Fallback to placeholder schema
         schema = {"tables": ["users", "orders", "products"]}
     
-    # Get conversation history for context
-    history = []
-    if HISTORY_FILE.exists():
-        try:
-            with open(HISTORY_FILE, 'r') as f:
-                history = json.load(f)
-        except json.JSONDecodeError:
-            pass
+    # Narrow very large schemas down to the tables relevant to the question
+    from ai.retrieval import prune_schema, DEFAULT_PRUNE_TOP_K, DEFAULT_PRUNE_MIN_TABLES
+    from ai.translator import format_schema_section
+    full_schema = schema
+    with span("schema.prune"):
+        schema, prune_stats = prune_schema(
+            text, schema,
+            top_k=get_setting(config, "schema_prune_top_k", DEFAULT_PRUNE_TOP_K),
+            min_tables=get_setting(config, "schema_prune_min_tables", DEFAULT_PRUNE_MIN_TABLES)
+        )
+    if prune_stats["pruned"]:
+        before = len(format_schema_section(full_schema))
+        after = len(format_schema_section(schema))
+        typer.echo(f"Schema pruned to {prune_stats['tables_after']} of {prune_stats['tables_before']} tables "
+                   f"in {prune_stats['retrieval_ms']:.1f} ms (schema prompt {before:,} -> {after:,} chars)")
+    
+    # Get the past questions most relevant to this one for context
+    from utils.history import HistoryStore, DEFAULT_CONTEXT_ENTRIES
+    from db.schema import schema_fingerprint
+    schema_id = schema_fingerprint(full_schema)
+    with span("history.load"):
+        history = HistoryStore().relevant(
+            text, limit=get_setting(config, "history_context_entries", DEFAULT_CONTEXT_ENTRIES), schema=schema_id
+        )
+    
+    # Few-shot examples from saved queries and successfully executed questions
+    from utils.examples import get_example_index, DEFAULT_EXAMPLES
+    with span("examples.load"):
+        example_index = get_example_index()
+        example_index.sync()
+        examples = example_index.similar(text, limit=get_setting(config, "few_shot_examples", DEFAULT_EXAMPLES), schema=schema_id)
     
     # Generate SQL with enhanced context
-    sql_query = generate_sql(text, schema, provider_config, history=history)
+    from ai.health import DEFAULT_HEALTH_TTL
+    health_ttl = get_setting(config, "health_ttl_seconds", DEFAULT_HEALTH_TTL)
+    cache = None if no_cache else load_translation_cache(config)
+    streamed = []
+    def echo_stream(chunk):
+        streamed.append(chunk)
+        typer.echo(chunk, nl=False)
+    validator, retry_invalid = load_sql_validator(config, full_schema, profile)
+    with span("translate"):
+        sql_query = generate_sql(text, schema, provider_config, history=history, health_ttl=health_ttl, cache=cache,
+                                 stream=stream, on_text=echo_stream, router=router, validator=validator,
+                                 retry_invalid=retry_invalid, examples=examples, prompt_stats=True,
+                                 **load_prompt_settings(config, provider_config))
+    from ai.health import LAST_TIMINGS
+    route = LAST_TIMINGS.get("route")
+    if route and (route["hedged"] or len(route["attempts"]) > 1):
+        typer.echo(f"Answered by {route['winner']} (tried {', '.join(route['attempts'])})")
+    from ai.prompt import LAST_PROMPT_STATS
+    if LAST_PROMPT_STATS.get("tokens_uncompacted"):
+        typer.echo(f"Prompt: ~{LAST_PROMPT_STATS['tokens']:,} tokens (~{LAST_PROMPT_STATS['tokens_uncompacted']:,} uncompacted)")
+        if LAST_PROMPT_STATS["over_budget"]:
+            typer.echo(f"Warning: prompt exceeds the {LAST_PROMPT_STATS['budget']:,} token budget even without samples and history")
+    if LAST_TIMINGS.get("cached_tokens") or LAST_TIMINGS.get("cache_write_tokens"):
+        typer.echo(f"Provider prompt cache: {LAST_TIMINGS['cached_tokens']:,} of {LAST_TIMINGS['prompt_tokens']:,} "
+                   f"prompt tokens read from cache, {LAST_TIMINGS['cache_write_tokens']:,} written")
+    if streamed:
+        typer.echo("")
+        typer.echo(f"First SQL token after {LAST_TIMINGS.get('first_sql_ms', 0):.0f} ms, "
+                   f"complete after {LAST_TIMINGS.get('stream_ms', 0):.0f} ms")
     
     # Clean up SQL query by removing markdown formatting if present
-    if sql_query.startswith('```'):
-        # Extract SQL from markdown code block
-        parts = sql_query.split('```')
-        if len(parts) >= 3:  # Has opening and closing markers
-            sql_content = parts[1]
-            # Remove language identifier if present
-            if sql_content.startswith('sql'):
-                sql_query = sql_content[3:].strip()
-            else:
-                sql_query = sql_content.strip()
-        else:  # Only has opening marker
-            sql_query = sql_query.replace('```sql', '').replace('```', '').strip()
+    with span("sql.cleanup"):
+        sql_query = clean_sql_response(sql_query)
     
-    # Ensure no markdown markers remain
-    sql_query = sql_query.replace('```', '').strip()
+    if LAST_TIMINGS.get("retried"):
+        typer.echo(f"Generated SQL failed validation ({LAST_TIMINGS['first_validation_error']}), asked for a correction")
     
-    print_sql(sql_query)
+    # Streamed SQL has already been shown
+    if not streamed or LAST_TIMINGS.get("retried"):
+        print_sql(sql_query)
+    validation_error = LAST_TIMINGS.get("validation_error")
+    if validation_error:
+        typer.echo(f"Warning: SQL failed validation against the cached schema: {validation_error}")
     
     # Edit if requested
     if edit:
@@ -738,11 +910,18 @@ def query(
     
     # Save if requested
     if save:
-        save_query(save, sql_query)
+        save_query(save, sql_query, question=text)
         typer.echo(f"Query saved as '{save}'")
     
     # Add to history
-    add_to_history(text, sql_query, executed=execute)
+    with span("history.save"):
+        add_to_history(text, sql_query, executed=execute, schema=schema_id)
+    
+    # Don't send SQL that is known to be broken unless asked to
+    if edit and validator is not None:
+        validation_error = validator(sql_query)
+    if execute and validation_error and not typer.confirm("Execute anyway?", default=False):
+        execute = False
     
     # Execute if requested
     if execute:
@@ -751,68 +930,366 @@ def query(
             # Connect to the database using the active profile
             from db.connector import DBConnector
             connector = DBConnector.create_connector(profile)
-            connector.connect()
-            
-            # Add EXPLAIN if requested
-            query_to_execute = f"EXPLAIN {sql_query}" if explain else sql_query
+            if timeout is not None:
+                connector.statement_timeout = timeout or None
+            with span("db.connect"):
+                connector.connect()
             
-            # Add LIMIT if specified
-            if limit is not None and "LIMIT" not in sql_query.upper():
-                query_to_execute = f"{query_to_execute} LIMIT {limit}"
+            # Rows to show: --limit (default 100, or everything up to max_rows when
+            # exporting, as in run), never more than the profile's max_rows.
+            # One more is fetched to tell whether the result was cut off.
+            rows_shown = min(limit or (connector.max_rows if export else 100), connector.max_rows)
+            if limit and limit > rows_shown:
+                typer.echo(f"Limited to {rows_shown} rows by the profile's max_rows")
             
-            # Execute the query and get actual results
+            # Show the plan of the query as it will run, with the limit pushed down
             if explain:
                 typer.echo("Execution plan:")
-                result, columns = connector.execute_query(query_to_execute)
+                result, columns = connector.execute_query(f"EXPLAIN {connector.limit_query(sql_query, rows_shown + 1)}")
                 print_result(result, columns, output_format=format)
-                # Execute the actual query after showing the plan
-                query_to_execute = sql_query
-                if limit is not None and "LIMIT" not in sql_query.upper():
-                    query_to_execute = f"{query_to_execute} LIMIT {limit}"
-                result, columns = connector.execute_query(query_to_execute)
-            else:
-                result, columns = connector.execute_query(query_to_execute)
             
-            connector.close()
+            # Execute the actual query, stopping once the shown rows have arrived
+            batches, columns = connector.execute_stream(sql_query, max_rows=rows_shown + 1)
         except Exception as e:
             typer.echo(f"Error executing query: {str(e)}")
             raise typer.Exit(1)
         
-        if export:
-            typer.echo(f"Exporting results to {export}")
-            # This would export the results to a file
-        else:
-            print_result(result, columns, output_format=format)
+        try:
+            print_stream(batches, columns, output_format=format, limit=rows_shown, file=export)
+        except Exception as e:
+            typer.echo(f"Error fetching results: {str(e)}")
+            raise typer.Exit(1)
+        finally:
+            connector.close()
+        
+        # SQL whose rows all arrived becomes a few-shot example for similar questions
+        example_index.add_executed(text, sql_query, schema=schema_id)
 
 # Run command
 @app.command()
-def run(name: str):
-    """Run a saved query"""
-    sql_query = load_query(name)
-    typer.echo(f"Running saved query '{name}':")
-    print_sql(sql_query)
-    
-    try:
-        # Connect to the database and execute the query
-        from db.connector import DBConnector
-        
+@profiled
+def run(
+    names: List[str] = typer.Argument(..., help="Saved query names or glob patterns (e.g. 'daily_*')"),
+    parallel: int = typer.Option(1, "--parallel", "-p", help="Run up to this many queries at once"),
+    format: str = typer.Option("table", "--format", "-f", help="Output format: table, json, or csv"),
+    export: Optional[Path] = typer.Option(None, "--export", help="Save results to a file (a directory when running several queries)"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Cancel the query after this many seconds (0 for no limit)"),
+    profile_phases: bool = typer.Option(False, "--profile", help="Time each phase and print a breakdown"),
+    trace: Optional[Path] = typer.Option(None, "--trace", help="Also write a Chrome/Perfetto trace JSON file")
+):
+    """Run one or more saved queries"""
+    with span("config.load"):
+        names = resolve_saved_queries(names)
+        queries = {name: load_query(name) for name in names}
         active_profile = get_active_profile()
         if not active_profile:
             typer.echo("No active profile. Create one with: nlsql profile create <name>")
             return
-        
         profile = load_profile(active_profile)
+    
+    if len(names) == 1:
+        name = names[0]
+        typer.echo(f"Running saved query '{name}':")
+        print_sql(queries[name])
+        result = run_saved_query(name, queries[name], profile, timeout, export is not None)
+        if result["error"]:
+            typer.echo(f"Error executing query: {result['error']}")
+            raise typer.Exit(1)
+        print_result(result["rows"], result["columns"], output_format=format, limit=result["limit"], file=export)
+        return
+    
+    run_saved_queries(queries, profile, parallel, format, export, timeout)
+
+def resolve_saved_queries(patterns):
+    """Saved query names matching the given names and glob patterns, in order and without duplicates"""
+    import fnmatch
+    saved = sorted(p.stem for p in SAVED_QUERIES_DIR.glob("*.sql"))
+    names = []
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = fnmatch.filter(saved, pattern)
+            if not matches:
+                typer.echo(f"No saved queries match '{pattern}'")
+                raise typer.Exit(1)
+        else:
+            matches = [pattern]
+        names.extend(name for name in matches if name not in names)
+    return names
+
+def run_saved_query(name, sql_query, profile, timeout=None, export=False):
+    """Execute a saved query on a pooled connection, keeping the rows that will be shown or exported"""
+    from db.connector import DBConnector, collect_rows
+    
+    start = time.perf_counter()
+    result = {"name": name, "rows": [], "columns": [], "truncated": False, "error": None, "limit": 0}
+    with span("run.query", query=name):
+        connector = DBConnector.create_connector(profile)
+        if timeout is not None:
+            connector.statement_timeout = timeout or None
+        try:
+            with span("db.connect"):
+                connector.connect()
+            # Exports get everything up to the profile's max_rows, the terminal the first 100
+            result["limit"] = connector.max_rows if export else min(100, connector.max_rows)
+            batches, result["columns"] = connector.execute_stream(sql_query, max_rows=result["limit"] + 1)
+            # Keep the row past the limit so print_result shows its "Showing first" notice
+            result["rows"], _ = collect_rows(batches, result["limit"] + 1)
+            result["truncated"] = len(result["rows"]) > result["limit"]
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            connector.close()
+    result["ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+def row_count(result):
+    """Rows a saved query returned, with a + when there were more than were kept"""
+    if result["truncated"]:
+        return f"{result['limit']}+"
+    return str(len(result["rows"]))
+
+def run_saved_queries(queries, profile, parallel, output_format, export, timeout):
+    """Run several saved queries concurrently, printing each one's results as it finishes"""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from db.connector import cancel_running
+    
+    if export:
+        export.mkdir(parents=True, exist_ok=True)
+    extension = {"json": ".json"}.get(output_format, ".csv")
+    workers = max(1, min(parallel, len(queries)))
+    typer.echo(f"Running {len(queries)} saved queries, {workers} at a time")
+    
+    start = time.perf_counter()
+    results = []
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(run_saved_query, name, sql_query, profile, timeout, export is not None)
+                   for name, sql_query in queries.items()]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["error"]:
+                typer.echo(f"\n== {result['name']}: failed after {result['ms']:.1f} ms: {result['error']}")
+                continue
+            typer.echo(f"\n== {result['name']} ({row_count(result)} rows, {result['ms']:.1f} ms)")
+            print_result(result["rows"], result["columns"], output_format=output_format, limit=result["limit"],
+                         file=export / f"{result['name']}{extension}" if export else None)
+    except KeyboardInterrupt:
+        # Stop the statements still running rather than waiting for them
+        executor.shutdown(wait=False, cancel_futures=True)
+        cancel_running()
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    
+    # Timing summary, slowest first
+    typer.echo(f"\n{'Query':<30} {'Status':<8} {'Rows':>8} {'ms':>10}")
+    for result in sorted(results, key=lambda r: -r["ms"]):
+        status = "error" if result["error"] else "ok"
+        typer.echo(f"{result['name']:<30} {status:<8} {row_count(result):>8} {result['ms']:>10.1f}")
+    failed = sum(1 for result in results if result["error"])
+    query_ms = sum(result["ms"] for result in results)
+    typer.echo(f"{len(results) - failed}/{len(results)} succeeded in {wall_ms:.1f} ms "
+               f"({query_ms:.1f} ms of query time across {workers} workers)")
+    if failed:
+        raise typer.Exit(1)
+
+# Batch command
+def read_batch_questions(source):
+    """Read questions from a file or stdin, one per line or as JSONL records"""
+    import sys
+    if str(source) == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r') as f:
+            lines = f.read().splitlines()
+    
+    records = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = {"id": line_number, "question": line}
+        if line.startswith("{"):
+            try:
+                data = json.loads(line)
+                record["id"] = data.get("id", line_number)
+                record["question"] = data.get("question") or data.get("text", "")
+            except json.JSONDecodeError:
+                pass
+        if record["question"]:
+            records.append(record)
+    return records
+
+@app.command()
+def batch(
+    source: str = typer.Argument(..., help="File with one question per line or JSONL records, or '-' for stdin"),
+    execute: bool = typer.Option(False, "--execute", "-x", help="Also execute each generated query against the active profile"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write JSONL results to a file instead of stdout"),
+    workers: int = typer.Option(8, "--workers", "-w", help="Maximum number of concurrent translations and executions"),
+    max_rows: int = typer.Option(100, "--max-rows", help="Maximum rows to include per executed query"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Per-question translation timeout in seconds"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the translation cache and always call the AI provider")
+):
+    """Translate (and optionally execute) many questions from a file"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from ai.cache import normalize_question
+    from ai.async_client import translate_many_sync
+    from ai.health import DEFAULT_HEALTH_TTL
+    from ai.retrieval import prune_schema, DEFAULT_PRUNE_TOP_K, DEFAULT_PRUNE_MIN_TABLES
+    from db.connector import DBConnector, collect_rows
+    
+    active_profile = get_active_profile()
+    if not active_profile:
+        typer.echo("No active profile. Create one with: nlsql profile create <name>", err=True)
+        raise typer.Exit(1)
+    
+    profile = load_profile(active_profile)
+    config = {}
+    if CONFIG_FILE.exists():
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    
+    provider_config = None
+    if 'ai_provider' in config:
+        from ai.providers import ProviderConfig
+        provider_config = ProviderConfig.from_dict(config['ai_provider'])
+    
+    if not provider_config or not provider_config.is_configured:
+        typer.echo("AI provider not configured. Run 'nlsql setup' or configure your AI provider.", err=True)
+        raise typer.Exit(1)
+    
+    configure_ai_transport(config)
+    
+    records = read_batch_questions(source)
+    if not records:
+        typer.echo("No questions found", err=True)
+        return
+    
+    # Identical questions are translated once
+    by_question = {}
+    for record in records:
+        by_question.setdefault(normalize_question(record["question"]), []).append(record)
+    unique_questions = [group[0]["question"] for group in by_question.values()]
+    typer.echo(f"Translating {len(records)} questions ({len(unique_questions)} unique) with {workers} workers", err=True)
+    
+    # Load the schema once for the whole batch
+    try:
         connector = DBConnector.create_connector(profile)
         connector.connect()
-        
-        # Execute the query
-        result, columns = connector.execute_query(sql_query)
-        print_result(result, columns)
-        
+        schema = connector.get_schema()
         connector.close()
     except Exception as e:
-        typer.echo(f"Error executing query: {str(e)}")
+        typer.echo(f"Warning: Could not fetch schema from database: {str(e)}", err=True)
+        schema = {"tables": ["users", "orders", "products"]}
+    
+    top_k = get_setting(config, "schema_prune_top_k", DEFAULT_PRUNE_TOP_K)
+    min_tables = get_setting(config, "schema_prune_min_tables", DEFAULT_PRUNE_MIN_TABLES)
+    def select_schema(question, full_schema):
+        return prune_schema(question, full_schema, top_k=top_k, min_tables=min_tables)[0]
+    
+    validator, retry_invalid = load_sql_validator(config, schema, profile)
+    
+    from utils.examples import get_example_index, DEFAULT_EXAMPLES
+    from db.schema import schema_fingerprint
+    example_index = get_example_index()
+    example_index.sync()
+    example_limit = get_setting(config, "few_shot_examples", DEFAULT_EXAMPLES)
+    schema_id = schema_fingerprint(schema)
+    def select_examples(question):
+        return example_index.similar(question, limit=example_limit, schema=schema_id)
+    
+    rate_limit = get_setting(config, "rate_limit_per_second", 0.0)
+    rate_limits = {provider_config.name: get_setting(config, f"{provider_config.name}_rate_limit_per_second", rate_limit)}
+    
+    out = open(output, 'w') if output else None
+    write_lock = threading.Lock()
+    def write_record(record):
+        line = json.dumps(record, default=str)
+        with write_lock:
+            if out:
+                out.write(line + "\n")
+                out.flush()
+            else:
+                typer.echo(line)
+    
+    # Each execution checks a connection out of the profile's pool and returns it
+    def execute_sql(sql_query):
+        connector = DBConnector.create_connector(profile)
+        connector.connect()
+        try:
+            start = time.perf_counter()
+            # The profile's max_rows caps --max-rows
+            rows_kept = min(max_rows, connector.max_rows)
+            batches, columns = connector.execute_stream(sql_query, max_rows=rows_kept + 1)
+            rows, truncated = collect_rows(batches, rows_kept)
+            return rows, truncated, columns, (time.perf_counter() - start) * 1000
+        finally:
+            connector.close()
+    
+    def run_and_write(result):
+        sql_query = clean_sql_response(result["sql"]) if result["sql"] else None
+        execution = {}
+        if execute and sql_query and not result["validation_error"]:
+            try:
+                rows, truncated, columns, execute_ms = execute_sql(sql_query)
+                execution = {
+                    "columns": columns,
+                    "rows": [list(row) for row in rows],
+                    "row_count": len(rows),
+                    "truncated": truncated,
+                    "execute_ms": round(execute_ms, 2)
+                }
+            except Exception as e:
+                execution = {"execute_error": str(e)}
+        for record in by_question[normalize_question(result["question"])]:
+            write_record({
+                "id": record["id"],
+                "question": record["question"],
+                "sql": sql_query,
+                "error": result["error"],
+                "validation_error": result["validation_error"],
+                "translate_ms": result["ms"],
+                **execution
+            })
+    
+    start = time.perf_counter()
+    execution_pool = ThreadPoolExecutor(max_workers=workers)
+    pending = []
+    try:
+        results = translate_many_sync(
+            unique_questions, schema, provider_config,
+            cache=None if no_cache else load_translation_cache(config),
+            concurrency=workers,
+            rate_limits=rate_limits,
+            timeout=timeout,
+            health_ttl=get_setting(config, "health_ttl_seconds", DEFAULT_HEALTH_TTL),
+            on_result=lambda result: pending.append(execution_pool.submit(run_and_write, result)),
+            select_schema=select_schema,
+            validator=validator,
+            retry_invalid=retry_invalid,
+            select_examples=select_examples,
+            **load_prompt_settings(config, provider_config)
+        )
+        for future in pending:
+            future.result()
+    except KeyboardInterrupt:
+        typer.echo("\nBatch cancelled", err=True)
+        raise typer.Exit(130)
+    except Exception as e:
+        # e.g. the provider failed its health probe before any question was sent
+        typer.echo(f"Error translating batch: {str(e)}", err=True)
         raise typer.Exit(1)
+    finally:
+        execution_pool.shutdown(wait=False, cancel_futures=True)
+        if out:
+            out.close()
+    
+    failed = sum(1 for result in results if result["error"])
+    typer.echo(f"Translated {len(unique_questions) - failed}/{len(unique_questions)} unique questions "
+               f"in {time.perf_counter() - start:.1f} s", err=True)
 
 # Saved queries commands
 @saved_app.command("list")
@@ -841,29 +1318,131 @@ def saved_delete(name: str):
         return
     
     query_path.unlink()
+    from utils.examples import get_example_index
+    get_example_index().remove_saved(name)
     typer.echo(f"Query '{name}' deleted successfully")
 
+# Translation cache commands
+@cache_app.command("stats")
+def cache_stats():
+    """Show translation cache hit/miss statistics"""
+    config = load_config(CONFIG_FILE)
+    stats = load_translation_cache(config).stats()
+    typer.echo(f"Entries: {stats['entries']}")
+    typer.echo(f"Hits: {stats['hits']}")
+    typer.echo(f"Misses: {stats['misses']}")
+    typer.echo(f"Hit rate: {stats['hit_rate']:.1%}")
+
+@cache_app.command("clear")
+def cache_clear():
+    """Remove all cached translations"""
+    config = load_config(CONFIG_FILE)
+    load_translation_cache(config).clear()
+    typer.echo("Translation cache cleared")
+
 # History command
 @app.command()
 def history():
     """View query history"""
-    if not HISTORY_FILE.exists():
-        typer.echo("No query history found")
-        return
-    
-    with open(HISTORY_FILE, 'r') as f:
-        history_data = json.load(f)
+    from utils.history import HistoryStore
+    history_data = HistoryStore().recent(10)
     
     if not history_data:
         typer.echo("No query history found")
         return
     
     typer.echo("Query history:")
-    for i, entry in enumerate(history_data[-10:], 1):  # Show last 10 entries
+    for i, entry in enumerate(history_data, 1):  # Show last 10 entries
         timestamp = entry["timestamp"].split("T")[0]  # Just show the date
         executed = "(executed)" if entry["executed"] else ""
         typer.echo(f"{i}. [{timestamp}] {executed} {entry['question']}")
 
+# Provider health command
+@app.command()
+def health(check: bool = typer.Option(False, "--check", help="Probe the configured AI provider now")):
+    """Show cached AI provider health and probe timings"""
+    from ai.health import load_health, probe_provider
+    
+    if check:
+        config = {}
+        if CONFIG_FILE.exists():
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+        if 'ai_provider' not in config:
+            typer.echo("AI provider not configured. Run 'nlsql setup' or configure your AI provider.")
+            return
+        from ai.providers import ProviderConfig
+        provider_config = ProviderConfig.from_dict(config['ai_provider'])
+        configure_ai_transport(config)
+        try:
+            probe_ms = probe_provider(provider_config)
+            typer.echo(f"{provider_config.name}:{provider_config.model} is healthy ({probe_ms:.0f} ms)")
+        except ValueError as e:
+            typer.echo(str(e))
+    
+    records = load_health()
+    if not records:
+        typer.echo("No provider health records found")
+        return
+    
+    typer.echo("Provider health:")
+    for key, record in records.items():
+        checked = datetime.datetime.fromtimestamp(record.get("checked_at", 0)).isoformat(timespec="seconds")
+        status = "healthy" if record.get("healthy") else f"failing ({record.get('error')})"
+        typer.echo(f"- {key}: {status}, checked {checked}")
+        if "last_probe_ms" in record:
+            typer.echo(f"    last probe: {record['last_probe_ms']:.0f} ms")
+        if "last_call_ms" in record:
+            typer.echo(f"    last translation (without probe): {record['last_call_ms']:.0f} ms")
+
+# Stats command
+@app.command()
+def stats(
+    openmetrics: bool = typer.Option(False, "--openmetrics", help="Print the metrics in OpenMetrics text format"),
+    output: Optional[Path] = typer.Option(None, "--output", "-o", help="Write the metrics to an OpenMetrics text file"),
+    reset: bool = typer.Option(False, "--reset", help="Clear all recorded metrics")
+):
+    """Show latency percentiles, error counts and cache hit rates recorded by nlsql"""
+    from utils import metrics
+    registry = metrics.get_registry()
+    if reset:
+        registry.reset()
+        typer.echo("Metrics cleared")
+        return
+    snapshot = registry.snapshot()
+    if output:
+        output.write_text(metrics.render_openmetrics(snapshot))
+        typer.echo(f"Metrics written to {output}")
+        return
+    if openmetrics:
+        typer.echo(metrics.render_openmetrics(snapshot), nl=False)
+        return
+    
+    summary = metrics.summarize(snapshot)
+    if not summary["histograms"] and not summary["counters"]:
+        typer.echo("No metrics recorded yet")
+        return
+    
+    def series(row):
+        return f"{row['metric']}{{{row['labels']}}}" if row["labels"] else row["metric"]
+    
+    if summary["histograms"]:
+        typer.echo(f"{'Histogram':<72} {'count':>8} {'p50':>10} {'p95':>10} {'p99':>10}")
+        for row in summary["histograms"]:
+            # Latencies are recorded in seconds but read better in ms
+            scale, unit = (1000, " ms") if row["metric"].endswith("_seconds") else (1, "")
+            values = [f"{row[p] * scale:.1f}{unit}" if scale != 1 else f"{row[p]:.0f}" for p in ("p50", "p95", "p99")]
+            typer.echo(f"{series(row):<72} {row['count']:>8} {values[0]:>10} {values[1]:>10} {values[2]:>10}")
+    if summary["caches"]:
+        typer.echo("\nCache hit rates:")
+        for row in summary["caches"]:
+            typer.echo(f"- {row['cache']}: {row['hit_rate']:.1%} ({row['hits']:g} hits, {row['misses']:g} misses)")
+    counters = [row for row in summary["counters"] if row["metric"] != "nlsql_cache_requests"]
+    if counters:
+        typer.echo("\nCounters:")
+        for row in counters:
+            typer.echo(f"- {series(row)}: {row['value']:g}")
+
 # Version command
 @app.command()
 def version():
@@ -888,6 +1467,115 @@ def setup_test_db(
         typer.echo(f"Error: Could not import setup script: {str(e)}")
         typer.echo("Make sure the scripts directory is in your Python path.")
 
+# Mock LLM server command
+@app.command("mock-server")
+def mock_server(
+    port: int = typer.Option(8765, help="Port to listen on"),
+    latency_ms: float = typer.Option(0.0, help="Delay before each response"),
+    jitter_ms: float = typer.Option(0.0, help="Random +/- variation of the delay"),
+    chunk_delay_ms: float = typer.Option(0.0, help="Delay between streamed chunks"),
+    error_rate: float = typer.Option(0.0, help="Fraction of requests answered with HTTP 503"),
+    fixtures: Optional[str] = typer.Option(None, help="JSON file of prompt matches and SQL responses")
+):
+    """Run a local OpenAI/Anthropic/Gemini compatible mock server for offline benchmarks"""
+    try:
+        from scripts.mock_llm_server import serve
+        serve(host="127.0.0.1", port=port, latency_ms=latency_ms, jitter_ms=jitter_ms,
+              chunk_delay_ms=chunk_delay_ms, error_rate=error_rate, fixtures=fixtures,
+              default_sql="SELECT 1;")
+    except ImportError as e:
+        typer.echo(f"Error: Could not import mock server script: {str(e)}")
+        typer.echo("Make sure the scripts directory is in your Python path.")
+
+# HTTP API server command
+@app.command("serve")
+def serve_api(
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(8750, help="Port to listen on"),
+    workers: int = typer.Option(None, "--workers", "-w", help="Worker threads for translations and queries"),
+    queue_size: int = typer.Option(None, help="Requests allowed to wait for a worker before answering 429"),
+    timeout: float = typer.Option(None, help="Request timeout in seconds")
+):
+    """Serve /translate, /execute and /query as a local HTTP/JSON API"""
+    from server.api import create_server, close_server, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE, DEFAULT_REQUEST_TIMEOUT
+    from server.service import NLSQLService
+    config = {}
+    if CONFIG_FILE.exists():
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    try:
+        service = NLSQLService(config)
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(1)
+    server = create_server(
+        host, port, service,
+        workers=workers or get_setting(config, "server_workers", DEFAULT_WORKERS),
+        queue_size=queue_size if queue_size is not None else get_setting(config, "server_queue_size", DEFAULT_QUEUE_SIZE),
+        request_timeout=timeout or get_setting(config, "server_request_timeout", DEFAULT_REQUEST_TIMEOUT)
+    )
+    address = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    typer.echo(f"nlsql API listening on {address} ({server.pool.workers} workers, queue {server.pool.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        typer.echo("\nStopping server")
+    finally:
+        close_server(server)
+
+# Daemon commands
+@daemon_app.command("start")
+def daemon_start(detach: bool = typer.Option(False, "--detach", "-d", help="Run in the background")):
+    """Start the daemon. query, run, describe and list are forwarded to it while it runs."""
+    import nlsql_daemon as daemon
+    if daemon.forward_ping():
+        typer.echo(f"Daemon already running on {daemon.SOCKET_PATH}")
+        return
+    if detach:
+        import subprocess
+        import sys
+        subprocess.Popen(
+            [sys.executable, "-c", "import nlsql_daemon; nlsql_daemon.serve()"],
+            cwd=str(Path(__file__).resolve().parent),
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        # Wait for it to start listening
+        for _ in range(100):
+            pid = daemon.forward_ping()
+            if pid:
+                typer.echo(f"Daemon started (pid {pid}) on {daemon.SOCKET_PATH}")
+                return
+            time.sleep(0.1)
+        typer.echo("Error: Daemon did not start")
+        raise typer.Exit(1)
+    try:
+        daemon.serve(on_ready=lambda path: typer.echo(f"Daemon listening on {path} (Ctrl+C to stop)"))
+    except RuntimeError as e:
+        typer.echo(f"Error: {str(e)}")
+        raise typer.Exit(1)
+    except KeyboardInterrupt:
+        typer.echo("Daemon stopped")
+
+@daemon_app.command("stop")
+def daemon_stop():
+    """Stop the running daemon"""
+    import nlsql_daemon as daemon
+    if daemon.request_shutdown():
+        typer.echo("Daemon stopped")
+    else:
+        typer.echo("Daemon is not running")
+
+@daemon_app.command("status")
+def daemon_status():
+    """Show whether the daemon is running"""
+    import nlsql_daemon as daemon
+    pid = daemon.forward_ping()
+    if pid:
+        typer.echo(f"Daemon running (pid {pid}) on {daemon.SOCKET_PATH}")
+    else:
+        typer.echo("Daemon is not running")
+
 # Main entry point
 @app.callback(invoke_without_command=True)
 def main(ctx: typer.Context):
@@ -897,6 +1585,17 @@ def main(ctx: typer.Context):
     PROFILES_DIR.mkdir(exist_ok=True)
     SAVED_QUERIES_DIR.mkdir(exist_ok=True)
     
+    # Metrics are on unless turned off with 'metrics=false'
+    if CONFIG_FILE.exists():
+        from utils.metrics import configure_metrics
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+            configure_metrics(get_setting(config, "metrics", True))
+            configure_db_pools(config)
+        except (json.JSONDecodeError, IOError):
+            pass
+    
     # If no command is provided, show help
     if ctx.invoked_subcommand is None:
         typer.echo(ctx.get_help())
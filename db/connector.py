@@ -1,16 +1,90 @@
+import functools
 import mysql.connector
-from mysql.connector import pooling
 import sqlite3
 import importlib.util
+import threading
+import time
 import typer
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
+from utils import metrics
+from utils.tracing import span
+from db.pool import get_pool
+
+# Rows fetched per round trip by execute_stream
+DEFAULT_BATCH_SIZE = 1000
+# Most rows an interactive query fetches, unless the profile sets max_rows
+DEFAULT_MAX_ROWS = 10000
+# Seconds past a statement timeout before the client cancels it itself,
+# giving the server's own timeout the first chance to report it
+TIMEOUT_GRACE = 0.5
+
+class StatementTimeout(Exception):
+    """A statement ran past its timeout and was cancelled."""
+
+# Statements in flight, so they can be cancelled from another thread (see cancel_running)
+_running = set()
+_running_lock = threading.Lock()
+
+# Blocking driver calls that have to stay interruptible run on these threads
+_driver_executor = None
+
+def _driver_threads():
+    global _driver_executor
+    if _driver_executor is None:
+        with _running_lock:
+            if _driver_executor is None:
+                _driver_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="nlsql-db")
+    return _driver_executor
+
+def cancel_running():
+    """Cancel every statement in flight in this process. Returns how many were cancelled."""
+    with _running_lock:
+        connectors = list(_running)
+    for connector in connectors:
+        try:
+            connector.cancel()
+        except Exception:
+            pass  # The statement may have finished in the meantime
+    return len(connectors)
+
+class BatchStream:
+    """Batches of rows from execute_stream.
+    
+    close() ends the statement (clearing its timeout and releasing the cursor) whether or
+    not any batch was read; closing a generator that never started skips its cleanup.
+    """
+    def __init__(self, batches, end):
+        self._batches = batches
+        self._end = end
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        return next(self._batches)
+    
+    def close(self):
+        try:
+            self._batches.close()
+        finally:
+            self._end(False)
 
 class DBConnector:
     """Base class for database connectors"""
     def __init__(self, profile):
         self.profile = profile
         self.connection = None
+        self.pool = None
+        self._settings = None
         self._transaction = False
+        # Set while execute_stream runs the query wrapped by limit_query
+        self._wrapped = False
+        # Seconds a statement may run, set per profile and overridable per command
+        self.statement_timeout = float(profile.get('statement_timeout') or 0) or None
+        self._deadline = None
+        self._cancelled = False
     
     def __enter__(self):
         """Context manager entry"""
@@ -29,19 +103,298 @@ class DBConnector:
             self._transaction = False
     
     def connect(self, password=None):
-        """Connect to the database"""
-        raise NotImplementedError("Subclasses must implement connect()")
+        """Check out a connection from the profile's pool, opening one if none is idle"""
+        if password is None:
+            password = self.profile.get('password', '')
+        
+        if not self.connection:
+            settings = self._settings = self._connection_settings(password)
+            pool_key = (self.profile.get('name'), type(self).__name__, tuple(sorted(settings.items())))
+            self.pool = get_pool(pool_key, self.metrics_label, functools.partial(self._open_connection, settings),
+                                 self._ping_connection, self._reset_connection)
+            with metrics.timer("nlsql_db_connect_seconds", profile=self.metrics_label):
+                self.connection = self.pool.acquire()
+        
+        return self.connection
     
     def close(self):
-        """Close the database connection"""
+        """Return the connection to the pool"""
         if self.connection:
-            self.connection.close()
+            self.pool.release(self.connection)
+            self.connection = None
+    
+    def _discard_connection(self, connection):
+        """Close a connection that can't be reused instead of returning it to the pool"""
+        if self.connection is connection:
+            self.pool.discard(connection)
             self.connection = None
     
+    def _connection_settings(self, password):
+        """Everything needed to open a connection, also used to key the pool"""
+        raise NotImplementedError("Subclasses must implement _connection_settings()")
+    
+    @staticmethod
+    def _open_connection(settings):
+        raise NotImplementedError("Subclasses must implement _open_connection()")
+    
+    @staticmethod
+    def _ping_connection(connection):
+        """Raise if a pooled connection no longer works"""
+        connection.cursor().execute("SELECT 1")
+        connection.rollback()
+    
+    @staticmethod
+    def _reset_connection(connection):
+        """Undo anything left uncommitted before the connection goes back to the pool"""
+        connection.rollback()
+    
     def execute_query(self, query):
         """Execute a SQL query and return results"""
         raise NotImplementedError("Subclasses must implement execute_query()")
     
+    def cancel(self):
+        """Cancel the statement running on this connector's connection. Safe from any thread."""
+        self._cancelled = True
+        self._cancel_statement()
+    
+    def _cancel_statement(self):
+        raise NotImplementedError("Subclasses must implement _cancel_statement()")
+    
+    def _apply_timeout(self, seconds):
+        """Have the database enforce the statement timeout (None for no timeout)"""
+    
+    def _clear_timeout(self):
+        """Undo _apply_timeout once the statement is done, if the setting would outlive it"""
+    
+    def _begin_statement(self):
+        self._cancelled = False
+        self._deadline = time.monotonic() + self.statement_timeout if self.statement_timeout else None
+        self._apply_timeout(self.statement_timeout)
+        with _running_lock:
+            _running.add(self)
+    
+    def _end_statement(self):
+        with _running_lock:
+            _running.discard(self)
+        if self.connection is not None:
+            self._clear_timeout()
+        self._deadline = None
+    
+    def _call(self, fn, *args):
+        """Run a blocking driver call, cancelling the statement on Ctrl+C or once it times out.
+        
+        A thread blocked inside a driver never sees KeyboardInterrupt, so calls from the
+        main thread, and calls with a timeout, run on a driver thread while this one waits.
+        """
+        if self._deadline is None and threading.current_thread() is not threading.main_thread():
+            return fn(*args)
+        future = _driver_threads().submit(fn, *args)
+        remaining = None if self._deadline is None else max(self._deadline + TIMEOUT_GRACE - time.monotonic(), 0)
+        try:
+            return future.result(remaining)
+        except FutureTimeoutError:
+            self.cancel()
+            try:
+                # Usually fails with the driver's cancellation error, unless it just finished
+                return future.result()
+            except Exception as e:
+                raise StatementTimeout(f"Statement cancelled after {self.statement_timeout:g}s") from e
+        except KeyboardInterrupt:
+            # Stop the statement on the server too, rather than leaving it running
+            self.cancel()
+            try:
+                future.result()
+            except Exception:
+                pass
+            raise
+    
+    def _timed_out(self, error):
+        """The error to raise for a failed statement, a StatementTimeout once past the deadline"""
+        if self._deadline is not None and time.monotonic() >= self._deadline and not isinstance(error, StatementTimeout):
+            timeout = StatementTimeout(f"Statement cancelled after {self.statement_timeout:g}s: {error}")
+            timeout.__cause__ = error
+            return timeout
+        return error
+    
+    @property
+    def max_rows(self):
+        """Cap on the rows an interactive query fetches, set per profile with max_rows"""
+        return int(self.profile.get('max_rows') or DEFAULT_MAX_ROWS)
+    
+    # Row limit appended to a wrapped query; {n} is the number of rows
+    limit_clause = "LIMIT {n}"
+    
+    def limit_query(self, query, max_rows):
+        """Wrap a row-returning query so the database stops after max_rows rows.
+        
+        The query becomes a subquery, so it works whatever LIMIT, ORDER BY or nested
+        selects it already has. Anything else, including several statements, is
+        returned unchanged.
+        """
+        statement = query.strip().rstrip(";").rstrip()
+        if not _returns_rows(statement) or ";" in statement:
+            return query
+        # The newline ends a trailing -- comment before the closing parenthesis
+        return f"SELECT * FROM ({statement}\n) AS nlsql_limited {self.limit_clause.format(n=int(max_rows))}"
+    
+    @property
+    def metrics_label(self):
+        """Profile name used to label this connector's metrics"""
+        return self.profile.get('name') or self.profile.get('database') or self.profile.get('type', 'unknown')
+    
+    def execute_stream(self, query, batch_size=DEFAULT_BATCH_SIZE, max_rows=None):
+        """Execute a SQL query and return (batches, columns), where batches yields lists of rows.
+        
+        Rows are fetched from the server batch_size at a time, so memory stays bounded by the
+        batch size rather than the result size. Read or close the batches before running
+        another query on this connector.
+        
+        With max_rows the limit is pushed into the query (see limit_query) and fetching
+        stops at the cursor after max_rows rows. Pass one more than the rows wanted to
+        find out whether the result was cut off.
+        """
+        if not self.connection:
+            self.connect()
+        
+        if max_rows is not None:
+            limited = self.limit_query(query, max_rows)
+            if limited != query:
+                self._wrapped = True
+                try:
+                    return self._stream(limited, batch_size, max_rows, limited=True)
+                except Exception as e:
+                    if self._transaction or self._cancelled or not self._wrapping_error(e):
+                        raise
+                    # Not every query survives wrapping (MySQL rejects duplicate column
+                    # names in a derived table), so fall back to stopping at the cursor
+                finally:
+                    self._wrapped = False
+        return self._stream(query, batch_size, max_rows)
+    
+    def _wrapping_error(self, error):
+        """Whether error may come from wrapping the query in limit_query rather than the query itself.
+        
+        Syntax errors count too: a query that is wrong on its own fails again unwrapped,
+        which only costs a second parse.
+        """
+        return False
+    
+    def _stream(self, query, batch_size, max_rows, limited=False):
+        """Execute on a new cursor and return (batches, columns), see _execute_and_stream"""
+        raise NotImplementedError("Subclasses must implement _stream()")
+    
+    def _execute(self, cursor, query):
+        """Execute on a cursor, recording execute latency and errors.
+        
+        Starts the statement's timeout; the caller ends it with _end_statement.
+        """
+        label = self.metrics_label
+        start = time.perf_counter()
+        try:
+            self._begin_statement()
+            with span("db.execute"):
+                self._call(cursor.execute, query)
+        except Exception as e:
+            # A wrapped query that is about to be retried unwrapped isn't counted twice
+            if not (self._wrapped and self._wrapping_error(e)):
+                metrics.inc("nlsql_db_errors", profile=label)
+            raise self._timed_out(e)
+        metrics.observe("nlsql_db_execute_seconds", time.perf_counter() - start, profile=label)
+    
+    def _execute_and_fetch(self, cursor, query):
+        """Execute on a cursor and fetch all rows, recording execute and fetch latency and row counts"""
+        label = self.metrics_label
+        try:
+            self._execute(cursor, query)
+            executed = time.perf_counter()
+            
+            # Get column names
+            columns = [description[0] for description in cursor.description] if cursor.description else []
+            
+            # Fetch results
+            with span("db.fetch"):
+                results = self._call(cursor.fetchall)
+        except Exception as e:
+            raise self._timed_out(e)
+        finally:
+            self._end_statement()
+        metrics.observe("nlsql_db_fetch_seconds", time.perf_counter() - executed, profile=label)
+        metrics.observe("nlsql_db_rows", len(results), metrics.ROW_BUCKETS, profile=label)
+        return results, columns
+    
+    def _execute_and_stream(self, cursor, query, batch_size, finish=None, server_side=False, max_rows=None):
+        """Execute on a cursor and return (batches, columns) fetching batch_size rows at a time.
+        
+        The first batch is fetched before returning, so execution errors are raised here and
+        column names are known (server-side cursors only describe the result after a fetch).
+        Fetching stops after max_rows rows. finish(completed) runs once the batches are
+        exhausted, stopped or closed, and must close the cursor; completed is False if
+        rows may be left unread.
+        """
+        label = self.metrics_label
+        if finish is None:
+            finish = lambda completed: cursor.close()
+        
+        def batch_rows(fetched):
+            return batch_size if max_rows is None else min(batch_size, max_rows - fetched)
+        
+        ended = False
+        
+        def end(completed):
+            nonlocal ended
+            if ended:
+                return
+            ended = True
+            self._end_statement()
+            finish(completed)
+        
+        requested = batch_rows(0)
+        try:
+            self._execute(cursor, query)
+            fetch_start = time.perf_counter()
+            if (cursor.description is None and not server_side) or requested <= 0:
+                first = []
+            else:
+                with span("db.fetch", batch=0):
+                    first = self._call(cursor.fetchmany, requested)
+            columns = [description[0] for description in cursor.description] if cursor.description else []
+        except BaseException as e:
+            end(False)
+            raise self._timed_out(e) if isinstance(e, Exception) else e
+        fetch_seconds = time.perf_counter() - fetch_start
+        
+        def batches():
+            nonlocal fetch_seconds, requested
+            rows = len(first)
+            completed = False
+            try:
+                batch = first
+                index = 0
+                while batch:
+                    yield batch
+                    if len(batch) < requested:
+                        break
+                    requested = batch_rows(rows)
+                    if requested <= 0:
+                        # Stopped at max_rows; the rest of the result is never fetched
+                        return
+                    index += 1
+                    start = time.perf_counter()
+                    with span("db.fetch", batch=index):
+                        try:
+                            batch = self._call(cursor.fetchmany, requested)
+                        except Exception as e:
+                            raise self._timed_out(e)
+                    fetch_seconds += time.perf_counter() - start
+                    rows += len(batch)
+                completed = True
+            finally:
+                metrics.observe("nlsql_db_fetch_seconds", fetch_seconds, profile=label)
+                metrics.observe("nlsql_db_rows", rows, metrics.ROW_BUCKETS, profile=label)
+                end(completed)
+        
+        return BatchStream(batches(), end), columns
+    
     def get_schema(self, force_refresh=False):
         """Get the database schema"""
         raise NotImplementedError("Subclasses must implement get_schema()")
@@ -59,29 +412,62 @@ class DBConnector:
         else:
             raise ValueError(f"Unsupported database type: {db_type}")
 
+# max_execution_time currently set on each pooled MySQL connection, in milliseconds
+_mysql_session_timeouts = weakref.WeakKeyDictionary()
+
 class MySQLConnector(DBConnector):
     """MySQL database connector"""
     def __init__(self, profile):
         super().__init__(profile)
-        self.pool = None
-
-    def connect(self, password=None):
-        """Connect to MySQL database"""
-        if password is None:
-            password = self.profile.get('password', '')
+    
+    def _connection_settings(self, password):
+        return dict(
+            host = self.profile.get('host', 'localhost'),
+            port = int(self.profile.get('port', 3306)),
+            user = self.profile.get('username', 'root'),
+            password = password,
+            database = self.profile.get('database', '')
+        )
+    
+    @staticmethod
+    def _open_connection(settings):
+        return mysql.connector.connect(**settings)
+    
+    @staticmethod
+    def _ping_connection(connection):
+        connection.ping()
+    
+    @staticmethod
+    def _reset_connection(connection):
+        if connection.unread_result:
+            connection.consume_results()
+        connection.rollback()
+    
+    def _apply_timeout(self, seconds):
+        """Set max_execution_time, which MySQL enforces on SELECT statements.
         
-        if not self.pool:
-            self.pool = pooling.MySQLConnectionPool(
-                pool_name = "nlsql_pool",
-                pool_size = 5,
-                host = self.profile.get('host', 'localhost'),
-                port = int(self.profile.get('port', 3306)),
-                user = self.profile.get('username', 'root'),
-                password = password,
-                database = self.profile.get('database', '')
-            )
-        self.connection = self.pool.get_connection()
-        return self.connection
+        The session value stays with the pooled connection, so it is only sent when it
+        differs from what this connection already has.
+        """
+        milliseconds = int(seconds * 1000) if seconds else 0
+        if _mysql_session_timeouts.get(self.connection, 0) != milliseconds:
+            cursor = self.connection.cursor()
+            cursor.execute(f"SET SESSION max_execution_time = {milliseconds}")
+            cursor.close()
+            _mysql_session_timeouts[self.connection] = milliseconds
+    
+    def _cancel_statement(self):
+        """KILL QUERY the running statement from a second connection"""
+        connection = self.connection
+        if connection is None or self._settings is None:
+            return
+        killer = mysql.connector.connect(**self._settings)
+        try:
+            cursor = killer.cursor()
+            cursor.execute(f"KILL QUERY {int(connection.connection_id)}")
+            cursor.close()
+        finally:
+            killer.close()
     
     def execute_query(self, query, auto_commit=True):
         """Execute a SQL query and return results"""
@@ -89,13 +475,7 @@ class MySQLConnector(DBConnector):
             self.connect()
         
         cursor = self.connection.cursor()
-        cursor.execute(query)
-        
-        # Get column names
-        columns = [column[0] for column in cursor.description] if cursor.description else []
-        
-        # Fetch results
-        results = cursor.fetchall()
+        results, columns = self._execute_and_fetch(cursor, query)
         
         if auto_commit and not self._transaction:
             self.connection.commit()
@@ -103,11 +483,41 @@ class MySQLConnector(DBConnector):
         cursor.close()
         return results, columns
     
+    def _wrapping_error(self, error):
+        return isinstance(error, mysql.connector.Error) and error.errno in (
+            mysql.connector.errorcode.ER_DUP_FIELDNAME, mysql.connector.errorcode.ER_PARSE_ERROR)
+    
+    def _stream(self, query, batch_size, max_rows, limited=False):
+        """Stream from an unbuffered cursor"""
+        connection = self.connection
+        cursor = connection.cursor(buffered=False)
+        def finish(completed):
+            # Rows left on an unbuffered cursor block the connection until they are read.
+            # Reading them is cheap when the query was limited; otherwise the connection
+            # is dropped rather than downloading the rest of the result.
+            if not completed and connection.unread_result:
+                if not limited:
+                    self._discard_connection(connection)
+                    return
+                connection.consume_results()
+            cursor.close()
+            if not self._transaction:
+                connection.commit()
+        return self._execute_and_stream(cursor, query, batch_size, finish, max_rows=max_rows)
+    
     def get_schema(self, force_refresh=False):
         """Get the database schema"""
         from db.schema import get_schema
         return get_schema(self, force_refresh)
 
+# Server-side cursor names only need to be unique per connection
+_stream_cursor_id = 0
+
+def _returns_rows(query):
+    """Whether a statement can be declared as a server-side cursor"""
+    words = query.lstrip(" \t\n(").split(None, 1)
+    return bool(words) and words[0].upper() in ("SELECT", "WITH", "VALUES", "TABLE")
+
 class PostgreSQLConnector(DBConnector):
     """PostgreSQL database connector"""
     def __init__(self, profile):
@@ -117,23 +527,32 @@ class PostgreSQLConnector(DBConnector):
             typer.echo("PostgreSQL support requires psycopg2. Install with: pip install psycopg2-binary")
             raise typer.Exit(1)
     
-    def connect(self, password=None):
-        """Connect to PostgreSQL database"""
+    def _connection_settings(self, password):
+        return dict(
+            host=self.profile.get('host', 'localhost'),
+            port=int(self.profile.get('port', 5432)),
+            user=self.profile.get('username', 'postgres'),
+            password=password,
+            dbname=self.profile.get('database', '')
+        )
+    
+    @staticmethod
+    def _open_connection(settings):
         import psycopg2
-        
-        if password is None:
-            password = self.profile.get('password', '')
-        
-        if not self.connection:
-            self.connection = psycopg2.connect(
-                host=self.profile.get('host', 'localhost'),
-                port=int(self.profile.get('port', 5432)),
-                user=self.profile.get('username', 'postgres'),
-                password=password,
-                dbname=self.profile.get('database', '')
-            )
-        
-        return self.connection
+        return psycopg2.connect(**settings)
+    
+    def _apply_timeout(self, seconds):
+        """SET LOCAL statement_timeout, which ends with the statement's transaction"""
+        if seconds:
+            cursor = self.connection.cursor()
+            cursor.execute(f"SET LOCAL statement_timeout = {int(seconds * 1000)}")
+            cursor.close()
+    
+    def _cancel_statement(self):
+        """Ask the server to cancel the running statement (as pg_cancel_backend does)"""
+        connection = self.connection
+        if connection is not None:
+            connection.cancel()
     
     def execute_query(self, query, auto_commit=True):
         """Execute a SQL query and return results with transaction management"""
@@ -142,13 +561,7 @@ class PostgreSQLConnector(DBConnector):
         
         cursor = self.connection.cursor()
         try:
-            cursor.execute(query)
-            
-            # Get column names
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            
-            # Fetch results
-            results = cursor.fetchall()
+            results, columns = self._execute_and_fetch(cursor, query)
             
             if auto_commit:
                 self.connection.commit()
@@ -161,24 +574,119 @@ class PostgreSQLConnector(DBConnector):
         finally:
             cursor.close()
     
+    # FETCH FIRST is the standard spelling, and PostgreSQL also accepts it in subqueries
+    limit_clause = "FETCH FIRST {n} ROWS ONLY"
+    
+    def _wrapping_error(self, error):
+        # syntax_error, duplicate_column
+        return getattr(error, "pgcode", None) in ("42601", "42701")
+    
+    def _stream(self, query, batch_size, max_rows, limited=False):
+        """Stream from a server-side cursor.
+        
+        Queries that return rows run on a named (server-side) cursor, which only exists
+        inside a transaction; anything else falls back to a client-side cursor.
+        """
+        connection = self.connection
+        server_side = _returns_rows(query)
+        if server_side:
+            global _stream_cursor_id
+            _stream_cursor_id += 1
+            cursor = connection.cursor(name=f"nlsql_stream_{_stream_cursor_id}")
+            cursor.itersize = batch_size
+        else:
+            cursor = connection.cursor()
+        def finish(completed):
+            try:
+                cursor.close()
+            finally:
+                if not self._transaction:
+                    if completed:
+                        connection.commit()
+                    else:
+                        connection.rollback()
+        return self._execute_and_stream(cursor, query, batch_size, finish, server_side, max_rows)
+    
     def get_schema(self, force_refresh=False):
-        """Get the database schema (placeholder)"""
-        # This would need a PostgreSQL-specific implementation
-        return {"tables": ["users", "orders", "products"]}
+        """Get the database schema"""
+        from db.schema import get_schema
+        return get_schema(self, force_refresh)
+
+# SQLite virtual machine steps between deadline checks
+SQLITE_PROGRESS_STEPS = 10000
+# PRAGMAs a SQLite profile can set, with the values each accepts
+SQLITE_PRAGMAS = {
+    "journal_mode": {"delete", "truncate", "persist", "memory", "wal", "off"},
+    "mmap_size": int,  # bytes of the file to memory-map
+    "cache_size": int,  # pages, or KiB when negative
+    "temp_store": {"default", "file", "memory"},
+}
+# Suggested settings for read-heavy profiles: WAL so readers don't block on a writer, and
+# a 256 MiB map so reads skip copying pages. cache_size and temp_store stay at SQLite's
+# defaults: with the map, a bigger page cache didn't help, and temp_store=memory made
+# GROUP BY sorts slower (see scripts/sqlite_bench.py)
+SQLITE_TUNING = {"journal_mode": "wal", "mmap_size": 268435456, "cache_size": -2000, "temp_store": "default"}
+# How a SQLite profile opens its file: readonly opens it with mode=ro, immutable also
+# promises that nothing changes it, so SQLite skips locking and change detection
+SQLITE_MODES = ("readwrite", "readonly", "immutable")
 
 class SQLiteConnector(DBConnector):
     """SQLite database connector"""
     def __init__(self, profile):
         super().__init__(profile)
     
-    def connect(self, password=None):
-        """Connect to SQLite database"""
-        db_path = self.profile.get('database', ':memory:')
-        
-        if not self.connection:
-            self.connection = sqlite3.connect(db_path)
-        
-        return self.connection
+    def _connection_settings(self, password):
+        settings = dict(database=self.profile.get('database', ':memory:'),
+                        mode=self.profile.get('sqlite_mode') or "readwrite")
+        if settings['mode'] not in SQLITE_MODES:
+            raise ValueError(f"sqlite_mode must be one of {', '.join(SQLITE_MODES)}, not '{settings['mode']}'")
+        for pragma, allowed in SQLITE_PRAGMAS.items():
+            value = self.profile.get(pragma)
+            if value in (None, ""):
+                continue
+            if allowed is int:
+                value = int(value)
+            elif str(value).lower() in allowed:
+                value = str(value).lower()
+            else:
+                raise ValueError(f"{pragma} must be one of {', '.join(sorted(allowed))}, not '{value}'")
+            settings[pragma] = value
+        return settings
+    
+    @staticmethod
+    def _open_connection(settings):
+        database, mode = settings['database'], settings['mode']
+        # The pool hands a connection to one thread at a time, but not always the same thread
+        if mode == "readwrite" or database == ":memory:":
+            connection = sqlite3.connect(database, check_same_thread=False)
+        else:
+            uri = Path(database).expanduser().resolve().as_uri() + "?mode=ro"
+            if mode == "immutable":
+                uri += "&immutable=1"
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            if pragma not in settings:
+                continue
+            if pragma == "journal_mode" and mode != "readwrite":
+                continue  # Changing the journal mode writes to the file
+            connection.execute(f"PRAGMA {pragma} = {settings[pragma]}")
+        return connection
+    
+    def _apply_timeout(self, seconds):
+        """Abort the statement from a progress handler once the deadline has passed"""
+        if seconds:
+            deadline = self._deadline
+            self.connection.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_STEPS)
+    
+    def _clear_timeout(self):
+        if self._deadline is not None:
+            self.connection.set_progress_handler(None, 0)
+    
+    def _cancel_statement(self):
+        """Interrupt the running statement"""
+        connection = self.connection
+        if connection is not None:
+            connection.interrupt()
     
     def execute_query(self, query):
         """Execute a SQL query and return results"""
@@ -186,18 +694,36 @@ class SQLiteConnector(DBConnector):
             self.connect()
         
         cursor = self.connection.cursor()
-        cursor.execute(query)
-        
-        # Get column names
-        columns = [description[0] for description in cursor.description] if cursor.description else []
-        
-        # Fetch results
-        results = cursor.fetchall()
+        results, columns = self._execute_and_fetch(cursor, query)
         
         cursor.close()
         return results, columns
     
+    def _wrapping_error(self, error):
+        return isinstance(error, sqlite3.OperationalError) and "syntax error" in str(error)
+    
+    def _stream(self, query, batch_size, max_rows, limited=False):
+        """Stream with fetchmany (SQLite steps through rows lazily)"""
+        cursor = self.connection.cursor()
+        return self._execute_and_stream(cursor, query, batch_size, max_rows=max_rows)
+    
     def get_schema(self, force_refresh=False):
-        """Get the database schema (placeholder)"""
-        # This would need a SQLite-specific implementation
-        return {"tables": ["users", "orders", "products"]}
\ No newline at end of file
+        """Get the database schema"""
+        from db.schema import get_schema
+        return get_schema(self, force_refresh)
+
+def collect_rows(batches, max_rows):
+    """Read up to max_rows rows from a stream, then close it.
+    
+    Returns (rows, truncated), where truncated is True if the stream had more rows.
+    Stream with max_rows + 1 so the extra row is all that is fetched past the limit.
+    """
+    rows = []
+    try:
+        for batch in batches:
+            rows.extend(batch)
+            if len(rows) > max_rows:
+                return rows[:max_rows], True
+    finally:
+        batches.close()
+    return rows, False
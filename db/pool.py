@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from utils import metrics
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_MAX_IDLE = 300.0  # seconds an unused connection is kept open
+DEFAULT_PING_AFTER = 5.0  # seconds idle before a connection is checked on checkout
+DEFAULT_POOL_TIMEOUT = 30.0  # seconds to wait for a connection when the pool is full
+
+class PoolConfig:
+    """Size and lifetime settings shared by all database connection pools."""
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, max_idle: float = DEFAULT_MAX_IDLE,
+                 ping_after: float = DEFAULT_PING_AFTER, timeout: float = DEFAULT_POOL_TIMEOUT):
+        self.size = size
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self.timeout = timeout
+
+class PoolExhausted(Exception):
+    """No connection was returned to a full pool in time."""
+
+class ConnectionPool:
+    """Connections to one database, reused across connectors in this process.
+
+    Checkout takes the most recently returned connection, closing any that sat idle
+    longer than max_idle and pinging any idle longer than ping_after. When size
+    connections are out, checkout waits up to timeout for one to come back.
+    """
+    def __init__(self, label: str, open_connection: Callable, ping: Callable, reset: Callable,
+                 config: PoolConfig):
+        self.label = label
+        self.config = config
+        self._open = open_connection
+        self._ping = ping
+        self._reset = reset
+        self._idle = deque()  # (connection, returned at), most recent last
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        start = time.perf_counter()
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    # The oldest idle connections are at the left
+                    while self._idle and now - self._idle[0][1] > self.config.max_idle:
+                        stale.append(self._idle.popleft()[0])
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._in_use < self.config.size:
+                        connection, returned_at = None, None
+                        self._in_use += 1
+                        break
+                    remaining = self.config.timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        metrics.inc("nlsql_pool_rejections", pool=self.label)
+                        raise PoolExhausted(f"All {self.config.size} connections to '{self.label}' are in use")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                metrics.observe("nlsql_pool_in_use", self._in_use, metrics.POOL_BUCKETS, pool=self.label)
+                metrics.observe("nlsql_pool_waiting", self._waiting, metrics.POOL_BUCKETS, pool=self.label)
+        finally:
+            for old in stale:
+                metrics.inc("nlsql_pool_evictions", pool=self.label, reason="idle")
+                _close_quietly(old)
+
+        try:
+            if connection is not None and time.monotonic() - returned_at > self.config.ping_after:
+                try:
+                    self._ping(connection)
+                except Exception:
+                    metrics.inc("nlsql_pool_evictions", pool=self.label, reason="ping")
+                    _close_quietly(connection)
+                    connection = None
+            metrics.inc("nlsql_cache_requests", cache="db_pool", result="hit" if connection is not None else "miss")
+            if connection is None:
+                connection = self._open()
+        except BaseException:
+            self._discard()
+            raise
+        metrics.observe("nlsql_pool_wait_seconds", time.perf_counter() - start, pool=self.label)
+        return connection
+
+    def release(self, connection) -> None:
+        """Return a connection, rolling back anything left uncommitted."""
+        try:
+            self._reset(connection)
+        except Exception:
+            # A connection that can't be reset isn't handed out again
+            self.discard(connection)
+            return
+        with self._cond:
+            self._in_use -= 1
+            if not self._closed:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+        if self._closed:
+            _close_quietly(connection)
+
+    def discard(self, connection) -> None:
+        """Close a checked out connection instead of returning it."""
+        _close_quietly(connection)
+        self._discard()
+
+    def _discard(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Close the idle connections. Connections still out are closed when returned."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._closed = True
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+def _close_quietly(connection) -> None:
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+_config = PoolConfig()
+_pools: Dict[tuple, ConnectionPool] = {}
+_lock = threading.Lock()
+
+def configure_pools(config: PoolConfig) -> None:
+    """Replace the pool settings. Existing pools are closed so the new settings apply."""
+    global _config
+    with _lock:
+        if vars(config) == vars(_config):
+            return
+        _config = config
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def get_pool(key: tuple, label: str, open_connection: Callable, ping: Callable,
+             reset: Callable) -> ConnectionPool:
+    """The pool for a profile, created on first use.
+
+    key is the profile name plus everything used to connect, so an edited profile
+    gets a fresh pool. label names the pool in metrics.
+    """
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(label, open_connection, ping, reset, _config)
+        return pool
+
+def close_pools() -> None:
+    """Close every pool's idle connections."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
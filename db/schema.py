@@ -1,7 +1,63 @@
 import os
 import json
+import hashlib
 from pathlib import Path
 from datetime import datetime, date
+from utils import metrics
+from utils.tracing import span
+
+SCHEMA_CACHE_DIR = Path.home() / ".nlsql" / "schema_cache"
+
+# Parsed schema cache files, so a long-lived process (the daemon) reads each one once.
+# Keyed by cache file and sample data flag, and invalidated by the file's mtime.
+_parsed_schemas = {}
+
+def schema_fingerprint(schema):
+    """Stable hash of a schema's tables and sample data, used to key derived caches.
+
+    The fingerprint is stored in the schema dict (and so in the schema cache) so it
+    is only computed once per schema.
+    """
+    if isinstance(schema, dict):
+        if schema.get("fingerprint"):
+            return schema["fingerprint"]
+        payload = json.dumps([schema.get("tables", {}), schema.get("sample_data", {})], sort_keys=True, default=str)
+    else:
+        payload = json.dumps(schema, sort_keys=True, default=str)
+    fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    if isinstance(schema, dict):
+        schema["fingerprint"] = fingerprint
+    return fingerprint
+
+def table_columns(table_info):
+    """(name, type) pairs for a table's columns in any of the supported schema formats."""
+    columns = []
+    for col in table_info.get("columns") or []:
+        if isinstance(col, dict) and "Field" in col:
+            # MySQL format
+            columns.append((col['Field'], col.get('Type', 'unknown')))
+        elif isinstance(col, dict) and "column_name" in col:
+            # PostgreSQL format
+            columns.append((col['column_name'], col.get('data_type', 'unknown')))
+        elif isinstance(col, (tuple, list)) and len(col) >= 3:
+            # SQLite format (tuples become lists in the JSON cache)
+            columns.append((col[1], col[2]))
+    return columns
+
+def table_foreign_keys(table_info):
+    """(column, referenced table, referenced column) triples in any of the supported schema formats."""
+    foreign_keys = []
+    for fk in table_info.get("foreign_keys") or []:
+        if isinstance(fk, dict) and "COLUMN_NAME" in fk and "REFERENCED_TABLE_NAME" in fk:
+            # MySQL format
+            foreign_keys.append((fk['COLUMN_NAME'], fk['REFERENCED_TABLE_NAME'], fk['REFERENCED_COLUMN_NAME']))
+        elif isinstance(fk, dict) and "column_name" in fk and "referenced_table" in fk:
+            # PostgreSQL format
+            foreign_keys.append((fk['column_name'], fk['referenced_table'], fk['referenced_column']))
+        elif isinstance(fk, (tuple, list)) and len(fk) >= 5:
+            # SQLite format
+            foreign_keys.append((fk[3], fk[2], fk[4]))
+    return foreign_keys
 
 def extract_schema_from_mysql(connection):
     """Extract schema from a MySQL database."""
@@ -43,8 +99,11 @@ def extract_schema_from_postgresql(connection):
             SELECT column_name, data_type, is_nullable, column_default
             FROM information_schema.columns
             WHERE table_schema = 'public' AND table_name = '{table}'
+            ORDER BY ordinal_position
         """)
-        columns = cursor.fetchall()
+        # Keyed by name, the format table_columns reads as PostgreSQL's
+        names = [d[0] for d in cursor.description]
+        columns = [dict(zip(names, row)) for row in cursor.fetchall()]
         
         # Get foreign keys
         cursor.execute(f"""
@@ -58,9 +117,10 @@ def extract_schema_from_postgresql(connection):
                     ON tc.constraint_name = kcu.constraint_name
                 JOIN information_schema.constraint_column_usage AS ccu
                     ON ccu.constraint_name = tc.constraint_name
-            WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_name = '{table}'
+            WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_schema = 'public' AND tc.table_name = '{table}'
         """)
-        fks = cursor.fetchall()
+        names = [d[0] for d in cursor.description]
+        fks = [dict(zip(names, row)) for row in cursor.fetchall()]
         
         schema["tables"][table] = {
             "columns": columns,
@@ -81,11 +141,11 @@ def extract_schema_from_sqlite(connection):
     
     for table in tables:
         # Get columns
-        cursor.execute(f"PRAGMA table_info({table})")
+        cursor.execute(f'PRAGMA table_info("{table}")')
         columns = cursor.fetchall()
         
         # Get foreign keys
-        cursor.execute(f"PRAGMA foreign_key_list({table})")
+        cursor.execute(f'PRAGMA foreign_key_list("{table}")')
         fks = cursor.fetchall()
         
         schema["tables"][table] = {
@@ -100,7 +160,7 @@ def get_schema(database_connection, force_refresh=False, include_sample_data=Tru
     """Get database schema with caching. Optionally includes sample data."""
     # Include sample data flag controls whether to fetch sample rows from each table
     # Create cache directory
-    cache_dir = Path.home() / ".nlsql" / "schema_cache"
+    cache_dir = SCHEMA_CACHE_DIR
     cache_dir.mkdir(parents=True, exist_ok=True)
     
     # Generate cache key based on connection details
@@ -111,30 +171,46 @@ def get_schema(database_connection, force_refresh=False, include_sample_data=Tru
     # Use cached schema if available and not forcing refresh
     if cache_file.exists() and not force_refresh:
         try:
-            with open(cache_file, 'r') as f:
+            memo_key = (str(cache_file), include_sample_data)
+            mtime = cache_file.stat().st_mtime
+            memo = _parsed_schemas.get(memo_key)
+            if memo and memo[0] == mtime:
+                metrics.inc("nlsql_cache_requests", cache="schema", result="hit")
+                return memo[1]
+            with open(cache_file, 'r') as f, span("schema.cache_read"):
                 cached_schema = json.load(f)
-                # Add sample data if requested and not already in cache
-                if include_sample_data and "sample_data" not in cached_schema:
+            # Add sample data if requested and not already in cache
+            if include_sample_data and "sample_data" not in cached_schema:
+                with span("schema.sample_data"):
                     cached_schema["sample_data"] = extract_sample_data(database_connection)
-                return cached_schema
+                cached_schema.pop("fingerprint", None)
+            schema_fingerprint(cached_schema)
+            _parsed_schemas[memo_key] = (mtime, cached_schema)
+            metrics.inc("nlsql_cache_requests", cache="schema", result="hit")
+            return cached_schema
         except (json.JSONDecodeError, IOError):
             # If cache is corrupted, continue to regenerate
             pass
     
+    metrics.inc("nlsql_cache_requests", cache="schema", result="miss")
+    
     # Extract schema based on database type
     db_type = profile.get('type', 'MySQL')
-    if db_type == "MySQL":
-        schema = extract_schema_from_mysql(database_connection.connection)
-    elif db_type == "PostgreSQL":
-        schema = extract_schema_from_postgresql(database_connection.connection)
-    elif db_type == "SQLite":
-        schema = extract_schema_from_sqlite(database_connection.connection)
-    else:
-        schema = {"tables": {}}
+    with span("schema.extract", db_type=db_type):
+        if db_type == "MySQL":
+            schema = extract_schema_from_mysql(database_connection.connection)
+        elif db_type == "PostgreSQL":
+            schema = extract_schema_from_postgresql(database_connection.connection)
+        elif db_type == "SQLite":
+            schema = extract_schema_from_sqlite(database_connection.connection)
+        else:
+            schema = {"tables": {}}
     
     # Add sample data if requested
     if include_sample_data:
-        schema["sample_data"] = extract_sample_data(database_connection)
+        with span("schema.sample_data"):
+            schema["sample_data"] = extract_sample_data(database_connection)
+    schema_fingerprint(schema)
     
     # Cache the schema
     try:
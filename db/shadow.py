@@ -0,0 +1,133 @@
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from db.schema import schema_fingerprint, table_columns
+
+# Errors that mean the query references something the schema doesn't have.
+# Other errors may just be dialect differences between SQLite and the real database.
+NAME_ERRORS = ("no such table", "no such column")
+MAX_SHADOWS = 16
+# SQLite's default limit on attached databases
+MAX_ATTACHED = 10
+
+# Empty in-memory copies of schemas keyed by fingerprint
+_shadows: Dict[str, sqlite3.Connection] = {}
+_lock = threading.Lock()
+
+def _quote(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+def _shadow_tables(schema: Dict) -> Optional[List[Tuple[str, str]]]:
+    """(table, quoted column list) for each table, or None if some table's columns are unknown."""
+    tables = schema.get("tables") if isinstance(schema, dict) else None
+    if not isinstance(tables, dict) or not tables:
+        return None
+    shadow_tables = []
+    for table, table_info in tables.items():
+        columns = table_columns(table_info) if isinstance(table_info, dict) else []
+        if not columns:
+            return None
+        shadow_tables.append((table, ", ".join(_quote(name) for name, _ in columns)))
+    return shadow_tables
+
+def _create_tables(connection: sqlite3.Connection, shadow_tables: List[Tuple[str, str]], database: str = "main") -> None:
+    for table, column_list in shadow_tables:
+        connection.execute(f"CREATE TABLE {_quote(database)}.{_quote(table)} ({column_list})")
+
+def build_shadow(schema: Dict) -> Optional[sqlite3.Connection]:
+    """Create an empty in-memory SQLite database with the schema's tables and columns.
+
+    Column types are left out since only names matter for validation. Returns None
+    when the schema doesn't list the columns of every table.
+    """
+    shadow_tables = _shadow_tables(schema)
+    if shadow_tables is None:
+        return None
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    try:
+        _create_tables(connection, shadow_tables)
+    except sqlite3.Error:
+        connection.close()
+        return None
+    return connection
+
+def _attach_qualifier(shadow: sqlite3.Connection, schema: Dict, message: str) -> Optional[str]:
+    """Attach a copy of the schema under the qualifier of a schema-qualified table name.
+
+    "no such table: public.orders" for a known table means the query qualified it with
+    its schema (PostgreSQL) or database (MySQL), which the shadow lacks. Returns the
+    qualifier if a copy was attached, so the query is worth preparing again.
+    """
+    match = re.match(r"no such table: ([^.]+)\.(.+)$", message)
+    shadow_tables = _shadow_tables(schema)
+    if not match or shadow_tables is None:
+        return None
+    qualifier, table = match.groups()
+    if table.lower() not in {name.lower() for name, _ in shadow_tables}:
+        return None
+    attached = {row[1].lower() for row in shadow.execute("PRAGMA database_list")}
+    if qualifier.lower() in attached or len(attached) > MAX_ATTACHED:
+        return None
+    try:
+        shadow.execute(f"ATTACH DATABASE ':memory:' AS {_quote(qualifier)}")
+    except sqlite3.Error:
+        return None
+    try:
+        _create_tables(shadow, shadow_tables, qualifier)
+    except sqlite3.Error:
+        shadow.execute(f"DETACH DATABASE {_quote(qualifier)}")
+        return None
+    return qualifier
+
+def get_shadow(schema: Dict) -> Optional[sqlite3.Connection]:
+    """The shadow database for a schema, built once per fingerprint."""
+    fingerprint = schema_fingerprint(schema)
+    if fingerprint in _shadows:
+        return _shadows[fingerprint]
+    shadow = build_shadow(schema)
+    if len(_shadows) >= MAX_SHADOWS:
+        # None is cached too, for schemas that can't be shadowed
+        evicted = _shadows.pop(next(iter(_shadows)))
+        if evicted is not None:
+            evicted.close()
+    _shadows[fingerprint] = shadow
+    return shadow
+
+def validate_sql(sql: str, schema: Dict, db_type: str = "SQLite") -> Optional[str]:
+    """Check a query against an empty shadow of the schema without touching the database.
+
+    The statement is prepared with EXPLAIN, which catches unknown tables and columns
+    and, for SQLite databases, syntax errors. Tables qualified with a schema or database
+    name (public.orders) are looked up in the schema's tables. Returns the error message, or None if
+    the query looks valid or can't be checked (dialect-specific syntax, unknown schema).
+    """
+    sql = sql.strip().rstrip(";").strip()
+    if not sql:
+        return "Empty query"
+    with _lock:
+        shadow = get_shadow(schema)
+        if shadow is None:
+            return None
+        # Qualifiers are attached for this query only, since the shadow is shared by profiles
+        attached = []
+        try:
+            while True:
+                try:
+                    shadow.execute(f"EXPLAIN {sql}")
+                except sqlite3.OperationalError as e:
+                    message = str(e)
+                    qualifier = _attach_qualifier(shadow, schema, message) if db_type != "SQLite" else None
+                    if qualifier:
+                        attached.append(qualifier)
+                        continue
+                    if db_type == "SQLite" or message.startswith(NAME_ERRORS):
+                        return message
+                except sqlite3.Error:
+                    # e.g. several statements at once
+                    pass
+                return None
+        finally:
+            for qualifier in attached:
+                shadow.execute(f"DETACH DATABASE {_quote(qualifier)}")
@@ -0,0 +1,265 @@
+"""Optional long-lived nlsql process and the thin client that forwards commands to it.
+
+This module is the console entry point. It only uses the standard library until it
+knows the daemon can't take the command, so forwarded commands skip importing
+pandas, database drivers and the rest of the CLI.
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+SOCKET_PATH = Path.home() / ".nlsql" / "daemon.sock"
+
+# Commands that are safe to run inside the daemon (non-interactive)
+FORWARDED_COMMANDS = {"query", "run", "describe", "list"}
+# Options that need the terminal (editing), so they always run locally
+LOCAL_OPTIONS = {"--edit", "-e"}
+CONNECT_TIMEOUT = 0.2
+# Environment variables commands read as they run; the client's values are applied in the daemon
+FORWARDED_ENV = ("NLSQL_REPLAY_MODE", "GEMINI_API_KEY")
+# Read once when the process starts, so a client with a different value runs the command itself
+STARTUP_ENV = ("NLSQL_METRICS",)
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+def _receive(sock_file):
+    line = sock_file.readline()
+    return json.loads(line) if line else None
+
+def should_forward(argv):
+    """Whether these CLI arguments can be handled by a running daemon."""
+    if os.environ.get("NLSQL_NO_DAEMON") or not hasattr(socket, "AF_UNIX"):
+        return False
+    if not argv or argv[0] not in FORWARDED_COMMANDS:
+        return False
+    return not LOCAL_OPTIONS.intersection(argv) and "--help" not in argv
+
+def forward(argv, socket_path=SOCKET_PATH):
+    """Run a command in the daemon and return its exit code, or None if no daemon is listening."""
+    if not Path(socket_path).exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(str(socket_path))
+        sock.settimeout(None)
+        env = {name: os.environ.get(name) for name in FORWARDED_ENV + STARTUP_ENV}
+        _send(sock, {"argv": argv, "cwd": os.getcwd(), "env": env})
+        with sock.makefile("r", encoding="utf-8") as sock_file:
+            received = False
+            while True:
+                message = _receive(sock_file)
+                if message is None:
+                    # Daemon went away: rerun locally unless it already printed something
+                    return 1 if received else None
+                if message.get("local"):
+                    return None
+                received = True
+                if "stdout" in message:
+                    sys.stdout.write(message["stdout"])
+                    sys.stdout.flush()
+                if "stderr" in message:
+                    sys.stderr.write(message["stderr"])
+                    sys.stderr.flush()
+                if "exit" in message:
+                    return message["exit"]
+    except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+        return None
+    except KeyboardInterrupt:
+        # Stop the daemon's statement too, instead of leaving it running
+        _request(socket_path, {"cancel": True})
+        sys.stderr.write("\nAborted!\n")
+        return 130
+    finally:
+        sock.close()
+
+def main():
+    """Console entry point: forward to the daemon when possible, else run the CLI here."""
+    argv = sys.argv[1:]
+    if should_forward(argv):
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+    from cli import app
+    app()
+
+@contextlib.contextmanager
+def client_environment(env):
+    """Apply the client's values of FORWARDED_ENV for the duration of a command."""
+    saved = {name: os.environ.get(name) for name in FORWARDED_ENV}
+
+    def apply(values):
+        for name in FORWARDED_ENV:
+            if values.get(name) is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = values[name]
+
+    apply(env)
+    try:
+        yield
+    finally:
+        apply(saved)
+
+class _ClientStream(io.TextIOBase):
+    """Sends each write to the client straight away, so streamed output arrives as it is printed."""
+    def __init__(self, conn, name, lock):
+        self.conn = conn
+        self.name = name
+        self.lock = lock
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            # Like any text stream; click probes with b"" to tell binary streams apart
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            # The client is gone if it was interrupted; the command still runs to the end
+            with self.lock, contextlib.suppress(OSError):
+                _send(self.conn, {self.name: text})
+        return len(text)
+
+def run_command(command, argv, stdout, stderr):
+    """Run one CLI command in this process, writing its output to stdout and stderr; returns the exit code."""
+    import typer
+
+    code = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        stdin = sys.stdin
+        # No terminal here: an empty answer takes a prompt's default (e.g. "Execute anyway?"
+        # is answered no), and prompts without one see end of input and abort
+        sys.stdin = io.StringIO("\n")
+        try:
+            result = command.main(args=argv, prog_name="nlsql", standalone_mode=False)
+            code = result if isinstance(result, int) else 0
+        except typer.Abort:
+            stderr.write("Aborted!\n")
+            code = 1
+        except Exception as e:
+            if hasattr(e, "show"):
+                # Usage errors
+                e.show()
+            else:
+                traceback.print_exc()
+            code = getattr(e, "exit_code", 1)
+        finally:
+            sys.stdin = stdin
+    return code
+
+def serve(socket_path=SOCKET_PATH, on_ready=None):
+    """Run the daemon until it receives a shutdown request.
+
+    Commands run one at a time in this process, so imports, HTTP sessions, database
+    pools, parsed schemas and rendered prompt sections stay warm between them.
+    """
+    import typer
+    from cli import app
+    from utils import metrics
+
+    command = typer.main.get_command(app)
+    socket_path = Path(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    if socket_path.exists():
+        if forward_ping(socket_path):
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        socket_path.unlink()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Created owner-only: a chmod after bind() leaves a window with the default permissions
+    umask = os.umask(0o177)
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(umask)
+    server.listen(16)
+    run_lock = threading.Lock()
+    stopping = threading.Event()
+
+    def handle(conn):
+        with conn, conn.makefile("r", encoding="utf-8") as conn_file:
+            request = _receive(conn_file)
+            if not request:
+                return
+            if request.get("ping"):
+                _send(conn, {"pong": True, "pid": os.getpid()})
+                return
+            if request.get("cancel"):
+                # A client was interrupted; its command is the one running
+                from db.connector import cancel_running
+                _send(conn, {"cancelled": cancel_running()})
+                return
+            if request.get("shutdown"):
+                stopping.set()
+                _send(conn, {"exit": 0})
+                # Wake up accept()
+                with contextlib.suppress(OSError), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as wake:
+                    wake.connect(str(socket_path))
+                return
+            env = request.get("env") or {}
+            if any(env.get(name) != os.environ.get(name) for name in STARTUP_ENV):
+                _send(conn, {"local": True})
+                return
+            send_lock = threading.Lock()
+            with run_lock:
+                cwd = os.getcwd()
+                try:
+                    os.chdir(request.get("cwd") or cwd)
+                    with client_environment(env):
+                        code = run_command(command, request.get("argv", []),
+                                                 _ClientStream(conn, "stdout", send_lock),
+                                                 _ClientStream(conn, "stderr", send_lock))
+                finally:
+                    os.chdir(cwd)
+                    # The daemon never exits between commands, so flush as it goes
+                    metrics.get_registry().maybe_flush()
+            with send_lock, contextlib.suppress(OSError):
+                _send(conn, {"exit": code})
+
+    if on_ready:
+        on_ready(socket_path)
+    try:
+        while not stopping.is_set():
+            conn, _ = server.accept()
+            if stopping.is_set():
+                conn.close()
+                break
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            socket_path.unlink()
+
+def forward_ping(socket_path=SOCKET_PATH):
+    """The daemon's pid if one is listening, else None."""
+    return _request(socket_path, {"ping": True}).get("pid")
+
+def request_shutdown(socket_path=SOCKET_PATH):
+    """Ask a running daemon to exit. Returns False if none was listening."""
+    return "exit" in _request(socket_path, {"shutdown": True})
+
+def _request(socket_path, message):
+    if not hasattr(socket, "AF_UNIX") or not Path(socket_path).exists():
+        return {}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT * 5)
+        sock.connect(str(socket_path))
+        _send(sock, message)
+        with sock.makefile("r", encoding="utf-8") as sock_file:
+            return _receive(sock_file) or {}
+    except (OSError, ValueError):
+        return {}
+    finally:
+        sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+# Create a CLI app
+app = typer.Typer(help="Load generator for the nlsql HTTP API")
+
+# Questions that make sense against the test database (nlsql setup-test-db)
+DEFAULT_QUESTIONS = [
+    "how many users are there",
+    "show the 10 most recent orders",
+    "total revenue per product category",
+    "which users placed more than 3 orders",
+    "average order value by month",
+    "top 5 products by units sold",
+    "list products that are out of stock",
+    "how many orders were shipped",
+]
+TEST_PROFILE = "test_db"
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def load_questions(path: Optional[str]) -> List[str]:
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(Path(path).expanduser(), 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def post(url: str, body: Dict, timeout: float):
+    """POST JSON and return (status, response body, ms)."""
+    data = json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    except OSError as e:
+        return 0, {"error": str(e)}, (time.perf_counter() - start) * 1000
+    try:
+        result = json.loads(payload or b"{}")
+    except ValueError:
+        result = {}
+    return status, result, (time.perf_counter() - start) * 1000
+
+def run_load(url: str, endpoint: str, questions: List[str], requests: int, concurrency: int,
+             profile: Optional[str] = None, no_cache: bool = False, timeout: float = 60.0) -> Dict:
+    """Send requests questions (round robin) from concurrency threads and summarize the results."""
+    latencies = []
+    statuses: Dict[int, int] = {}
+    coalesced = 0
+    lock = threading.Lock()
+
+    def one(i: int):
+        nonlocal coalesced
+        body = {"question": questions[i % len(questions)], "no_cache": no_cache}
+        if profile:
+            body["profile"] = profile
+        status, result, ms = post(f"{url.rstrip('/')}/{endpoint}", body, timeout)
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(ms)
+                coalesced += bool(result.get("coalesced"))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 1) if elapsed else 0.0,
+        "statuses": statuses,
+        "coalesced": coalesced,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+def start_local_stack(latency_ms: float, workers: int, queue_size: int):
+    """Start a mock LLM and an API server on free ports, translating against the test database.
+
+    Returns (api url, stop function).
+    """
+    from scripts.mock_llm_server import create_server as create_mock_server
+    from server.api import create_server, close_server
+    from server.service import NLSQLService
+    from utils.config import PROFILES_DIR
+
+    if not (PROFILES_DIR / f"{TEST_PROFILE}.json").exists():
+        from scripts.setup_test_db import setup
+        setup()
+
+    mock = create_mock_server(port=0, latency_ms=latency_ms, default_sql="SELECT COUNT(*) FROM users;")
+    mock_url = f"http://127.0.0.1:{mock.server_address[1]}"
+    # A model name of its own keeps health records and cache entries apart from real ones
+    config = {
+        "ai_provider": {"name": "openai", "api_key": "mock-key-0000000000000000", "model": "mock", "base_url": mock_url}
+    }
+    api = create_server(port=0, service=NLSQLService(config), workers=workers, queue_size=queue_size)
+    for server in (mock, api):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        for server in (api, mock):
+            server.shutdown()
+        close_server(api)
+        mock.server_close()
+
+    return f"http://127.0.0.1:{api.server_address[1]}", stop
+
+@app.command()
+def main(
+    url: str = typer.Option("http://127.0.0.1:8750", help="Base URL of a running 'nlsql serve'"),
+    endpoint: str = typer.Option("query", help="Endpoint to load: translate or query"),
+    requests: int = typer.Option(200, "--requests", "-n", help="Total number of requests"),
+    concurrency: int = typer.Option(16, "--concurrency", "-c", help="Concurrent clients"),
+    questions: Optional[str] = typer.Option(None, help="File with one question per line"),
+    profile: Optional[str] = typer.Option(None, help="Profile to send with each request"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Bypass the translation cache (always on with --local)"),
+    local: bool = typer.Option(False, "--local", help="Start a mock LLM and an API server on the test database"),
+    latency_ms: float = typer.Option(200.0, help="Mock LLM latency with --local"),
+    workers: int = typer.Option(8, help="API workers with --local"),
+    queue_size: int = typer.Option(32, help="API queue size with --local")
+):
+    """Send concurrent requests to the API and report throughput and latency percentiles"""
+    stop = None
+    if local:
+        url, stop = start_local_stack(latency_ms, workers, queue_size)
+        profile = profile or TEST_PROFILE
+        no_cache = True
+        typer.echo(f"Local API on {url} ({workers} workers, queue {queue_size}, mock LLM latency {latency_ms:g} ms)")
+    try:
+        summary = run_load(url, endpoint, load_questions(questions), requests, concurrency, profile, no_cache)
+    finally:
+        if stop:
+            stop()
+    typer.echo(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,236 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import typer
+
+from ai.health import PROBE_PROMPT
+
+# Create a CLI app
+app = typer.Typer(help="Local mock LLM server for offline benchmarking")
+
+# Constants
+DEFAULT_PORT = 8765
+DEFAULT_SQL = "SELECT 1;"
+CHUNK_SIZE = 8  # characters per streamed delta
+MAX_SEEN_PROMPTS = 32  # earlier prompts the simulated prefix cache compares against
+
+def load_fixtures(path: Optional[str]) -> List[dict]:
+    """Load response fixtures: a JSON list of {"match": text, "sql": text, "status": code}.
+
+    The first fixture whose match text appears in the prompt is used.
+    """
+    if not path:
+        return []
+    with open(Path(path).expanduser(), 'r') as f:
+        fixtures = json.load(f)
+    if isinstance(fixtures, dict):
+        fixtures = [{"match": match, "sql": sql} for match, sql in fixtures.items()]
+    return fixtures
+
+def extract_prompt(payload: dict) -> str:
+    """Pull the prompt text out of an OpenAI, Anthropic or Gemini request body."""
+    if "contents" in payload:
+        return "".join(part.get("text", "") for content in payload["contents"] for part in content.get("parts", []))
+    texts = []
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            texts.extend(block.get("text", "") for block in content if isinstance(block, dict))
+        else:
+            texts.append(str(content))
+    system = payload.get("system")
+    if isinstance(system, list):
+        texts.extend(block.get("text", "") for block in system if isinstance(block, dict))
+    elif system:
+        texts.append(str(system))
+    return "\n".join(texts)
+
+def cached_prefix_tokens(prompt: str, seen_prompts: List[str]) -> int:
+    """Simulated prefix cache: tokens shared with the longest matching earlier prompt."""
+    best = 0
+    for seen in seen_prompts:
+        common = len(os.path.commonprefix([prompt, seen]))
+        best = max(best, common)
+    return best // 4
+
+def anthropic_cache_usage(payload: dict, seen_blocks: set) -> Tuple[int, int]:
+    """Simulated (cache read, cache write) tokens for content blocks marked with cache_control."""
+    read = written = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if isinstance(block, dict) and block.get("cache_control"):
+                tokens = len(block.get("text", "")) // 4
+                if block.get("text") in seen_blocks:
+                    read += tokens
+                else:
+                    seen_blocks.add(block.get("text"))
+                    written += tokens
+    return read, written
+
+def make_handler(fixtures: List[dict], latency_ms: float, jitter_ms: float, chunk_delay_ms: float,
+                 error_rate: float, default_sql: str):
+    """Build a request handler class bound to the server settings."""
+    seen_prompts: List[str] = []
+    seen_blocks: set = set()
+    cache_lock = threading.Lock()
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, events: List[str]):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for event in events:
+                    data = f"data: {event}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                    if chunk_delay_ms:
+                        time.sleep(chunk_delay_ms / 1000)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client stopped reading once the SQL was complete
+
+        def _answer(self, prompt: str):
+            for fixture in fixtures:
+                if fixture.get("match", "") in prompt:
+                    return fixture.get("status", 200), fixture.get("sql", default_sql)
+            return 200, default_sql
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+
+            delay = latency_ms + random.uniform(-jitter_ms, jitter_ms) if jitter_ms else latency_ms
+            time.sleep(max(delay, 0) / 1000)
+
+            prompt = extract_prompt(payload)
+            status, sql = self._answer(prompt)
+            if status == 200 and error_rate and random.random() < error_rate:
+                status = 503
+            if status != 200:
+                self._send_json(status, {"error": {"type": "mock_error", "message": f"Injected status {status}"}})
+                return
+
+            # Answer health probes the way a real model would
+            text = "success" if prompt.strip() == PROBE_PROMPT else f"```sql\n{sql}\n```"
+            chunks = [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+            usage_in = len(prompt) // 4
+            usage_out = len(text) // 4
+            with cache_lock:
+                cached = cached_prefix_tokens(prompt, seen_prompts)
+                seen_prompts.append(prompt)
+                del seen_prompts[:-MAX_SEEN_PROMPTS]
+                cache_read, cache_write = anthropic_cache_usage(payload, seen_blocks)
+            anthropic_usage = {"input_tokens": usage_in - cache_read - cache_write, "output_tokens": usage_out,
+                               "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_write}
+
+            if self.path.startswith("/v1/chat/completions"):
+                if payload.get("stream"):
+                    events = [json.dumps({"choices": [{"index": 0, "delta": {"content": c}}]}) for c in chunks]
+                    events.append(json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+                    if payload.get("stream_options", {}).get("include_usage"):
+                        events.append(json.dumps({"choices": [], "usage": {
+                            "prompt_tokens": usage_in, "completion_tokens": usage_out,
+                            "total_tokens": usage_in + usage_out,
+                            "prompt_tokens_details": {"cached_tokens": cached}}}))
+                    self._stream(events + ["[DONE]"])
+                else:
+                    self._send_json(200, {
+                        "object": "chat.completion",
+                        "model": payload.get("model", ""),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": usage_in, "completion_tokens": usage_out,
+                                  "total_tokens": usage_in + usage_out,
+                                  "prompt_tokens_details": {"cached_tokens": cached}}
+                    })
+            elif self.path.startswith("/v1/messages"):
+                if payload.get("stream"):
+                    events = [json.dumps({"type": "message_start", "message": {"usage": anthropic_usage}})]
+                    events += [json.dumps({"type": "content_block_delta", "index": 0,
+                                           "delta": {"type": "text_delta", "text": c}}) for c in chunks]
+                    events.append(json.dumps({"type": "message_stop"}))
+                    self._stream(events)
+                else:
+                    self._send_json(200, {
+                        "type": "message",
+                        "role": "assistant",
+                        "model": payload.get("model", ""),
+                        "content": [{"type": "text", "text": text}],
+                        "stop_reason": "end_turn",
+                        "usage": anthropic_usage
+                    })
+            elif re.match(r"^/v1beta/models/[^/:]+:(generateContent|streamGenerateContent)", self.path):
+                usage = {"promptTokenCount": usage_in, "candidatesTokenCount": usage_out,
+                         "cachedContentTokenCount": cached}
+                if ":streamGenerateContent" in self.path:
+                    events = [json.dumps({"candidates": [{"content": {"role": "model", "parts": [{"text": c}]}}],
+                                          "usageMetadata": usage}) for c in chunks]
+                    self._stream(events)
+                else:
+                    self._send_json(200, {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                        "usageMetadata": usage
+                    })
+            else:
+                self._send_json(404, {"error": {"type": "not_found", "message": f"Unknown endpoint {self.path}"}})
+
+    return MockLLMHandler
+
+def create_server(host: str = "127.0.0.1", port: int = DEFAULT_PORT, fixtures: Optional[List[dict]] = None,
+                  latency_ms: float = 0.0, jitter_ms: float = 0.0, chunk_delay_ms: float = 0.0,
+                  error_rate: float = 0.0, default_sql: str = DEFAULT_SQL) -> ThreadingHTTPServer:
+    """Create (but don't start) a mock server. Use port 0 to pick a free port."""
+    handler = make_handler(fixtures or [], latency_ms, jitter_ms, chunk_delay_ms, error_rate, default_sql)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(DEFAULT_PORT, help="Port to listen on"),
+    latency_ms: float = typer.Option(0.0, help="Delay before each response"),
+    jitter_ms: float = typer.Option(0.0, help="Random +/- variation of the delay"),
+    chunk_delay_ms: float = typer.Option(0.0, help="Delay between streamed chunks"),
+    error_rate: float = typer.Option(0.0, help="Fraction of requests answered with HTTP 503"),
+    fixtures: Optional[str] = typer.Option(None, help="JSON file of prompt matches and SQL responses"),
+    default_sql: str = typer.Option(DEFAULT_SQL, help="SQL returned when no fixture matches")
+):
+    """Serve OpenAI, Anthropic and Gemini compatible endpoints"""
+    server = create_server(host, port, load_fixtures(fixtures), latency_ms, jitter_ms, chunk_delay_ms,
+                           error_rate, default_sql)
+    address = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    typer.echo(f"Mock LLM server listening on {address}")
+    typer.echo(f'Point a provider at it by setting "base_url": "{address}" under ai_provider in ~/.nlsql/config.json')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        typer.echo("\nStopping mock server")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    app()
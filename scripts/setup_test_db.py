@@ -199,6 +199,7 @@ def setup(db_path: Optional[str] = None, users: int = 50, products: int = 100, o
     try:
         # Import locally to avoid circular imports
         from utils.config import save_profile, set_active_profile, get_active_profile
+        from db.connector import SQLITE_TUNING
         
         profile_name = "test_db"
         profile = {
@@ -208,7 +209,8 @@ def setup(db_path: Optional[str] = None, users: int = 50, products: int = 100, o
             "port": "",
             "username": "",
             "password": "",
-            "options": ""
+            "options": "",
+            **SQLITE_TUNING
         }
         
         save_profile(profile_name, profile)
@@ -0,0 +1,153 @@
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import typer
+
+from .setup_test_db import create_tables, generate_fake_data
+
+# Create a CLI app
+app = typer.Typer(help="Read throughput of SQLite profile settings on a generated test database")
+
+DEFAULT_BENCH_DB = Path.home() / ".nlsql" / "bench_db.sqlite"
+
+# Read workloads against the test schema: full scans, a join, a sort spill and point lookups
+QUERIES = {
+    "scan": "SELECT status, COUNT(*) AS orders, SUM(total_amount) AS revenue FROM orders GROUP BY status",
+    "join": ("SELECT p.category_id, SUM(oi.quantity * oi.price) AS revenue FROM order_items oi "
+             "JOIN products p ON p.product_id = oi.product_id GROUP BY p.category_id"),
+    "top_users": "SELECT user_id, SUM(total_amount) AS spent FROM orders GROUP BY user_id ORDER BY spent DESC LIMIT 10",
+    "lookup": "SELECT * FROM orders WHERE order_id = {order_id}",
+}
+
+def bench_settings() -> Dict[str, Dict]:
+    """Profile settings to compare, from SQLite's defaults to an immutable snapshot.
+
+    in_memory adds a 64 MiB page cache and in-memory temporary storage to the suggested tuning.
+    """
+    from db.connector import SQLITE_TUNING
+    return {
+        "default": {"journal_mode": "delete"},
+        "tuned": dict(SQLITE_TUNING),
+        "in_memory": dict(SQLITE_TUNING, cache_size=-65536, temp_store="memory"),
+        "readonly": dict(SQLITE_TUNING, sqlite_mode="readonly"),
+        "immutable": dict(SQLITE_TUNING, sqlite_mode="immutable"),
+    }
+
+def build_database(path: Path, users: int, orders: int) -> None:
+    """Generate the test schema with users and orders (about three order items each)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    random.seed(0)
+    conn = sqlite3.connect(str(path))
+    create_tables(conn)
+    generate_fake_data(conn, num_users=users, num_products=100, num_orders=orders)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def count_rows(path: Path) -> Dict[str, int]:
+    conn = sqlite3.connect(str(path))
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+def run_workload(profile: Dict, sql: str, max_order_id: int, threads: int, seconds: float) -> Dict:
+    """Run one query from threads threads for seconds seconds, each execution on a pooled connection."""
+    from db.connector import DBConnector, collect_rows
+
+    counts = {"queries": 0, "rows": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        queries = rows = 0
+        while True:
+            connector = DBConnector.create_connector(profile)
+            try:
+                connector.connect()
+                batches, _ = connector.execute_stream(sql.format(order_id=random.randint(1, max_order_id)))
+                result, _ = collect_rows(batches, connector.max_rows)
+            finally:
+                connector.close()
+            queries += 1
+            rows += len(result)
+            if time.perf_counter() >= deadline:
+                break
+        with lock:
+            counts["queries"] += queries
+            counts["rows"] += rows
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"queries": counts["queries"], "per_second": counts["queries"] / elapsed if elapsed else 0.0}
+
+@app.command()
+def main(
+    db_path: Path = typer.Option(DEFAULT_BENCH_DB, help="Benchmark database, generated if missing"),
+    users: int = typer.Option(20000, help="Users to generate"),
+    orders: int = typer.Option(400000, help="Orders to generate (about three order items each)"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="Regenerate the database even if it exists"),
+    threads: int = typer.Option(4, "--threads", "-t", help="Concurrent readers"),
+    seconds: float = typer.Option(2.0, help="Seconds to run each query per setting and round"),
+    rounds: int = typer.Option(3, help="Rounds to run; each setting reports its best"),
+    settings: List[str] = typer.Option(None, "--setting", "-s", help="Settings to compare (default: all)"),
+    queries: List[str] = typer.Option(None, "--query", "-q", help="Queries to run (default: all)")
+):
+    """Compare read throughput of SQLite profile settings on a 1M+ row test database"""
+    from db.pool import close_pools
+
+    if rebuild or not db_path.exists():
+        typer.echo(f"Generating {users} users and {orders} orders in {db_path}...")
+        start = time.perf_counter()
+        build_database(db_path, users, orders)
+        typer.echo(f"Generated in {time.perf_counter() - start:.1f} s")
+    rows = count_rows(db_path)
+    typer.echo(f"{sum(rows.values())} rows ({', '.join(f'{table}: {n}' for table, n in rows.items())}), "
+               f"{db_path.stat().st_size / 2 ** 20:.0f} MiB")
+
+    all_settings = bench_settings()
+    selected = {name: all_settings[name] for name in (settings or all_settings)}
+    workloads = {name: QUERIES[name] for name in (queries or QUERIES)}
+    results: Dict[str, Dict[str, Dict]] = {name: {} for name in selected}
+    # Settings take turns each round and keep their best run, so background noise
+    # doesn't favour whichever setting ran in a quiet moment
+    for round_number in range(1, rounds + 1):
+        for name, values in selected.items():
+            profile = {"name": f"sqlite_bench_{name}", "type": "SQLite", "database": str(db_path), **values}
+            # journal_mode sticks to the file, so each setting starts from a clean pool
+            close_pools()
+            for query, sql in workloads.items():
+                # One untimed run warms the OS page cache and the pool
+                run_workload(profile, sql, rows.get("orders", 1), 1, 0)
+                result = run_workload(profile, sql, rows.get("orders", 1), threads, seconds)
+                typer.echo(f"round {round_number} {name:<10} {query:<10} {result['per_second']:>10.1f} queries/s")
+                best = results[name].get(query)
+                if best is None or result["per_second"] > best["per_second"]:
+                    results[name][query] = result
+    close_pools()
+
+    # Best throughput per setting, relative to the first one
+    baseline = next(iter(results.values()))
+    typer.echo(f"\n{'Query':<10} " + " ".join(f"{name:>18}" for name in results))
+    for query in workloads:
+        cells = []
+        for name in results:
+            per_second = results[name][query]["per_second"]
+            base = baseline[query]["per_second"]
+            cells.append(f"{per_second:>9.1f} ({per_second / base if base else 0:>4.2f}x)")
+        typer.echo(f"{query:<10} " + " ".join(f"{cell:>18}" for cell in cells))
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,197 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from ai.transport import CallCancelled, CancelScope
+from server.service import NLSQLService, ServiceError, DEFAULT_MAX_ROWS
+from utils import metrics
+
+DEFAULT_PORT = 8750
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_REQUEST_TIMEOUT = 60.0
+MAX_BODY_BYTES = 1024 * 1024
+
+class QueueFull(Exception):
+    pass
+
+class WorkerPool:
+    """Fixed pool of worker threads with a bounded queue.
+
+    Work beyond the running workers waits in the queue; once that is full too,
+    submit raises QueueFull instead of letting requests pile up.
+    """
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nlsql-worker")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Requests running or queued."""
+        return self._pending
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            metrics.inc("nlsql_pool_rejections", pool="api_workers")
+            raise QueueFull()
+        with self._lock:
+            self._pending += 1
+            pending = self._pending
+        # Utilization as seen by each request: busy workers, and requests waiting for one
+        metrics.observe("nlsql_pool_in_use", min(pending, self.workers), metrics.POOL_BUCKETS, pool="api_workers")
+        metrics.observe("nlsql_pool_waiting", max(pending - self.workers, 0), metrics.POOL_BUCKETS, pool="api_workers")
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                self._slots.release()
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            # Shutting down
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Let bursts of clients connect and get a 429 rather than a refused connection
+    request_queue_size = 128
+
+def make_handler(service: NLSQLService, pool: WorkerPool, request_timeout: float):
+    """Build a request handler class bound to the service and worker pool."""
+    def run_translate(body: Dict) -> Dict:
+        return service.translate(body.get("question", ""), body.get("profile"), bool(body.get("no_cache")))
+
+    def request_timeout_for(body: Dict) -> float:
+        return min(float(body.get("timeout", request_timeout)), request_timeout)
+
+    def run_execute(body: Dict) -> Dict:
+        return service.execute(body.get("sql", ""), body.get("profile"), int(body.get("max_rows", DEFAULT_MAX_ROWS)),
+                               request_timeout_for(body))
+
+    def run_query(body: Dict) -> Dict:
+        return service.query(body.get("question", ""), body.get("profile"),
+                             int(body.get("max_rows", DEFAULT_MAX_ROWS)), bool(body.get("no_cache")),
+                             request_timeout_for(body))
+
+    routes = {"/translate": run_translate, "/execute": run_execute, "/query": run_query}
+
+    def run_cancellable(route: Callable, body: Dict, scope: CancelScope) -> Dict:
+        # A request that timed out while queued doesn't start at all
+        if scope.cancelled:
+            raise CallCancelled("Call cancelled")
+        with scope:
+            return route(body)
+
+    class APIHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # Keep load test output clean
+
+        def _send_json(self, status: int, body: Dict):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self, status: int, message: str):
+            self._send_json(status, {"error": message})
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "workers": pool.workers, "queue_size": pool.queue_size,
+                                      "pending": pool.pending})
+            elif self.path == "/metrics":
+                data = metrics.render_openmetrics(metrics.get_registry().snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._error(404, f"Unknown endpoint {self.path}")
+
+        def do_POST(self):
+            route = routes.get(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_BODY_BYTES:
+                self._error(413, "Request body too large")
+                return
+            raw = self.rfile.read(length)
+            if route is None:
+                self._error(404, f"Unknown endpoint {self.path}")
+                return
+            try:
+                body = json.loads(raw or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("expected a JSON object")
+                timeout = request_timeout_for(body)
+            except (TypeError, ValueError) as e:
+                self._error(400, f"Invalid request body: {str(e)}")
+                return
+
+            scope = CancelScope()
+            try:
+                future = pool.submit(run_cancellable, route, body, scope)
+            except QueueFull:
+                self._error(429, "Server busy, try again later")
+                return
+            except RuntimeError:
+                self._error(503, "Server is shutting down")
+                return
+            try:
+                with metrics.timer("nlsql_api_request_seconds", endpoint=self.path):
+                    result = future.result(timeout=timeout)
+                self._send_json(200, result)
+            except FutureTimeoutError:
+                # Close the worker's provider connections so it stops instead of finishing unseen
+                scope.cancel()
+                self._error(504, f"Timed out after {timeout:g} s")
+            except ServiceError as e:
+                self._error(e.status, str(e))
+            except (TypeError, ValueError) as e:
+                self._error(400, str(e))
+            except Exception as e:
+                self._error(500, str(e))
+            metrics.get_registry().maybe_flush()
+
+    return APIHandler
+
+def create_server(host: str = "127.0.0.1", port: int = DEFAULT_PORT, service: NLSQLService = None,
+                  workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                  request_timeout: float = DEFAULT_REQUEST_TIMEOUT) -> APIServer:
+    """Create (but don't start) the API server. Use port 0 to pick a free port.
+
+    Connections are accepted on their own threads, but translations and queries run
+    on the worker pool, which the server's pool attribute exposes.
+    """
+    service = service or NLSQLService()
+    pool = WorkerPool(workers, queue_size)
+    server = APIServer((host, port), make_handler(service, pool, request_timeout))
+    server.service = service
+    server.pool = pool
+    return server
+
+def close_server(server: APIServer) -> None:
+    server.server_close()
+    server.pool.shutdown()
+    server.service.close()
+    metrics.get_registry().flush()
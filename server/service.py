@@ -0,0 +1,249 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from ai.cache import normalize_question
+from ai.health import LAST_TIMINGS
+from ai.translator import generate_sql, clean_sql_response
+from db.connector import DBConnector, collect_rows
+from db.pool import PoolExhausted, close_pools
+from utils.config import CONFIG_FILE, PROFILES_DIR, get_active_profile, get_setting, load_profile
+
+DEFAULT_MAX_ROWS = 1000
+
+class ServiceError(Exception):
+    """A request the service can't handle, with the HTTP status to answer with."""
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+class SingleFlight:
+    """Run identical in-flight calls once and hand every caller the same result."""
+    def __init__(self):
+        self._calls: Dict = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn: Callable):
+        """Return (result, shared), where shared is True if another caller's call was joined."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
+
+class ProfileState:
+    """Everything loaded once per profile: schema and validator.
+
+    Connections come from the profile's pool in db.pool, checked out per request.
+    """
+    def __init__(self, name: str, profile: Dict):
+        self.name = name
+        self.profile = profile
+        self.schema = None
+        self.schema_id = None
+        self.validator = None
+        self.retry_invalid = False
+
+class NLSQLService:
+    """Translate and execute requests for the HTTP API.
+
+    Config is read once at startup. Profiles are loaded on first use and keep their
+    schema and connections until the service is closed.
+    """
+    def __init__(self, config: Optional[Dict] = None):
+        from cli import configure_ai_transport, configure_db_pools, load_provider_router, load_translation_cache, load_prompt_settings
+        from ai.providers import ProviderConfig
+        from ai.health import DEFAULT_HEALTH_TTL
+
+        if config is None:
+            config = {}
+            if CONFIG_FILE.exists():
+                with open(CONFIG_FILE, 'r') as f:
+                    config = json.load(f)
+        self.config = config
+        self.router = load_provider_router(config)
+        if self.router:
+            self.provider_config = self.router.primary
+        elif 'ai_provider' in config:
+            self.provider_config = ProviderConfig.from_dict(config['ai_provider'])
+        else:
+            self.provider_config = None
+        if not self.provider_config or not self.provider_config.is_configured:
+            raise ValueError("AI provider not configured. Run 'nlsql setup' or configure your AI provider.")
+        configure_ai_transport(config)
+        configure_db_pools(config)
+        self.cache = load_translation_cache(config)
+        self.prompt_settings = load_prompt_settings(config, self.provider_config)
+        self.health_ttl = get_setting(config, "health_ttl_seconds", DEFAULT_HEALTH_TTL)
+        self.single_flight = SingleFlight()
+        # Futures of loaded or loading profiles, so a slow schema load only blocks its own profile
+        self._profiles: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._examples_synced = False
+
+    @property
+    def example_index(self):
+        from utils.examples import get_example_index
+        index = get_example_index()
+        if not self._examples_synced:
+            index.sync()
+            self._examples_synced = True
+        return index
+
+    def get_profile(self, name: Optional[str] = None) -> ProfileState:
+        """The loaded state of a profile, defaulting to the active one."""
+        name = name or get_active_profile()
+        if not name:
+            raise ServiceError("No active profile. Create one with: nlsql profile create <name>")
+        with self._lock:
+            future = self._profiles.get(name)
+            loader = future is None
+            if loader:
+                future = self._profiles[name] = Future()
+        if not loader:
+            return future.result()
+        try:
+            profile_path = PROFILES_DIR / f"{name}.json"
+            if not profile_path.exists():
+                raise ServiceError(f"Profile '{name}' not found", 404)
+            state = ProfileState(name, load_profile(name))
+            self._load_schema(state)
+        except BaseException as e:
+            # Not kept, so the next request tries again
+            with self._lock:
+                if self._profiles.get(name) is future:
+                    del self._profiles[name]
+            future.set_exception(e)
+            raise
+        future.set_result(state)
+        return state
+
+    def _load_schema(self, state: ProfileState) -> None:
+        from cli import load_sql_validator
+        from db.schema import schema_fingerprint
+        connector = DBConnector.create_connector(state.profile)
+        try:
+            connector.connect()
+            state.schema = connector.get_schema()
+        except Exception:
+            # Same fallback as the query command
+            state.schema = {"tables": ["users", "orders", "products"]}
+        finally:
+            connector.close()
+        state.schema_id = schema_fingerprint(state.schema)
+        state.validator, state.retry_invalid = load_sql_validator(self.config, state.schema, state.profile)
+
+    def translate(self, question: str, profile: Optional[str] = None, no_cache: bool = False) -> Dict:
+        """Translate a question. Identical questions already being translated share one call."""
+        if not question or not question.strip():
+            raise ServiceError("Missing 'question'")
+        state = self.get_profile(profile)
+        key = (state.name, normalize_question(question), no_cache)
+        start = time.perf_counter()
+        result, shared = self.single_flight.do(key, lambda: self._translate(question, state, no_cache))
+        return dict(result, coalesced=shared, translate_ms=round((time.perf_counter() - start) * 1000, 2))
+
+    def _translate(self, question: str, state: ProfileState, no_cache: bool) -> Dict:
+        from ai.retrieval import prune_schema, DEFAULT_PRUNE_TOP_K, DEFAULT_PRUNE_MIN_TABLES
+        from utils.history import HistoryStore, DEFAULT_CONTEXT_ENTRIES
+        from utils.examples import DEFAULT_EXAMPLES
+
+        config = self.config
+        schema, _ = prune_schema(
+            question, state.schema,
+            top_k=get_setting(config, "schema_prune_top_k", DEFAULT_PRUNE_TOP_K),
+            min_tables=get_setting(config, "schema_prune_min_tables", DEFAULT_PRUNE_MIN_TABLES)
+        )
+        history = HistoryStore().relevant(
+            question, limit=get_setting(config, "history_context_entries", DEFAULT_CONTEXT_ENTRIES),
+            schema=state.schema_id
+        )
+        examples = self.example_index.similar(
+            question, limit=get_setting(config, "few_shot_examples", DEFAULT_EXAMPLES), schema=state.schema_id
+        )
+        try:
+            sql = generate_sql(question, schema, self.provider_config, history=history, health_ttl=self.health_ttl,
+                               cache=None if no_cache else self.cache, router=self.router,
+                               validator=state.validator, retry_invalid=state.retry_invalid, examples=examples,
+                               **self.prompt_settings)
+        except Exception as e:
+            raise ServiceError(f"Translation failed: {str(e)}", 502)
+        sql = clean_sql_response(sql)
+        # Cached SQL passed validation when it was stored
+        validation_error = LAST_TIMINGS.get("validation_error")
+        return {"question": question, "sql": sql, "validation_error": validation_error}
+
+    def execute(self, sql: str, profile: Optional[str] = None, max_rows: int = DEFAULT_MAX_ROWS,
+                timeout: Optional[float] = None) -> Dict:
+        """Run SQL on a pooled connection for the profile.
+
+        timeout (seconds) shortens the profile's statement timeout, so a statement
+        doesn't outlive the request that started it.
+        """
+        if not sql or not sql.strip():
+            raise ServiceError("Missing 'sql'")
+        state = self.get_profile(profile)
+        start = time.perf_counter()
+        connector = DBConnector.create_connector(state.profile)
+        if timeout:
+            connector.statement_timeout = min(connector.statement_timeout or timeout, timeout)
+        try:
+            connector.connect()
+            # The profile's max_rows caps what a request can ask for
+            max_rows = min(max_rows, connector.max_rows)
+            batches, columns = connector.execute_stream(sql, max_rows=max_rows + 1)
+            rows, truncated = collect_rows(batches, max_rows)
+        except PoolExhausted as e:
+            raise ServiceError(str(e), 503)
+        except Exception as e:
+            raise ServiceError(f"Error executing query: {str(e)}", 422)
+        finally:
+            connector.close()
+        return {
+            "columns": columns,
+            "rows": [list(row) for row in rows],
+            "row_count": len(rows),
+            "truncated": truncated,
+            "execute_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    def query(self, question: str, profile: Optional[str] = None, max_rows: int = DEFAULT_MAX_ROWS,
+              no_cache: bool = False, timeout: Optional[float] = None) -> Dict:
+        """Translate a question and run the SQL unless it failed validation."""
+        from utils.history import HistoryStore
+
+        start = time.perf_counter()
+        result = self.translate(question, profile, no_cache)
+        state = self.get_profile(profile)
+        executed = False
+        if not result["validation_error"]:
+            try:
+                # The statement gets whatever is left of the request's time
+                remaining = max(timeout - (time.perf_counter() - start), 0.001) if timeout else None
+                result.update(self.execute(result["sql"], state.name, max_rows, remaining))
+                executed = True
+            except ServiceError as e:
+                result["execute_error"] = str(e)
+        HistoryStore().add(question, result["sql"], executed=executed, schema=state.schema_id)
+        if executed:
+            self.example_index.add_executed(question, result["sql"], schema=state.schema_id)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            self._profiles = {}
+        close_pools()
+        from utils.examples import close_example_index
+        close_example_index()
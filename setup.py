@@ -15,11 +15,11 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "nlsql=cli:app"
+            "nlsql=nlsql_daemon:main"
         ]
     },
 
-    py_modules=["cli"],
+    py_modules=["cli", "nlsql_daemon"],
     python_requires=">=3.7",
     include_package_data=True,
     classifiers=[
@@ -113,6 +113,23 @@ def load_config(config_path=None):
     
     return config
 
+def get_setting(config, key, default):
+    """Read a flat config value, coercing it to the type of the default.
+
+    Values set through 'nlsql config set KEY=VALUE' are stored as strings.
+    """
+    value = config.get(key, default)
+    if value is None or isinstance(default, str) or default is None:
+        return value
+    try:
+        if isinstance(default, bool):
+            if isinstance(value, str):
+                return value.strip().lower() in ("1", "true", "yes", "on")
+            return bool(value)
+        return type(default)(value)
+    except (TypeError, ValueError):
+        return default
+
 def get_active_profile():
     """Get the name of the active profile"""
     active_profile_file = CONFIG_DIR / "active_profile.txt"
@@ -132,12 +149,18 @@ def load_profile(profile_name):
         typer.echo(f"Profile '{profile_name}' not found")
         raise typer.Exit(1)
     with open(profile_path, 'r') as f:
-        return json.load(f)
+        profile = json.load(f)
+    # Lets connectors key pools and label metrics by profile; always the file's name,
+    # so a copied or renamed profile doesn't carry over an old one
+    profile["name"] = profile_name
+    return profile
 
 def save_profile(profile_name, profile_data):
     """Save a profile"""
     PROFILES_DIR.mkdir(exist_ok=True)
     profile_path = PROFILES_DIR / f"{profile_name}.json"
+    # The name comes from the file name when loaded
+    profile_data = {key: value for key, value in profile_data.items() if key != "name"}
     with open(profile_path, 'w') as f:
         json.dump(profile_data, f, indent=2)
 
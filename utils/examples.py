@@ -0,0 +1,213 @@
+import datetime
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.config import CONFIG_DIR
+from utils.history import HISTORY_DB
+
+SAVED_QUERIES_DIR = CONFIG_DIR / "saved_queries"
+DEFAULT_EXAMPLES = 3
+
+# Words too common in questions to say anything about which example fits
+STOP_WORDS = {
+    "a", "about", "all", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from",
+    "get", "give", "has", "have", "how", "i", "in", "is", "it", "list", "me", "of", "on", "or", "show",
+    "that", "the", "their", "there", "this", "to", "was", "were", "what", "which", "who", "with"
+}
+
+class ExampleIndex:
+    """Full-text index of known-good (question, SQL) pairs used as few-shot examples.
+
+    Examples come from saved queries and from executed history entries. The index
+    is updated as queries are saved or executed, so a lookup is a single small FTS5
+    query on a connection kept open for the life of the index. Lives in the
+    history database; get_example_index() returns the one shared by the process.
+    """
+    def __init__(self, path: Path = HISTORY_DB, saved_dir: Path = SAVED_QUERIES_DIR):
+        self.path = Path(path)
+        self.saved_dir = Path(saved_dir)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fts = True
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            self._create_tables(conn)
+
+    @contextmanager
+    def _connect(self):
+        """The shared connection, one thread at a time, committing on success."""
+        with self._lock:
+            with self._conn:
+                yield self._conn
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS examples (
+            id INTEGER PRIMARY KEY,
+            key TEXT UNIQUE NOT NULL,
+            source TEXT NOT NULL,
+            question TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            schema TEXT,
+            mtime REAL,
+            updated_at TEXT NOT NULL
+        )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS examples_meta (key TEXT PRIMARY KEY, value TEXT)")
+        try:
+            conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS examples_fts USING fts5(
+                question, content='examples', content_rowid='id', tokenize='porter unicode61'
+            )
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS examples_ai AFTER INSERT ON examples BEGIN
+                INSERT INTO examples_fts(rowid, question) VALUES (new.id, new.question);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS examples_ad AFTER DELETE ON examples BEGIN
+                INSERT INTO examples_fts(examples_fts, rowid, question) VALUES ('delete', old.id, old.question);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS examples_au AFTER UPDATE ON examples BEGIN
+                INSERT INTO examples_fts(examples_fts, rowid, question) VALUES ('delete', old.id, old.question);
+                INSERT INTO examples_fts(rowid, question) VALUES (new.id, new.question);
+            END
+            """)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            self.fts = False
+
+    def _upsert(self, conn: sqlite3.Connection, key: str, source: str, question: str, sql: str,
+                schema: Optional[str] = None, mtime: Optional[float] = None) -> None:
+        conn.execute(
+            """
+            INSERT INTO examples (key, source, question, sql, schema, mtime, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET source = excluded.source, question = excluded.question, sql = excluded.sql,
+                schema = COALESCE(excluded.schema, examples.schema), mtime = excluded.mtime, updated_at = excluded.updated_at
+            """,
+            (key, source, question, sql, schema, mtime, datetime.datetime.now().isoformat())
+        )
+
+    def add_executed(self, question: str, sql: str, schema: Optional[str] = None) -> None:
+        """Index a question whose SQL ran successfully (the latest SQL per question wins)."""
+        with self._connect() as conn:
+            self._upsert(conn, self._history_key(question), "history", question, sql, schema)
+
+    def sync_history(self) -> None:
+        """Index executed history entries added since the last sync, including ones from before the index."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM examples_meta WHERE key = 'history_synced_id'").fetchone()
+            if row is None:
+                # First sync: rebuild, replacing entries keyed by an older scheme
+                conn.execute("DELETE FROM examples WHERE source = 'history'")
+            last_id = int(row["value"]) if row is not None else 0
+            try:
+                entries = conn.execute(
+                    "SELECT id, question, sql, schema FROM history WHERE executed = 1 AND id > ? ORDER BY id",
+                    (last_id,)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return  # No history yet
+            for entry in entries:
+                self._upsert(conn, self._history_key(entry["question"]), "history", entry["question"], entry["sql"],
+                             entry["schema"])
+                last_id = entry["id"]
+            conn.execute("INSERT OR REPLACE INTO examples_meta (key, value) VALUES ('history_synced_id', ?)", (str(last_id),))
+
+    def add_saved(self, name: str, sql: str, question: Optional[str] = None) -> None:
+        """Index a saved query. Without a question, the query name stands in for it."""
+        path = self.saved_dir / f"{name}.sql"
+        mtime = path.stat().st_mtime if path.exists() else None
+        with self._connect() as conn:
+            self._upsert(conn, f"saved:{name}", "saved", question or self._name_to_question(name), sql, mtime=mtime)
+
+    def remove_saved(self, name: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM examples WHERE key = ?", (f"saved:{name}",))
+
+    def sync(self) -> None:
+        """Pick up saved queries and executed history that were changed by other processes."""
+        self.sync_saved()
+        self.sync_history()
+
+    def sync_saved(self) -> None:
+        """Pick up saved query files added, edited or deleted outside nlsql."""
+        files = {p.stem: p for p in self.saved_dir.glob("*.sql")} if self.saved_dir.exists() else {}
+        with self._connect() as conn:
+            indexed = {row["key"][len("saved:"):]: row for row in
+                       conn.execute("SELECT key, question, mtime FROM examples WHERE source = 'saved'")}
+            for name, path in files.items():
+                mtime = path.stat().st_mtime
+                row = indexed.get(name)
+                if row is None or row["mtime"] != mtime:
+                    question = row["question"] if row is not None else self._name_to_question(name)
+                    self._upsert(conn, f"saved:{name}", "saved", question, path.read_text(), mtime=mtime)
+            for name in indexed.keys() - files.keys():
+                conn.execute("DELETE FROM examples WHERE key = ?", (f"saved:{name}",))
+
+    def similar(self, question: str, limit: int = DEFAULT_EXAMPLES, schema: Optional[str] = None) -> List[Dict]:
+        """The examples whose questions are closest to this one, best first.
+
+        Only examples from the same schema are used, plus saved queries, which aren't tied to one.
+        """
+        terms = set(re.findall(r"\w+", question.lower())) - STOP_WORDS
+        if limit <= 0 or not terms:
+            return []
+        with self._connect() as conn:
+            if self.fts:
+                match = " OR ".join(f'"{term}"' for term in terms)
+                rows = conn.execute(
+                    """
+                    SELECT e.* FROM examples_fts JOIN examples e ON e.id = examples_fts.rowid
+                    WHERE examples_fts MATCH ? AND (? IS NULL OR e.schema IS NULL OR e.schema = ?)
+                    ORDER BY bm25(examples_fts) LIMIT ?
+                    """,
+                    (match, schema, schema, limit)
+                ).fetchall()
+            else:
+                clauses = " OR ".join("question LIKE ?" for _ in terms)
+                rows = conn.execute(
+                    f"SELECT * FROM examples WHERE ({clauses}) AND (? IS NULL OR schema IS NULL OR schema = ?) "
+                    "ORDER BY id DESC LIMIT ?",
+                    [f"%{term}%" for term in terms] + [schema, schema, limit]
+                ).fetchall()
+        return [{"question": row["question"], "sql": row["sql"], "source": row["source"]} for row in rows]
+
+    @staticmethod
+    def _history_key(question: str) -> str:
+        # The exact question: "x > 5" and "x < 5" need different SQL
+        return f"history:{question.strip()}"
+
+    @staticmethod
+    def _name_to_question(name: str) -> str:
+        return re.sub(r"[_\-]+", " ", name).strip()
+
+_index: Optional[ExampleIndex] = None
+_index_lock = threading.Lock()
+
+def get_example_index() -> ExampleIndex:
+    """The example index shared by the process, so a long-lived daemon keeps one connection."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ExampleIndex()
+        return _index
+
+def close_example_index() -> None:
+    """Close the shared example index."""
+    global _index
+    with _index_lock:
+        index, _index = _index, None
+    if index is not None:
+        index.close()
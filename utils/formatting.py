@@ -3,6 +3,7 @@ import sys
 import json
 import typer
 from pathlib import Path
+from utils.tracing import span
 
 def highlight_sql(sql):
     # Simple syntax highlighting for SQL (can be improved with pygments)
@@ -23,11 +24,34 @@ def highlight_sql(sql):
         return sql
 
 def print_sql(sql):
-    typer.echo(highlight_sql(sql))
+    with span("sql.render"):
+        typer.echo(highlight_sql(sql))
 
 def print_result(result, columns, output_format='table', limit=100, file=None):
     """Print query results in various formats"""
-    df = pd.DataFrame(result, columns=columns)
+    with span("result.dataframe", rows=len(result)):
+        df = pd.DataFrame(result, columns=columns)
+    with span("result.render", format=output_format if not file else "file"):
+        _print_dataframe(df, output_format, limit, file)
+
+def print_stream(batches, columns, output_format='table', limit=100, file=None):
+    """Print streamed query results, reading only as many batches as will be shown"""
+    rows = []
+    truncated = False
+    try:
+        for batch in batches:
+            rows.extend(batch)
+            if 0 < limit < len(rows):
+                truncated = True
+                break
+    finally:
+        batches.close()
+    if truncated:
+        # One row past the limit keeps the "Showing first" notice
+        rows = rows[:limit + 1]
+    print_result(rows, columns, output_format=output_format, limit=limit, file=file)
+
+def _print_dataframe(df, output_format, limit, file):
     
     if len(df) > limit and limit > 0:
         df = df.head(limit)
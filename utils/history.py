@@ -0,0 +1,153 @@
+import datetime
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.config import CONFIG_DIR
+
+HISTORY_DB = CONFIG_DIR / "history.db"
+LEGACY_HISTORY_FILE = CONFIG_DIR / "history.json"
+DEFAULT_CONTEXT_ENTRIES = 5
+SAME_SCHEMA_BOOST = 2.0  # relevance multiplier for entries asked against the current schema
+
+class HistoryStore:
+    """Query history in SQLite with a full-text index over questions and SQL.
+
+    Only the entries a caller asks for are loaded, so memory stays flat however
+    long the history grows. Falls back to LIKE matching where SQLite lacks FTS5.
+    """
+    def __init__(self, path: Path = HISTORY_DB, legacy_file: Optional[Path] = LEGACY_HISTORY_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fts = True
+        with self._connect() as conn:
+            self._create_tables(conn)
+            if legacy_file is not None:
+                self._import_legacy(conn, Path(legacy_file))
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        conn = sqlite3.connect(str(self.path))
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            question TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            executed INTEGER NOT NULL DEFAULT 0,
+            schema TEXT
+        )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS history_meta (key TEXT PRIMARY KEY, value TEXT)")
+        try:
+            conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                question, sql, content='history', content_rowid='id', tokenize='porter unicode61'
+            )
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+                INSERT INTO history_fts(rowid, question, sql) VALUES (new.id, new.question, new.sql);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+                INSERT INTO history_fts(history_fts, rowid, question, sql) VALUES ('delete', old.id, old.question, old.sql);
+            END
+            """)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            self.fts = False
+
+    def _import_legacy(self, conn: sqlite3.Connection, legacy_file: Path) -> None:
+        """One-time import of the old history.json (the file itself is left in place)."""
+        if conn.execute("SELECT value FROM history_meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        entries = []
+        if legacy_file.exists():
+            try:
+                with open(legacy_file, 'r') as f:
+                    entries = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                entries = []
+        conn.executemany(
+            "INSERT INTO history (timestamp, question, sql, executed) VALUES (?, ?, ?, ?)",
+            [(e.get("timestamp", ""), e.get("question", ""), e.get("sql", ""), int(bool(e.get("executed"))))
+             for e in entries if isinstance(e, dict) and e.get("question") and e.get("sql")]
+        )
+        conn.execute("INSERT INTO history_meta (key, value) VALUES ('legacy_imported', ?)",
+                     (datetime.datetime.now().isoformat(),))
+
+    def add(self, question: str, sql: str, executed: bool = False, schema: Optional[str] = None) -> None:
+        """Append an entry. schema is the fingerprint of the schema the question was asked against."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO history (timestamp, question, sql, executed, schema) VALUES (?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(), question, sql, int(executed), schema)
+            )
+
+    def recent(self, limit: int = 10) -> List[Dict]:
+        """The most recent entries, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def relevant(self, question: str, limit: int = DEFAULT_CONTEXT_ENTRIES, schema: Optional[str] = None) -> List[Dict]:
+        """The entries most relevant to a question, oldest first.
+
+        Entries are ranked by BM25 over past questions and SQL, preferring those asked
+        against the same schema. Remaining slots are filled with the most recent entries.
+        """
+        if limit <= 0:
+            return []
+        terms = set(re.findall(r"\w+", question.lower()))
+        rows = []
+        with self._connect() as conn:
+            if terms and self.fts:
+                match = " OR ".join(f'"{term}"' for term in terms)
+                rows = conn.execute(
+                    """
+                    SELECT h.* FROM history_fts JOIN history h ON h.id = history_fts.rowid
+                    WHERE history_fts MATCH ?
+                    ORDER BY bm25(history_fts) * (CASE WHEN h.schema = ? THEN ? ELSE 1.0 END)
+                    LIMIT ?
+                    """,
+                    (match, schema, SAME_SCHEMA_BOOST, limit)
+                ).fetchall()
+            elif terms:
+                clauses = " OR ".join("h.question LIKE ?" for _ in terms)
+                rows = conn.execute(
+                    f"SELECT h.* FROM history h WHERE {clauses} ORDER BY (h.schema = ?) DESC, h.id DESC LIMIT ?",
+                    [f"%{term}%" for term in terms] + [schema, limit]
+                ).fetchall()
+
+            if len(rows) < limit:
+                seen = [row["id"] for row in rows]
+                exclude = f"WHERE id NOT IN ({','.join('?' for _ in seen)})" if seen else ""
+                rows += conn.execute(
+                    f"SELECT * FROM history {exclude} ORDER BY id DESC LIMIT ?",
+                    seen + [limit - len(rows)]
+                ).fetchall()
+
+        return [self._entry(row) for row in sorted(rows, key=lambda row: row["id"])]
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> Dict:
+        return {
+            "timestamp": row["timestamp"],
+            "question": row["question"],
+            "sql": row["sql"],
+            "executed": bool(row["executed"])
+        }
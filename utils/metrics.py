@@ -0,0 +1,270 @@
+import atexit
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Totals from all nlsql processes, merged in when each one flushes
+METRICS_FILE = Path.home() / ".nlsql" / "metrics.json"
+FLUSH_INTERVAL = 10.0  # seconds between flushes from long-running processes
+
+# Latency buckets in seconds: 0.5 ms to ~4 min, each about 1.41x the last
+LATENCY_BUCKETS = tuple(round(0.0005 * 2 ** (i / 2), 6) for i in range(38))
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+POOL_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def series_key(name: str, labels: Dict[str, str]) -> str:
+    """OpenMetrics style series name, e.g. nlsql_db_rows{profile="test_db"}."""
+    if not labels:
+        return name
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+def split_series_key(key: str) -> Tuple[str, str]:
+    """(metric name, label string without braces)."""
+    name, _, labels = key.partition("{")
+    return name, labels.rstrip("}")
+
+def histogram_percentile(histogram: Dict, p: float) -> float:
+    """Estimate a percentile from bucket counts, interpolating linearly within the bucket."""
+    count = histogram["count"]
+    if not count:
+        return 0.0
+    bounds = histogram["buckets"]
+    rank = p / 100 * count
+    cumulative = 0
+    for i, bucket_count in enumerate(histogram["counts"]):
+        if bucket_count and cumulative + bucket_count >= rank:
+            lower = bounds[i - 1] if i > 0 else 0.0
+            upper = bounds[i] if i < len(bounds) else bounds[-1]
+            return lower + (upper - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+    return bounds[-1]
+
+class MetricsRegistry:
+    """Counters and histograms for one process.
+
+    Recording is a dict lookup and a few additions under a lock, cheap enough to
+    leave on. Values accumulate in memory and are added to the metrics file on
+    flush (at exit for CLI commands), so `nlsql stats` sees every process.
+    """
+    def __init__(self, path: Path = METRICS_FILE, enabled: bool = True):
+        self.path = Path(path)
+        self.enabled = enabled
+        self._counters: Dict[str, float] = {}
+        self._histograms: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._atexit = False
+
+    def _touched(self) -> None:
+        if not self._atexit:
+            self._atexit = True
+            atexit.register(self.flush)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._touched()
+
+    def observe(self, name: str, value: float, buckets: Tuple = LATENCY_BUCKETS, **labels) -> None:
+        if not self.enabled:
+            return
+        key = series_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": list(buckets), "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0
+                }
+            histogram["counts"][bisect.bisect_left(histogram["buckets"], value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+            self._touched()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _load(self) -> Dict:
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                data.setdefault("counters", {})
+                data.setdefault("histograms", {})
+                return data
+            except (json.JSONDecodeError, IOError):
+                pass  # Corrupted metrics start over
+        return {"counters": {}, "histograms": {}}
+
+    @staticmethod
+    def _merge(data: Dict, counters: Dict, histograms: Dict) -> Dict:
+        for key, value in counters.items():
+            data["counters"][key] = data["counters"].get(key, 0) + value
+        for key, histogram in histograms.items():
+            stored = data["histograms"].get(key)
+            if stored is None or stored["buckets"] != histogram["buckets"]:
+                data["histograms"][key] = json.loads(json.dumps(histogram))
+                continue
+            stored["counts"] = [a + b for a, b in zip(stored["counts"], histogram["counts"])]
+            stored["sum"] += histogram["sum"]
+            stored["count"] += histogram["count"]
+        return data
+
+    def _take(self) -> Tuple[Dict, Dict]:
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+            self._last_flush = time.monotonic()
+        return counters, histograms
+
+    def flush(self) -> None:
+        """Add this process's values to the metrics file."""
+        counters, histograms = self._take()
+        if not counters and not histograms:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # The daemon, server and CLI may all flush at once; without the lock one
+            # process's read-modify-write would drop another's update
+            with self._file_lock():
+                data = self._merge(self._load(), counters, histograms)
+                tmp_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+        except IOError:
+            pass  # Metrics are best-effort
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold an exclusive lock on the metrics file's lock file (a no-op without fcntl)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_suffix(".lock"), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def maybe_flush(self, interval: float = FLUSH_INTERVAL) -> None:
+        """Flush if the last flush was more than interval seconds ago (for long-running processes)."""
+        if self.enabled and time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def snapshot(self) -> Dict:
+        """Totals from the metrics file plus values not flushed yet."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = json.loads(json.dumps(self._histograms))
+        return self._merge(self._load(), counters, histograms)
+
+    def reset(self) -> None:
+        self._take()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+def render_openmetrics(snapshot: Dict) -> str:
+    """Render a snapshot in the OpenMetrics text format."""
+    lines: List[str] = []
+    by_name: Dict[str, List[str]] = {}
+    for key in snapshot["counters"]:
+        by_name.setdefault(split_series_key(key)[0], []).append(key)
+    for name in sorted(by_name):
+        lines.append(f"# TYPE {name} counter")
+        for key in sorted(by_name[name]):
+            _, labels = split_series_key(key)
+            lines.append(f"{name}_total{{{labels}}} {snapshot['counters'][key]:g}" if labels
+                         else f"{name}_total {snapshot['counters'][key]:g}")
+    by_name = {}
+    for key in snapshot["histograms"]:
+        by_name.setdefault(split_series_key(key)[0], []).append(key)
+    for name in sorted(by_name):
+        lines.append(f"# TYPE {name} histogram")
+        for key in sorted(by_name[name]):
+            histogram = snapshot["histograms"][key]
+            _, labels = split_series_key(key)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram["count"]}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_count{suffix} {histogram['count']}")
+            lines.append(f"{name}_sum{suffix} {histogram['sum']:g}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+def summarize(snapshot: Dict) -> Dict[str, List[Dict]]:
+    """Rows for `nlsql stats`: histogram percentiles, counters and cache hit rates."""
+    histograms = []
+    for key, histogram in sorted(snapshot["histograms"].items()):
+        name, labels = split_series_key(key)
+        histograms.append({
+            "metric": name, "labels": labels, "count": histogram["count"],
+            "mean": histogram["sum"] / histogram["count"] if histogram["count"] else 0.0,
+            **{f"p{p}": histogram_percentile(histogram, p) for p in (50, 95, 99)}
+        })
+    counters = [{"metric": split_series_key(key)[0], "labels": split_series_key(key)[1], "value": value}
+                for key, value in sorted(snapshot["counters"].items())]
+    caches: Dict[str, Dict[str, float]] = {}
+    for key, value in snapshot["counters"].items():
+        name, labels = split_series_key(key)
+        if name != "nlsql_cache_requests":
+            continue
+        parts = dict(part.split("=", 1) for part in labels.split(",") if "=" in part)
+        cache = caches.setdefault(parts.get("cache", "").strip('"'), {"hit": 0, "miss": 0})
+        cache[parts.get("result", "").strip('"')] = cache.get(parts.get("result", "").strip('"'), 0) + value
+    cache_rows = [{"cache": cache, "hits": c["hit"], "misses": c["miss"],
+                   "hit_rate": c["hit"] / (c["hit"] + c["miss"]) if c["hit"] + c["miss"] else math.nan}
+                  for cache, c in sorted(caches.items())]
+    return {"histograms": histograms, "counters": counters, "caches": cache_rows}
+
+# Process-wide registry. NLSQL_METRICS=0 turns it off regardless of the config.
+_ENV_ENABLED = os.environ.get("NLSQL_METRICS", "1").lower() not in ("0", "false", "no", "off")
+_registry = MetricsRegistry(enabled=_ENV_ENABLED)
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+def configure_metrics(enabled: bool = True, path: Optional[Path] = None) -> None:
+    """Turn recording on or off, and optionally move the metrics file."""
+    _registry.enabled = enabled and _ENV_ENABLED
+    if path is not None:
+        _registry.path = Path(path)
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    _registry.inc(name, amount, **labels)
+
+def observe(name: str, value: float, buckets: Tuple = LATENCY_BUCKETS, **labels) -> None:
+    _registry.observe(name, value, buckets, **labels)
+
+def timer(name: str, **labels):
+    return _registry.timer(name, **labels)
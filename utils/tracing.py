@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+class _NoSpan:
+    """Shared do-nothing span returned while tracing is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+NO_SPAN = _NoSpan()
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start", "depth")
+
+    def __init__(self, tracer: "Tracer", name: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.depth = self.tracer._enter()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        end = time.perf_counter()
+        self.tracer._exit(self, end)
+        return False
+
+class Tracer:
+    """Collects timed spans for one command, for a phase breakdown or a Chrome trace."""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: List[Dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _enter(self) -> int:
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        return depth
+
+    def _exit(self, span: Span, end: float) -> None:
+        self._local.depth = span.depth
+        record = {
+            "name": span.name,
+            "start": span.start - self.origin,
+            "duration": end - span.start,
+            "depth": span.depth,
+            "thread": threading.get_ident(),
+            "args": span.args
+        }
+        with self._lock:
+            self.spans.append(record)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def breakdown(self) -> List[Dict]:
+        """Spans in start order, with time not covered by child spans as self time."""
+        spans = sorted(self.spans, key=lambda s: (s["start"], s["depth"]))
+        rows = []
+        for i, span in enumerate(spans):
+            end = span["start"] + span["duration"]
+            children = sum(s["duration"] for s in spans[i + 1:]
+                           if s["depth"] == span["depth"] + 1 and s["thread"] == span["thread"]
+                           and s["start"] >= span["start"] and s["start"] + s["duration"] <= end)
+            rows.append(dict(span, self_time=max(span["duration"] - children, 0.0)))
+        return rows
+
+    def chrome_trace(self) -> Dict:
+        """Trace Event Format, viewable in chrome://tracing or ui.perfetto.dev."""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "nlsql"}}]
+        for span in self.spans:
+            events.append({
+                "name": span["name"],
+                "cat": span["name"].split(".")[0],
+                "ph": "X",
+                "ts": round(span["start"] * 1e6, 3),
+                "dur": round(span["duration"] * 1e6, 3),
+                "pid": pid,
+                "tid": span["thread"],
+                "args": {k: v if isinstance(v, (int, float, bool)) or v is None else str(v)
+                         for k, v in span["args"].items()}
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+# The active tracer, if any. Spans check this one global and nothing else while tracing is off.
+_tracer: Optional[Tracer] = None
+
+def span(name: str, **args):
+    """Time a block as a named phase. Costs a global lookup when tracing is off."""
+    if _tracer is None:
+        return NO_SPAN
+    return Span(_tracer, name, args)
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+def stop_tracing() -> Optional[Tracer]:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+def format_breakdown(tracer: Tracer) -> str:
+    """Phase table: nested phases are indented, % is of the whole command."""
+    total = tracer.elapsed()
+    lines = [f"{'Phase':<40} {'total ms':>10} {'self ms':>10} {'%':>6}"]
+    for row in tracer.breakdown():
+        name = "  " * row["depth"] + row["name"]
+        share = row["duration"] / total * 100 if total else 0.0
+        lines.append(f"{name:<40} {row['duration'] * 1000:>10.2f} {row['self_time'] * 1000:>10.2f} {share:>5.1f}%")
+    lines.append(f"{'total':<40} {total * 1000:>10.2f}")
+    return "\n".join(lines)